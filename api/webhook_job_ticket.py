@@ -34,6 +34,17 @@ def _send_json(handler, status: int, data: dict):
     handler.wfile.write(body)
 
 
+def _send_metrics(handler):
+    """This instance's stage timings and counters (Prometheus text format)."""
+    from app import _metrics
+    body = _metrics.render().encode("utf-8")
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         if "?" in self.path:
@@ -46,6 +57,9 @@ class handler(BaseHTTPRequestHandler):
                 self.end_headers()
                 self.wfile.write(challenge.encode("utf-8"))
                 return
+            if qs.get("metrics"):
+                _send_metrics(self)
+                return
         _send_json(self, 200, {
             "status": "ok",
             "message": "Prelim label webhook ready. POST with boardId and pulseId.",
@@ -66,28 +80,38 @@ class handler(BaseHTTPRequestHandler):
 
         from app import (
             JOB_TICKET_COLUMN_ID,
+            TRACE_HEADER,
+            _maybe_profiled,
             _process_job_ticket,
+            _profile_secret,
+            _span,
         )
 
-        try:
-            event = body.get("event", body)
-            item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
-            column_id = event.get("columnId") or event.get("column_id")
-
-            if not item_id:
-                _send_json(self, 200, {"status": "ignored", "reason": "no item_id"})
-                return
-
-            if column_id and column_id != JOB_TICKET_COLUMN_ID:
-                _send_json(self, 200, {"status": "ignored", "reason": "wrong column"})
-                return
-
-            _process_job_ticket(int(item_id))
-            _send_json(self, 200, {"status": "ok"})
-
-        except Exception as exc:
-            import logging, traceback
-            logging.getLogger(__name__).error(
-                f"[webhook_job_ticket] item={item_id} error: {exc}\n{traceback.format_exc()}"
-            )
-            _send_json(self, 200, {"status": "error", "message": str(exc)})
+        # cProfile this run when it carries PROFILE_SECRET (X-Profile header or ?profile=)
+        from urllib.parse import parse_qs, urlparse
+        profile_secret = _profile_secret(self.headers, parse_qs(urlparse(self.path).query))
+
+        # Root span of this run's trace (continues the caller's trace, e.g. a deferred follow-up)
+        with _span("webhook.job_ticket", trace_id=self.headers.get(TRACE_HEADER)):
+            try:
+                event = body.get("event", body)
+                item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
+                column_id = event.get("columnId") or event.get("column_id")
+
+                if not item_id:
+                    _send_json(self, 200, {"status": "ignored", "reason": "no item_id"})
+                    return
+
+                if column_id and column_id != JOB_TICKET_COLUMN_ID:
+                    _send_json(self, 200, {"status": "ignored", "reason": "wrong column"})
+                    return
+
+                _maybe_profiled("job_ticket", profile_secret, _process_job_ticket, int(item_id))
+                _send_json(self, 200, {"status": "ok"})
+
+            except Exception as exc:
+                import logging, traceback
+                logging.getLogger(__name__).error(
+                    f"[webhook_job_ticket] item={item_id} error: {exc}\n{traceback.format_exc()}"
+                )
+                _send_json(self, 200, {"status": "error", "message": str(exc)})
@@ -6,6 +6,9 @@ Triggered when the Proof Status column (status3__1) changes to "Proof Approved".
 Finds the ProForma invoice on the Pricing board via PI#, extracts pouch specs
 using Claude, fills the Pouch JT PDF template, and uploads it to the Job Ticket
 column. Non-pouch invoices are silently skipped.
+
+With ?prefetch=1 (a second Monday webhook on Proof Status / PI# changes), only
+extracts and caches the invoice specs so the later approval run skips Claude.
 """
 import json
 import sys
@@ -18,6 +21,15 @@ if str(_root) not in sys.path:
 
 from http.server import BaseHTTPRequestHandler
 
+# Parse the Job Ticket templates on cold start so the first fill clones a
+# cached copy instead of reading 1–2 MB PDFs inside the request budget.
+try:
+    from app import warm_jt_templates
+    warm_jt_templates()
+except Exception as _exc:
+    import logging
+    logging.getLogger(__name__).warning(f"[webhook_proof_approved] template warm-up failed: {_exc}")
+
 
 def _read_body(handler):
     content_length = int(handler.headers.get("Content-Length") or 0)
@@ -35,6 +47,17 @@ def _send_json(handler, status: int, data: dict):
     handler.wfile.write(body)
 
 
+def _send_metrics(handler):
+    """This instance's stage timings and counters (Prometheus text format)."""
+    from app import _metrics
+    body = _metrics.render().encode("utf-8")
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         if "?" in self.path:
@@ -47,6 +70,9 @@ class handler(BaseHTTPRequestHandler):
                 self.end_headers()
                 self.wfile.write(challenge.encode("utf-8"))
                 return
+            if qs.get("metrics"):
+                _send_metrics(self)
+                return
         _send_json(self, 200, {
             "status": "ok",
             "message": "Proof Approved webhook ready. POST with event data.",
@@ -65,38 +91,91 @@ class handler(BaseHTTPRequestHandler):
             _send_json(self, 200, {"challenge": body["challenge"]})
             return
 
+        import time
+        from urllib.parse import parse_qs, urlparse
+
         from app import (
+            ITEM_PI_COLUMN_ID,
+            PROOF_APPROVED_BUDGET_S,
             PROOF_STATUS_COLUMN_ID,
+            TRACE_HEADER,
+            _followup_authorized,
+            _is_proof_approved_event,
+            _maybe_profiled,
+            _prefetch_invoice_specs,
             _process_proof_approved,
+            _profile_secret,
             _post_monday_error_update,
+            _report_proof_approved_error,
+            _span,
         )
 
-        try:
-            event = body.get("event", body)
-            item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
-            column_id = event.get("columnId") or event.get("column_id")
+        # cProfile this run when it carries PROFILE_SECRET (X-Profile header or ?profile=)
+        profile_secret = _profile_secret(self.headers, parse_qs(urlparse(self.path).query))
 
-            if not item_id:
-                _send_json(self, 200, {"status": "ignored", "reason": "no item_id"})
-                return
-
-            if column_id and column_id != PROOF_STATUS_COLUMN_ID:
-                _send_json(self, 200, {"status": "ignored", "reason": "wrong column"})
-                return
+        # Root span of this run's trace (continues the caller's trace, e.g. a deferred follow-up)
+        with _span("webhook.proof_approved", trace_id=self.headers.get(TRACE_HEADER)):
+            # Budget for this request, from before any Monday/Claude call
+            deadline = time.monotonic() + PROOF_APPROVED_BUDGET_S
+            qs = parse_qs(urlparse(self.path).query)
 
-            _process_proof_approved(int(item_id))
-            _send_json(self, 200, {"status": "ok"})
-
-        except Exception as exc:
-            import logging, traceback
-            tb = traceback.format_exc()
-            logging.getLogger(__name__).error(
-                f"[webhook_proof_approved] item={item_id} error: {exc}\n{tb}"
-            )
-            # Post the error directly to the Monday item so it's visible without Vercel logs
-            if item_id:
-                try:
-                    _post_monday_error_update(int(item_id), f"{exc}\n\n{tb}")
-                except Exception:
-                    pass
-            _send_json(self, 200, {"status": "error", "message": str(exc)})
+            item_id = None
+            try:
+                # Error update handed off by a run that was out of time
+                if qs.get("followup") == ["error-update"]:
+                    if not _followup_authorized(self.headers.get("X-Followup-Secret")):
+                        _send_json(self, 403, {"status": "forbidden"})
+                        return
+                    _post_monday_error_update(int(body["item_id"]), body.get("message", ""))
+                    _send_json(self, 200, {"status": "ok"})
+                    return
+
+                event = body.get("event", body)
+                item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
+                column_id = event.get("columnId") or event.get("column_id")
+
+                if not item_id:
+                    _send_json(self, 200, {"status": "ignored", "reason": "no item_id"})
+                    return
+
+                if qs.get("prefetch"):
+                    # Earlier proof status / PI# changes: extract the invoice specs ahead of approval.
+                    # Failures are only logged — the approval run extracts them itself.
+                    if column_id and column_id not in (PROOF_STATUS_COLUMN_ID, ITEM_PI_COLUMN_ID):
+                        _send_json(self, 200, {"status": "ignored", "reason": "wrong column"})
+                    elif _is_proof_approved_event(event):
+                        _send_json(self, 200, {"status": "ignored", "reason": "approved"})
+                    else:
+                        try:
+                            result = _prefetch_invoice_specs(int(item_id))
+                        except Exception as exc:
+                            import logging
+                            logging.getLogger(__name__).warning(
+                                f"[webhook_proof_approved] prefetch item={item_id} failed: {exc}"
+                            )
+                            _send_json(self, 200, {"status": "error", "message": str(exc)})
+                            return
+                        _send_json(self, 200, {"status": "ok", "prefetch": result})
+                    return
+
+                if column_id and column_id != PROOF_STATUS_COLUMN_ID:
+                    _send_json(self, 200, {"status": "ignored", "reason": "wrong column"})
+                    return
+
+                _maybe_profiled("proof_approved", profile_secret, _process_proof_approved, int(item_id), deadline)
+                _send_json(self, 200, {"status": "ok"})
+
+            except Exception as exc:
+                import logging, traceback
+                tb = traceback.format_exc()
+                logging.getLogger(__name__).error(
+                    f"[webhook_proof_approved] item={item_id} error: {exc}\n{tb}"
+                )
+                # Post the error directly to the Monday item so it's visible without Vercel logs
+                # (from a follow-up request if this one is nearly out of time)
+                if item_id:
+                    try:
+                        _report_proof_approved_error(int(item_id), f"{exc}\n\n{tb}", deadline)
+                    except Exception:
+                        pass
+                _send_json(self, 200, {"status": "error", "message": str(exc)})
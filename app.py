@@ -1,8 +1,21 @@
 import os
 import re
 import json
+import time
+import hmac
+import hashlib
 import logging
+import io
 import tempfile
+import threading
+import contextlib
+import contextvars
+import functools
+import urllib.parse
+import itertools
+import collections
+import dataclasses
+from dataclasses import dataclass
 from pathlib import Path
 
 import pdfplumber
@@ -18,6 +31,394 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger(__name__)
 
+
+# ---------------------------------------------------------------------------
+# Metrics — per-stage timings and counters in Prometheus text format
+# ---------------------------------------------------------------------------
+# Kept in-process and served by /metrics (and GET ?metrics=1 on the Vercel
+# webhook functions). Each process or serverless instance reports its own
+# numbers since it started; Prometheus sums them across instances.
+
+METRICS_PREFIX = "label_export"
+_METRICS_BUCKETS_S = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name → (type, help)
+_METRICS = {
+    "pipeline_seconds": ("histogram", "Duration of one webhook pipeline run, by outcome"),
+    "stage_seconds": ("histogram", "Duration of one pipeline stage (Monday query, download, parse, Claude, fill, render, upload)"),
+    "claude_call_seconds": ("histogram", "Duration of one Claude API call"),
+    "bytes_total": ("counter", "Bytes downloaded from and uploaded to Monday.com"),
+    "labels_total": ("counter", "Labels rendered"),
+    "jt_pages_total": ("counter", "Job Ticket pages written"),
+    "claude_tokens_total": ("counter", "Claude tokens used"),
+}
+
+
+class _Metrics:
+    """Thread-safe counters and histograms keyed by metric name and label set."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values: dict = {}    # name → {labels: float | [bucket counts…, sum, count]}
+
+    def inc(self, name: str, value=1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    def render(self) -> str:
+        """All series in Prometheus text exposition format (version 0.0.4)."""
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            snapshot = {name: {k: (list(v) if isinstance(v, list) else v) for k, v in series.items()}
+                        for name, series in self._values.items()}
+        lines = []
+        for name, (kind, help_text) in _METRICS.items():
+            full = f"{METRICS_PREFIX}_{name}"
+            lines += [f"# HELP {full} {help_text}", f"# TYPE {full} {kind}"]
+            for labels, value in sorted(snapshot.get(name, {}).items()):
+                if kind == "counter":
+                    lines.append(f"{full}{fmt(labels)} {value:g}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{fmt(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{full}_bucket{fmt(labels, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{full}_sum{fmt(labels)} {value[-2]:.6f}")
+                lines.append(f"{full}_count{fmt(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = _Metrics(_METRICS_BUCKETS_S)
+
+
+class _StageTimer:
+    """
+    Times a with-block into stage_seconds; `excluded` seconds (e.g. nested
+    uploads) are left out. Also opens a trace span named after the stage unless
+    `trace` is False.
+    """
+
+    def __init__(self, pipeline: str, stage: str, trace: bool = True):
+        self.pipeline, self.stage = pipeline, stage
+        self.excluded = 0.0
+        self.seconds = 0.0
+        self._span = _span(stage, pipeline=pipeline) if trace else None
+
+    def __enter__(self):
+        if self._span is not None:
+            self._span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start - self.excluded
+        _metrics.observe("stage_seconds", self.seconds, pipeline=self.pipeline, stage=self.stage)
+        if self._span is not None:
+            self._span.__exit__(*exc)
+        return False
+
+
+def _stage(pipeline: str, stage: str) -> _StageTimer:
+    return _StageTimer(pipeline, stage)
+
+
+def _timed_iter(gen, pipeline: str, stage: str):
+    """
+    Yield from generator `gen`, timing only the waits for its items as one stage.
+    No span: it would stay current in the consumer between items.
+    """
+    with _StageTimer(pipeline, stage, trace=False) as timer:
+        try:
+            for item in gen:
+                t0 = time.perf_counter()
+                yield item
+                timer.excluded += time.perf_counter() - t0
+        finally:
+            gen.close()
+
+
+def _timed_pipeline(pipeline: str):
+    """Decorator: record each call's duration in pipeline_seconds{pipeline, outcome}."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            outcome = "error"
+            try:
+                with _span(f"pipeline.{pipeline}", item_id=args[0] if args else None):
+                    result = fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                _metrics.observe("pipeline_seconds", time.perf_counter() - t0,
+                                 pipeline=pipeline, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Tracing — nested spans exported as JSON lines
+# ---------------------------------------------------------------------------
+# Each webhook run is one trace: the handler opens the root span (continuing
+# the caller's X-Trace-Id, e.g. a deferred follow-up), and pipelines, stages,
+# Monday requests, downloads, uploads and Claude calls nest under it. The
+# current span lives in a contextvar; work handed to a thread pool carries it
+# via _in_current_context. Finished spans are appended to TRACE_FILE as one
+# JSON object per line ("-" logs them as "[trace] {…}" lines instead, e.g. on
+# Vercel); trace_report.py turns them into a tree or flame-graph stacks.
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "").strip()    # "" disables tracing
+TRACE_HEADER = "X-Trace-Id"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_trace_write_lock = threading.Lock()
+_TRACE_ID_RE = re.compile(r"^[0-9a-f]{8,32}$")
+
+
+class _Span:
+    """One timed operation; set() adds attributes (bytes, token counts, …)."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs", "_start", "_t0", "_token")
+
+    def __init__(self, name: str, trace_id: str | None = None, **attrs):
+        self.name = name
+        self.attrs = {k: v for k, v in attrs.items() if v is not None}
+        self.trace_id, self.parent_id = trace_id, None
+        self._token = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if not TRACE_FILE:
+            return self
+        parent = _current_span.get()
+        if self.trace_id is None and parent is not None:
+            self.trace_id, self.parent_id = parent.trace_id, parent.span_id
+        elif self.trace_id is None or not _TRACE_ID_RE.match(self.trace_id):
+            self.trace_id = os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self._token = _current_span.set(self)
+        self._start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is None:
+            return False
+        duration = time.perf_counter() - self._t0
+        _current_span.reset(self._token)
+        record = {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start": round(self._start, 6), "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name, "status": "error" if exc_type else "ok",
+            "attrs": self.attrs,
+        }
+        if exc_type:
+            record["error"] = f"{exc_type.__name__}: {exc}"[:300]
+        _export_span(json.dumps(record, default=str))
+        return False
+
+
+def _span(name: str, trace_id: str | None = None, **attrs) -> _Span:
+    """
+    Context manager for a span named `name`, nested under the current one.
+    trace_id starts a new root span in that trace (a webhook handler passing on
+    the caller's X-Trace-Id); None-valued attrs are dropped.
+    """
+    return _Span(name, trace_id, **attrs)
+
+
+def _export_span(line: str) -> None:
+    if TRACE_FILE == "-":
+        log.info(f"[trace] {line}")
+        return
+    try:
+        with _trace_write_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        log.warning(f"[trace] could not write {TRACE_FILE}: {e}")
+
+
+def _current_trace_id() -> str | None:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def _traced_webhook(name: str):
+    """Route decorator: run the handler as the root span of a trace (the caller's X-Trace-Id, if sent)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(f"webhook.{name}", trace_id=request.headers.get(TRACE_HEADER)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _in_current_context(fn):
+    """
+    fn bound to a copy of the caller's context, so spans it opens on a pool
+    thread nest correctly (and a profiled request's pool work is profiled too).
+    """
+    return functools.partial(contextvars.copy_context().run, _run_in_worker, fn)
+
+
+def _run_in_worker(fn, *args, **kwargs):
+    profilers = _active_profile.get()
+    if profilers is None:
+        return fn(*args, **kwargs)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: the request's profiler already sees every thread
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profilers.append(profiler)
+
+
+# ---------------------------------------------------------------------------
+# On-demand profiling
+# ---------------------------------------------------------------------------
+# A webhook (or /test-labels) request carrying PROFILE_SECRET — in the
+# X-Profile header or ?profile= — runs under cProfile and writes
+# <name>-<time>-<pid>.pstats plus a top-N .txt summary to PROFILE_DIR (the
+# summary is logged too, for hosts whose /tmp doesn't outlive the request).
+# At most one profiled request per PROFILE_MIN_INTERVAL_S per process; the
+# rest run normally. Pool-thread work is profiled and merged in, and label
+# rendering stays in-process so _draw_label_at_origin shows up.
+
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")     # "" disables profiling
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR") or Path(tempfile.gettempdir()) / "profiles")
+PROFILE_MIN_INTERVAL_S = float(os.environ.get("PROFILE_MIN_INTERVAL_S", "300"))
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "40"))
+PROFILE_HEADER = "X-Profile"
+
+_profile_lock = threading.Lock()    # held while a profiled request runs
+_profile_last = 0.0                 # time.monotonic() the last one started
+# Profilers of the current request's pool-thread work (None: not profiling)
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+
+
+def _profile_secret(headers, query) -> str | None:
+    """The secret sent with a request (X-Profile header or ?profile=; query values may be lists)."""
+    value = headers.get(PROFILE_HEADER) or query.get("profile")
+    return value[0] if isinstance(value, list) else value
+
+
+def _profile_requested(secret: str | None) -> bool:
+    """
+    True when `secret` is PROFILE_SECRET and the rate limit allows a profile —
+    the caller must then run the request through _run_profiled.
+    """
+    global _profile_last
+    if not PROFILE_SECRET or not secret or not hmac.compare_digest(secret, PROFILE_SECRET):
+        return False
+    if not _profile_lock.acquire(blocking=False):
+        log.info("[profile] another profiled request is running — not profiling this one")
+        return False
+    now = time.monotonic()
+    if _profile_last and now - _profile_last < PROFILE_MIN_INTERVAL_S:
+        _profile_lock.release()
+        log.info(f"[profile] rate limited — next profile in {_profile_last + PROFILE_MIN_INTERVAL_S - now:.0f}s")
+        return False
+    _profile_last = now
+    return True
+
+
+def _run_profiled(name: str, fn, *args, **kwargs):
+    """Call fn under cProfile and write its profile; releases the _profile_requested slot."""
+    import cProfile
+
+    profilers = []
+    token = _active_profile.set(profilers)
+    profiler = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        _active_profile.reset(token)
+        try:
+            _write_profile(name, profiler, profilers, time.perf_counter() - t0)
+        except Exception as e:
+            log.warning(f"[profile] could not write {name} profile: {e}")
+        finally:
+            _profile_lock.release()
+
+
+def _write_profile(name: str, profiler, worker_profilers: list, seconds: float) -> Path:
+    import io
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    for worker in worker_profilers:
+        stats.add(worker)
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.pstats"
+    stats.dump_stats(str(path))
+
+    out = io.StringIO()
+    stats.stream = out
+    print(f"{name}: {seconds:.3f}s wall, {len(worker_profilers)} pool thread(s) merged", file=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    stats.sort_stats("tottime").print_stats(PROFILE_TOP_N)
+    summary = out.getvalue()
+    path.with_suffix(".txt").write_text(summary)
+    log.info(f"[profile] {name} → {path}\n{summary}")
+    return path
+
+
+def _profiled_route(name: str):
+    """Route decorator: profile the request when it carries PROFILE_SECRET."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _profile_requested(_profile_secret(request.headers, request.args)):
+                return _run_profiled(name, fn, *args, **kwargs)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _maybe_profiled(name: str, secret: str | None, fn, *args, **kwargs):
+    """fn(*args, **kwargs), profiled when `secret` allows (for the Vercel handlers)."""
+    if _profile_requested(secret):
+        return _run_profiled(name, fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
 app = Flask(__name__)
 
 MONDAY_API_URL = "https://api.monday.com/v2"
@@ -37,7 +438,21 @@ def get_token():
     return token
 
 
-def monday_request(query, variables=None):
+def _budget_timeout(deadline: float | None, cap: float) -> float:
+    """
+    Timeout (seconds) for a blocking HTTP call: `cap`, shortened to what is left
+    before an absolute time.monotonic() deadline. Raises TimeoutError once the
+    deadline has passed, so a stage never starts with no budget to finish in.
+    """
+    if deadline is None:
+        return cap
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"request budget spent {-remaining:.0f}s ago — not starting the call")
+    return min(cap, remaining)
+
+
+def monday_request(query, variables=None, deadline: float | None = None):
     token = get_token()
     headers = {
         "Authorization": token,
@@ -47,11 +462,15 @@ def monday_request(query, variables=None):
     payload = {"query": query}
     if variables:
         payload["variables"] = variables
-    resp = requests.post(MONDAY_API_URL, json=payload, headers=headers, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
-    if "errors" in data:
-        raise RuntimeError(f"Monday API error: {data['errors']}")
+    op = re.search(r"\b(?:query|mutation)\s+(\w+)", query)
+    with _span("monday.request", operation=op.group(1) if op else None) as span:
+        resp = requests.post(MONDAY_API_URL, json=payload, headers=headers,
+                             timeout=_budget_timeout(deadline, 30))
+        span.set(status=resp.status_code, bytes=len(resp.content))
+        resp.raise_for_status()
+        data = resp.json()
+        if "errors" in data:
+            raise RuntimeError(f"Monday API error: {data['errors']}")
     return data
 
 
@@ -94,7 +513,44 @@ def get_packing_slip_url(item_id):
     return url, name
 
 
-def download_file(url, dest_path, auth_token: str | None = None):
+def get_latest_file_url(item_id, column_id, suffix=None):
+    """
+    Return the (url, name) of the most recent file in any file column, optionally
+    only among files whose name ends with `suffix`. (None, None) if there is none.
+    """
+    query = """
+    query GetColumnFiles($itemId: ID!, $columnId: String!) {
+      items(ids: [$itemId]) {
+        column_values(ids: [$columnId]) {
+          ... on FileValue {
+            files {
+              ... on FileAssetValue {
+                asset {
+                  public_url
+                  name
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+    data = monday_request(query, {"itemId": str(item_id), "columnId": column_id})
+    items = data.get("data", {}).get("items", [])
+    if not items:
+        raise RuntimeError(f"Item {item_id} not found")
+    col_values = items[0].get("column_values", [])
+    files = col_values[0].get("files", []) if col_values else []
+    for f in reversed(files):   # most recent file is last in the list
+        asset = f.get("asset", {})
+        name = asset.get("name", "")
+        if asset.get("public_url") and (not suffix or name.lower().endswith(suffix)):
+            return asset["public_url"], name
+    return None, None
+
+
+def download_file(url, dest_path, auth_token: str | None = None, deadline: float | None = None):
     """Download a file, optionally with a Monday.com API token for protected_static URLs.
 
     Monday's CDN (protected_static) requires 'Authorization: Bearer {token}'.
@@ -109,13 +565,23 @@ def download_file(url, dest_path, auth_token: str | None = None):
             headers["Authorization"] = get_token()
         except Exception:
             pass
-    resp = requests.get(url, headers=headers, timeout=60)
-    resp.raise_for_status()
+    with _span("http.download", host=urllib.parse.urlsplit(url).hostname) as span:
+        resp = requests.get(url, headers=headers, timeout=_budget_timeout(deadline, 60))
+        span.set(status=resp.status_code, bytes=len(resp.content))
+        resp.raise_for_status()
     with open(dest_path, "wb") as f:
         f.write(resp.content)
+    _metrics.inc("bytes_total", len(resp.content), direction="download")
     log.info(f"Downloaded file to {dest_path} ({len(resp.content)} bytes)")
 
 
+_UPLOAD_MIMETYPES = {".pdf": "application/pdf", ".zpl": "text/plain"}
+
+
+def _upload_mimetype(path):
+    return _UPLOAD_MIMETYPES.get(Path(path).suffix.lower(), "application/octet-stream")
+
+
 def upload_labels_to_monday(item_id, pdf_path):
     """Upload the labels PDF to the Shipping Labels column."""
     token = get_token()
@@ -134,21 +600,24 @@ def upload_labels_to_monday(item_id, pdf_path):
         file_bytes = f.read()
 
     filename = Path(pdf_path).name
-    resp = requests.post(
-        MONDAY_FILE_API_URL,
-        headers={"Authorization": token, "API-Version": "2024-01"},
-        files={
-            "query": (None, mutation),
-            "variables": (None, json.dumps(variables)),
-            "map": (None, json.dumps({"file": ["variables.file"]})),
-            "file": (filename, file_bytes, "application/pdf"),
-        },
-        timeout=60,
-    )
-    resp.raise_for_status()
+    with _span("monday.upload", file=filename, bytes=len(file_bytes)) as span:
+        resp = requests.post(
+            MONDAY_FILE_API_URL,
+            headers={"Authorization": token, "API-Version": "2024-01"},
+            files={
+                "query": (None, mutation),
+                "variables": (None, json.dumps(variables)),
+                "map": (None, json.dumps({"file": ["variables.file"]})),
+                "file": (filename, file_bytes, _upload_mimetype(pdf_path)),
+            },
+            timeout=60,
+        )
+        span.set(status=resp.status_code)
+        resp.raise_for_status()
     result = resp.json()
     if "errors" in result:
         raise RuntimeError(f"Upload error: {result['errors']}")
+    _metrics.inc("bytes_total", len(file_bytes), direction="upload")
     log.info(f"Uploaded {filename} to Shipping Labels column for item {item_id}")
     return result
 
@@ -358,194 +827,1349 @@ LABEL_H = 1.5 * inch                    # 108 pt
 LABEL_PAD = 5   # pt — internal padding on all sides
 
 
-def _label_origin(idx_on_page):
+# ---------------------------------------------------------------------------
+# Label sheet formats
+# ---------------------------------------------------------------------------
+# A sheet format fixes the page size, grid, margins, gaps and padding. The
+# per-slot label origins are precomputed once per format, so the render loops
+# only index a table. OL5350 (the constants above) is the default; set
+# LABEL_SHEET_FORMAT to switch stock, and LABEL_SHEET_FORMATS_FILE to a JSON
+# list of formats (dimensions in inches) to add new ones without code changes.
+
+@dataclass(frozen=True)
+class LabelSheetFormat:
+    name: str
+    page_w: float           # pt
+    page_h: float
+    cols: int
+    rows: int
+    label_w: float
+    label_h: float
+    left_margin: float
+    top_margin: float
+    col_gap: float = 0.0
+    row_gap: float = 0.0
+    padding: float = LABEL_PAD
+    box_baseline: float = LABEL_PAD + 4 + 0.25 * inch   # BOX/QTY baseline above label bottom
+    desc_lines: int = 2     # shipping label description lines (prelim labels get one more)
+
+    @property
+    def labels_per_page(self) -> int:
+        return self.cols * self.rows
+
+    @functools.cached_property
+    def origins(self) -> tuple:
+        """(x, y) bottom-left corner of every slot on the page, in fill order."""
+        return tuple(
+            (
+                self.left_margin + col * (self.label_w + self.col_gap),
+                self.page_h - self.top_margin - (row + 1) * self.label_h - row * self.row_gap,
+            )
+            for row in range(self.rows)
+            for col in range(self.cols)
+        )
+
+
+LABEL_SHEET_FORMATS: dict = {}
+
+
+def register_label_sheet_format(fmt: LabelSheetFormat) -> LabelSheetFormat:
+    LABEL_SHEET_FORMATS[fmt.name] = fmt
+    return fmt
+
+
+register_label_sheet_format(LabelSheetFormat(
+    "OL5350", PAGE_WIDTH, PAGE_HEIGHT, LABELS_PER_ROW, ROWS_PER_PAGE,
+    LABEL_W, LABEL_H, H_LEFT_MARGIN, V_TOP_MARGIN, col_gap=COL_GAP,
+))
+# 3 × 10 address-label sheet (2.625" × 1"), 30 per page
+register_label_sheet_format(LabelSheetFormat(
+    "OL875", PAGE_WIDTH, PAGE_HEIGHT, 3, 10, 2.625 * inch, 1 * inch,
+    0.1875 * inch, 0.5 * inch, col_gap=0.125 * inch,
+    padding=4, box_baseline=6, desc_lines=1,
+))
+# Continuous roll stock: one label per page, page = label
+register_label_sheet_format(LabelSheetFormat(
+    "ROLL_2.83x1.5", LABEL_W, LABEL_H, 1, 1, LABEL_W, LABEL_H, 0, 0,
+))
+
+
+def _load_label_sheet_formats(path) -> None:
+    """Register formats from a JSON list; numeric dimensions are in inches."""
+    with open(path) as f:
+        entries = json.load(f)
+    for entry in entries:
+        entry = dict(entry)
+        for key in ("page_w", "page_h", "label_w", "label_h", "left_margin", "top_margin",
+                    "col_gap", "row_gap", "padding", "box_baseline"):
+            if key in entry:
+                entry[key] = float(entry[key]) * inch
+        register_label_sheet_format(LabelSheetFormat(**entry))
+        log.info(f"[labels] registered sheet format '{entry['name']}' from {path}")
+
+
+if os.environ.get("LABEL_SHEET_FORMATS_FILE"):
+    _load_label_sheet_formats(os.environ["LABEL_SHEET_FORMATS_FILE"])
+
+DEFAULT_LABEL_SHEET_FORMAT = os.environ.get("LABEL_SHEET_FORMAT", "OL5350")
+
+
+def get_label_sheet_format(sheet_format=None) -> LabelSheetFormat:
+    """Resolve a format object or registered name (None = DEFAULT_LABEL_SHEET_FORMAT)."""
+    if isinstance(sheet_format, LabelSheetFormat):
+        return sheet_format
+    name = sheet_format or DEFAULT_LABEL_SHEET_FORMAT
+    try:
+        return LABEL_SHEET_FORMATS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown label sheet format '{name}' (known: {', '.join(LABEL_SHEET_FORMATS)})"
+        ) from None
+
+
+def _label_origin(idx_on_page, sheet_format=None):
     """Return (x, y) bottom-left corner for label at position idx_on_page."""
-    col = idx_on_page % LABELS_PER_ROW
-    row = idx_on_page // LABELS_PER_ROW
-    x = H_LEFT_MARGIN + col * (LABEL_W + COL_GAP)
-    y = PAGE_HEIGHT - V_TOP_MARGIN - (row + 1) * LABEL_H
-    return x, y
+    return get_label_sheet_format(sheet_format).origins[idx_on_page]
+
 
+# Above this many labels, the webhooks render and upload the PDF in parts of
+# LABEL_PART_PAGES pages so memory stays flat and uploads start early.
+LABEL_STREAM_MIN_LABELS = int(os.environ.get("LABEL_STREAM_MIN_LABELS", "5000"))
+LABEL_PART_PAGES = int(os.environ.get("LABEL_PART_PAGES", "100"))
 
-def build_labels_pdf(customer_name, po_number, grouped_items, out_path):
+
+def _iter_label_plan(grouped_items):
     """
-    Generate a PDF with one label per carton, 3 labels per row (OL5350).
-    Returns the total number of labels generated.
+    Lazily yield (description, box_num, total_boxes, qty) for every carton label,
+    in print order. Box numbers restart at 1 for each description.
     """
-    c = canvas.Canvas(str(out_path), pagesize=letter)
-    label_index = 0
-
     for group in grouped_items:
         desc = group["description"]
         total = group["total_cartons"]
         box_num = 0
-
         for cg in group["carton_groups"]:
             for _ in range(cg["count"]):
                 box_num += 1
+                yield desc, box_num, total, cg["qty"]
 
-                if label_index > 0 and label_index % LABELS_PER_PAGE == 0:
-                    c.showPage()
 
-                lx, ly = _label_origin(label_index % LABELS_PER_PAGE)
-                _draw_label(c, lx, ly, customer_name, po_number, desc, box_num, total, cg["qty"])
-                label_index += 1
+def _iter_label_slots(c, fmt, plan):
+    """
+    Yield the entries of `plan` with canvas c translated to each label's
+    origin, one sheet per page. Each move is relative to the previous label,
+    so page content repeats label to label and compresses well.
+    """
+    per_page = len(fmt.origins)
+    x = y = 0
+    placed = 0
+    for entry in plan:
+        slot = placed % per_page
+        if not slot:
+            if placed:
+                c.restoreState()
+                c.showPage()
+            c.saveState()
+            x = y = 0
+        lx, ly = _label_origin(slot, fmt)
+        c.translate(lx - x, ly - y)
+        x, y = lx, ly
+        yield entry
+        placed += 1
+    if placed:
+        c.restoreState()
+
+
+def _render_shipping_labels(c, customer_name, po_number, barcode, plan, fmt):
+    """Draw every label in `plan` onto canvas c, one sheet per page. Returns the label count."""
+    forms = {}
+    label_count = 0
+    for desc, box_num, total, qty in _iter_label_slots(c, fmt, plan):
+        _draw_label_at_origin(
+            c, customer_name, po_number, desc, box_num, total, qty, forms, fmt, barcode
+        )
+        label_count += 1
+    return label_count
 
-    c.save()
-    log.info(f"Generated labels PDF: {label_index} labels → {out_path}")
-    return label_index
 
+def _label_canvas(out_path, fmt):
+    return canvas.Canvas(str(out_path), pagesize=(fmt.page_w, fmt.page_h), pageCompression=1)
 
-def _draw_label(c, x, y, customer_name, po_number, description, box_num, total_boxes, qty):
-    """Draw a single shipping label clipped to its bounding box. No border."""
-    pad = LABEL_PAD
-    text_w = LABEL_W - 2 * pad      # max width available for text
 
-    # --- Clip content to label area so nothing bleeds into adjacent labels ---
-    c.saveState()
-    clip = c.beginPath()
-    clip.rect(x, y, LABEL_W, LABEL_H)
-    c.clipPath(clip, stroke=0, fill=0)
-    c.setFillColorRGB(0, 0, 0)
+# Output size: with LABEL_PDF_OPTIMIZE (default on) label PDFs are rewritten
+# with binary Flate streams (reportlab's ASCII85 wrapper removed, ~20% smaller),
+# all pages inheriting one shared /Resources and /MediaBox from the page tree
+# instead of repeating them per page, with identical objects deduplicated
+# (fonts and forms repeated across merged page ranges). Together with the
+# shared Form XObjects and label-local per-label drawing, the rest of a page is
+# mostly its (highly repetitive, compressed) content stream, so the file is
+# written as PDF 1.5 with the small dictionaries (pages, fonts, page tree)
+# packed into one compressed object stream and a compressed cross-reference
+# stream — otherwise per-object overhead is a third of a 500-label file.
+# Against drawing every label in full that is ~3.3x smaller for a 500-label
+# order over 10 descriptions and ~3.5x from ~2000 labels up (bench_labels.py).
+LABEL_PDF_OPTIMIZE = os.environ.get("LABEL_PDF_OPTIMIZE", "1").lower() not in ("0", "false", "no")
 
-    # --- Layout top-down ---
-    NAME_SIZE = 10
-    DESC_SIZE = 8
-    PO_SIZE   = 8
-    BOX_SIZE  = 9
 
-    cursor = y + LABEL_H - pad  # start just below top edge
+def _save_label_canvas(c, out_path, optimize=None):
+    """c.save(), plus the LABEL_PDF_OPTIMIZE size optimisations."""
+    optimize = LABEL_PDF_OPTIMIZE if optimize is None else optimize
+    c.save()
+    if optimize:
+        _optimize_label_pdf(out_path)
 
-    # Customer name
-    c.setFont("Helvetica-Bold", NAME_SIZE)
-    c.drawString(x + pad, cursor - NAME_SIZE, customer_name)
-    cursor -= NAME_SIZE + 3
 
-    # Description — wrap to 2 lines max if too long
-    c.setFont("Helvetica", DESC_SIZE)
-    desc_lines = simpleSplit(description, "Helvetica", DESC_SIZE, text_w)[:2]
-    for line in desc_lines:
-        c.drawString(x + pad, cursor - DESC_SIZE, line)
-        cursor -= DESC_SIZE + 2
+def _flate_only(stream) -> None:
+    """Re-encode an ASCII85 + Flate stream as binary Flate (reportlab's A85 is global config)."""
+    from pypdf.generic import NameObject
 
-    # PO#
-    c.setFont("Helvetica", PO_SIZE)
-    c.drawString(x + pad, cursor - PO_SIZE, f"PO# {po_number}")
+    filters = stream.get("/Filter")
+    if filters is None or "/ASCII85Decode" not in (
+        filters if isinstance(filters, list) else [filters]
+    ):
+        return
+    data = stream.get_data()
+    stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+    stream.pop("/DecodeParms", None)
+    stream.set_data(data)
 
-    # --- BOX / QTY — fixed position from bottom, raised to avoid cut-off ---
-    bottom_y = y + pad + 4 + 0.25 * inch
-    c.setFont("Helvetica-Bold", BOX_SIZE)
-    c.drawString(x + pad, bottom_y, f"BOX: {box_num}/{total_boxes}")
-    c.drawRightString(x + LABEL_W - pad, bottom_y, f"QTY: {qty:,}")
 
-    c.restoreState()
+def _optimize_label_pdf(out_path, writer=None):
+    """
+    Rewrite a label PDF in place (or write `writer` to out_path) with identical
+    objects merged and per-page /Resources and /MediaBox hoisted into the page
+    tree. Pages keep their own resources if any name maps to different objects.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import DictionaryObject, NameObject
+
+    out_path = Path(out_path)
+    if writer is None:
+        writer = PdfWriter(clone_from=str(out_path))
+    # Fonts → font resource dicts → forms: each pass can only merge objects
+    # whose references the previous pass made identical
+    for _ in range(3):
+        writer.compress_identical_objects()
+
+    shared = {"/Font": {}, "/XObject": {}}
+    mediaboxes = set()
+    hoist = True
+    for page in writer.pages:
+        mediaboxes.add(tuple(page.mediabox))
+        for key, entries in page.get("/Resources", DictionaryObject()).get_object().items():
+            if key == "/ProcSet":
+                continue
+            if key not in shared:
+                hoist = False
+                break
+            for name, ref in entries.get_object().items():
+                if shared[key].setdefault(name, ref) != ref:
+                    hoist = False
+    forms = {}
+    for page in writer.pages:
+        resources = page.get("/Resources", DictionaryObject()).get_object()
+        for ref in resources.get("/XObject", DictionaryObject()).get_object().values():
+            forms.setdefault(ref.idnum, ref)
+    for ref in forms.values():
+        form = ref.get_object()
+        for key in ("/Matrix", "/FormType", "/Type"):   # identity / 1 / implied by default
+            form.pop(key, None)
+        form_resources = form.get("/Resources")
+        if form_resources is not None:
+            form_resources.get_object().pop("/ProcSet", None)
+        _flate_only(form)
+        _strip_canvas_preamble(form)
+    for page in writer.pages:
+        contents = page.get_contents()
+        if contents is not None and _strip_canvas_preamble(contents):
+            page.replace_contents(contents)
+        page.compress_content_streams(level=9)
+
+    if hoist and len(mediaboxes) == 1:
+        tree = writer.root_object["/Pages"].get_object()
+        tree[NameObject("/Resources")] = DictionaryObject({
+            NameObject(key): DictionaryObject(entries) for key, entries in shared.items() if entries
+        })
+        tree[NameObject("/MediaBox")] = writer.pages[0].mediabox
+        for page in writer.pages:
+            for key in ("/Resources", "/MediaBox", "/Rotate", "/Trans"):
+                page.pop(key, None)
 
+    tmp_path = out_path.with_suffix(".opt.pdf")
+    with open(tmp_path, "wb") as f:
+        _write_compact_pdf(writer, f)
+    os.replace(tmp_path, out_path)
 
-# ---------------------------------------------------------------------------
-# End-to-end processing
-# ---------------------------------------------------------------------------
 
-def _process_packing_slip(item_id):
-    """Download packing slip, parse it, generate labels, upload to Monday."""
-    with tempfile.TemporaryDirectory() as tmp:
-        pdf_in = Path(tmp) / "packing_slip.pdf"
-        pdf_out = Path(tmp) / f"shipping_labels_{item_id}.pdf"
+# reportlab opens every page and form with a reset to its default font, which
+# the label drawers never rely on — each sets its own before drawing text.
+_CANVAS_PREAMBLE = re.compile(rb"^1 0 0 1 0 0 cm\s+BT /F\d+ [\d.]+ Tf [\d.]+ TL ET\s*")
+_STRING_OPERAND = re.compile(rb"[(<\[]")
 
-        log.info(f"Fetching packing slip file URL for item {item_id}")
-        url, filename = get_packing_slip_url(item_id)
-        log.info(f"Downloading: {filename}")
-        download_file(url, pdf_in)
 
-        log.info("Parsing packing slip")
-        parsed = parse_packing_slip(pdf_in)
+def _strip_canvas_preamble(stream) -> bool:
+    """Drop reportlab's font-reset preamble from a content stream, if nothing reads it."""
+    data = stream.get_data()
+    m = _CANVAS_PREAMBLE.match(data)
+    if m is None:
+        return False
+    # Text is only shown from string operands; keep the preamble unless a font is set first
+    first_string = _STRING_OPERAND.search(data, m.end())
+    if first_string is not None and data.find(b" Tf", m.end(), first_string.start()) < 0:
+        return False
+    stream.set_data(data[m.end():])
+    return True
 
-        if not parsed["line_items"]:
-            raise RuntimeError("No line items found in packing slip — check PDF format")
 
-        grouped = group_line_items(parsed["line_items"])
-        total_labels = sum(g["total_cartons"] for g in grouped)
-        log.info(
-            f"Generating {total_labels} labels for "
-            f"'{parsed['customer_name']}' PO# {parsed['po_number']}"
-        )
-        build_labels_pdf(parsed["customer_name"], parsed["po_number"], grouped, pdf_out)
+def _write_compact_pdf(writer, f) -> None:
+    """
+    Write the objects reachable from writer's catalog as PDF 1.5: streams as
+    ordinary objects, everything else packed into one Flate object stream,
+    indexed by a Flate cross-reference stream. The document info dictionary
+    and unreferenced objects are left out.
+    """
+    from pypdf.generic import (
+        ArrayObject, DecodedStreamObject, IndirectObject, NameObject, NumberObject, StreamObject,
+    )
 
-        log.info("Uploading labels to Monday.com")
-        upload_labels_to_monday(item_id, pdf_out)
+    objects = {}
+    pending = [writer.root_object.indirect_reference]
+    while pending:
+        ref = pending.pop()
+        if ref.idnum in objects:
+            continue
+        obj = objects[ref.idnum] = ref.get_object()
+        values = [obj]
+        while values:
+            value = values.pop()
+            if isinstance(value, IndirectObject):
+                pending.append(value)
+            elif isinstance(value, dict):
+                values.extend(dict.values(value))
+            elif isinstance(value, list):
+                values.extend(value)
+
+    stm_num = max(objects) + 1
+    xref_num = stm_num + 1
+    rows = {0: (0, 0, 0xFFFF)}
+    index, packed = [], bytearray()
+    f.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+
+    def write_obj(num, obj):
+        rows[num] = (1, f.tell(), 0)
+        f.write(f"{num} 0 obj\n".encode())
+        obj.write_to_stream(f)
+        f.write(b"\nendobj\n")
+
+    for num, obj in sorted(objects.items()):
+        if isinstance(obj, StreamObject):
+            write_obj(num, obj)
+        else:
+            rows[num] = (2, stm_num, len(index))
+            index.append(f"{num} {len(packed)}")
+            buf = io.BytesIO()
+            obj.write_to_stream(buf)
+            packed += buf.getvalue() + b"\n"
+    header = (" ".join(index) + "\n").encode()
+    stm = DecodedStreamObject()
+    stm.set_data(header + bytes(packed))
+    stm = stm.flate_encode(level=9)
+    stm[NameObject("/Type")] = NameObject("/ObjStm")
+    stm[NameObject("/N")] = NumberObject(len(index))
+    stm[NameObject("/First")] = NumberObject(len(header))
+    write_obj(stm_num, stm)
+
+    xref_at = f.tell()
+    rows[xref_num] = (1, xref_at, 0)
+    table = [rows.get(num, (0, 0, 0)) for num in range(xref_num + 1)]
+    widths = [1] + [max(1, (max(row[i] for row in table).bit_length() + 7) // 8) for i in (1, 2)]
+    xref = DecodedStreamObject()
+    xref.set_data(b"".join(
+        bytes([kind]) + a.to_bytes(widths[1], "big") + b.to_bytes(widths[2], "big")
+        for kind, a, b in table
+    ))
+    xref = xref.flate_encode(level=9)
+    xref[NameObject("/Type")] = NameObject("/XRef")
+    xref[NameObject("/Size")] = NumberObject(xref_num + 1)
+    xref[NameObject("/W")] = ArrayObject(NumberObject(w) for w in widths)
+    xref[NameObject("/Root")] = writer.root_object.indirect_reference
+    write_obj(xref_num, xref)
+    f.write(f"startxref\n{xref_at}\n%%EOF\n".encode())
+
+
+def _log_label_pdf(kind, count, out_path):
+    size = Path(out_path).stat().st_size
+    per_label = f", {size / count:.1f} B/label" if count else ""
+    log.info(f"Generated {kind} PDF: {count} labels → {out_path} ({size:,} bytes{per_label})")
+
+
+# Parallel rendering: above LABEL_PARALLEL_MIN_LABELS labels, page ranges are
+# rendered in a process pool and merged in order (0 workers = cpu_count).
+LABEL_PARALLEL_MIN_LABELS = int(os.environ.get("LABEL_PARALLEL_MIN_LABELS", "2000"))
+LABEL_RENDER_WORKERS = int(os.environ.get("LABEL_RENDER_WORKERS", "0")) or (os.cpu_count() or 1)
+
+
+def _render_label_range(kind, header, items, start, stop, out_path, fmt):
+    """
+    Process-pool worker: render labels [start, stop) of a plan to out_path.
 
+    The plan is regenerated from `items` (grouped items or SKUs) and sliced, so
+    box numbering is exactly what the serial path produces.
+    """
+    c = _label_canvas(out_path, fmt)
+    if kind == "prelim":
+        plan = itertools.islice(_iter_prelim_plan(items), start, stop)
+        count = _render_prelim_labels(c, *header, plan, fmt)
+    else:
+        plan = itertools.islice(_iter_label_plan(items), start, stop)
+        count = _render_shipping_labels(c, *header, plan, fmt)
+    _save_label_canvas(c, out_path, optimize=False)   # the merged file is optimised once
+    return count
+
+
+def _page_ranges(total_labels, parts, per_page=LABELS_PER_PAGE):
+    """Split [0, total_labels) into ≤ parts contiguous ranges that start on a page boundary."""
+    pages = -(-total_labels // per_page)
+    parts = max(1, min(parts, pages))
+    ranges = []
+    for i in range(parts):
+        p0 = pages * i // parts
+        p1 = pages * (i + 1) // parts
+        start, stop = p0 * per_page, min(p1 * per_page, total_labels)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _render_labels_parallel(kind, header, items, total_labels, out_path, fmt, workers=None):
+    """
+    Render a label plan in a process pool and merge the page ranges in order.
+    Returns the label count, or None if the pool can't be used here or a
+    worker died (the caller then renders serially).
 
-# ---------------------------------------------------------------------------
-# Routes
-# ---------------------------------------------------------------------------
+    Workers come from a forkserver (spawn where that's unavailable) rather than
+    a fork of this threaded server, which could copy a lock held by another
+    request's thread into the child.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    from pypdf import PdfWriter
+
+    workers = workers or LABEL_RENDER_WORKERS
+    ranges = _page_ranges(total_labels, workers * 2, fmt.labels_per_page)
+    out_path = Path(out_path)
+    part_paths = [
+        out_path.with_name(f"{out_path.stem}.range{i:03d}.pdf") for i in range(len(ranges))
+    ]
+    methods = multiprocessing.get_all_start_methods()
+    try:
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if ctx.get_start_method() == "forkserver" and __name__ != "__main__":
+            # Import this module once in the fork server; workers fork from it warm
+            ctx.set_forkserver_preload([__name__])
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_render_label_range, kind, header, items, start, stop, path, fmt)
+                for (start, stop), path in zip(ranges, part_paths)
+            ]
+            count = sum(f.result() for f in futures)
+    except (OSError, NotImplementedError, PermissionError, BrokenProcessPool) as e:
+        # e.g. no /dev/shm for process-pool semaphores on some serverless hosts,
+        # or a worker killed for running out of memory
+        log.warning(f"[labels] process pool unavailable ({e!r}) — rendering serially")
+        for path in part_paths:
+            path.unlink(missing_ok=True)
+        return None
 
-@app.route("/webhook/monday", methods=["GET"])
-def webhook_verify():
-    """Monday.com webhook URL verification."""
-    challenge = request.args.get("challenge")
-    if challenge:
-        return jsonify({"challenge": challenge})
-    return "OK", 200
+    writer = PdfWriter()
+    for path in part_paths:
+        writer.append(str(path))
+    if LABEL_PDF_OPTIMIZE:
+        _optimize_label_pdf(out_path, writer)
+    else:
+        with open(out_path, "wb") as f:
+            writer.write(f)
+    for path in part_paths:
+        path.unlink(missing_ok=True)
+    log.info(f"[labels] rendered {count} labels in {len(ranges)} ranges on {workers} workers")
+    return count
 
 
-@app.route("/webhook/monday", methods=["POST"])
-def webhook_handler():
-    try:
-        body = request.get_json(force=True, silent=True) or {}
+def build_labels_pdf(customer_name, po_number, grouped_items, out_path, parallel=None,
+                     sheet_format=None, barcode=None):
+    """
+    Generate a PDF with one label per carton on the given sheet format
+    (default OL5350: 3 labels per row, 21 per page).
+    Returns the total number of labels generated.
 
-        # Monday.com sends a JSON challenge on first registration
-        if "challenge" in body:
-            return jsonify({"challenge": body["challenge"]})
+    parallel=None renders in a process pool when the order has more than
+    LABEL_PARALLEL_MIN_LABELS labels; True/False forces either path.
+    barcode is "gs1-128", "qr" or "" (None = LABEL_BARCODE).
+    """
+    fmt = get_label_sheet_format(sheet_format)
+    barcode = _resolve_label_barcode(barcode)
+    total = sum(g["total_cartons"] for g in grouped_items)
+    if parallel is None:
+        # Profiled requests render in-process, where the profiler can see it
+        parallel = (total > LABEL_PARALLEL_MIN_LABELS and LABEL_RENDER_WORKERS > 1
+                    and _active_profile.get() is None)
+    if parallel and total:
+        label_index = _render_labels_parallel(
+            "ship", (customer_name, po_number, barcode), grouped_items, total, out_path, fmt
+        )
+        if label_index is not None:
+            _log_label_pdf("labels", label_index, out_path)
+            return label_index
 
-        event = body.get("event", body)
-        item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
-        column_id = event.get("columnId") or event.get("column_id")
+    c = _label_canvas(out_path, fmt)
+    label_index = _render_shipping_labels(
+        c, customer_name, po_number, barcode, _iter_label_plan(grouped_items), fmt
+    )
+    _save_label_canvas(c, out_path)
+    _log_label_pdf("labels", label_index, out_path)
+    return label_index
 
-        log.info(f"Webhook — item={item_id}, column={column_id}")
 
-        if not item_id:
-            log.warning("No item_id in webhook payload, ignoring")
-            return jsonify({"status": "ignored", "reason": "no item_id"}), 200
+def _build_label_parts(plan, render, out_dir, base_name, pages_per_part, fmt, on_part=None):
+    """
+    Render a lazy label plan into a series of standalone PDFs of at most
+    `pages_per_part` pages each (<base_name>_partNN.pdf in out_dir).
 
-        if column_id and column_id != PACKING_SLIP_COLUMN_ID:
-            log.info(f"Column {column_id} is not Packing Slip, ignoring")
-            return jsonify({"status": "ignored", "reason": "wrong column"}), 200
+    render(c, part_plan) draws one part's labels onto a fresh canvas. Only one
+    part's canvas is held at a time, so memory doesn't grow with label count.
+    on_part(path, part_no, label_count) is called as each part is saved, e.g.
+    to upload it; it may delete the file. Returns [(path, label_count), ...].
+    """
+    labels_per_part = max(1, pages_per_part) * fmt.labels_per_page
+    plan = iter(plan)
+    parts = []
+    while True:
+        first = next(plan, None)
+        if first is None:
+            break
+        part_no = len(parts) + 1
+        path = Path(out_dir) / f"{base_name}_part{part_no:02d}.pdf"
+        c = _label_canvas(path, fmt)
+        count = render(c, itertools.chain((first,), itertools.islice(plan, labels_per_part - 1)))
+        _save_label_canvas(c, path)
+        del c
+        _log_label_pdf(f"label part {part_no}", count, path)
+        parts.append((path, count))
+        if on_part:
+            on_part(path, part_no, count)
+    return parts
+
+
+def build_labels_pdf_parts(customer_name, po_number, grouped_items, out_dir, base_name,
+                           pages_per_part=LABEL_PART_PAGES, on_part=None, sheet_format=None,
+                           barcode=None):
+    """Streaming variant of build_labels_pdf — see _build_label_parts."""
+    fmt = get_label_sheet_format(sheet_format)
+    barcode = _resolve_label_barcode(barcode)
+    return _build_label_parts(
+        _iter_label_plan(grouped_items),
+        lambda c, part_plan: _render_shipping_labels(
+            c, customer_name, po_number, barcode, part_plan, fmt
+        ),
+        out_dir, base_name, pages_per_part, fmt, on_part,
+    )
 
-        try:
-            _process_packing_slip(item_id)
-        except Exception as exc:
-            log.exception(f"Processing error for item {item_id}: {exc}")
-            return jsonify({"status": "error", "message": str(exc)}), 200
 
-        return jsonify({"status": "ok"}), 200
+@functools.lru_cache(maxsize=1024)
+def _wrap_label_text(text, font_name, font_size, width, max_lines):
+    """simpleSplit, memoized — every label in a description group wraps the same text."""
+    return tuple(simpleSplit(text, font_name, font_size, width)[:max_lines])
 
-    except Exception as exc:
-        log.exception(f"Unexpected webhook error: {exc}")
-        return jsonify({"status": "error", "message": str(exc)}), 200
 
+def _label_form(c, forms, key, fmt, draw_static, *args):
+    """
+    Return the name of the Form XObject holding a label's invariant content,
+    drawing it once per canvas via draw_static(c, *args, fmt) in label-local
+    coordinates. The form's bounding box is the label, so it clips itself.
 
-@app.route("/health", methods=["GET"])
-def health():
-    return jsonify({"status": "ok"})
+    Names are derived from the key, so the same content gets the same name on
+    every canvas and merged page ranges can share one copy.
+    """
+    name = forms.get(key)
+    if name is None:
+        digest = hashlib.blake2s(repr((key, fmt.name)).encode(), digest_size=5).hexdigest()
+        name = f"L{digest}"
+        if name in forms.values():
+            name = f"{name}_{len(forms)}"
+        c.beginForm(name, 0, 0, fmt.label_w, fmt.label_h)
+        draw_static(c, *args, fmt)
+        c.endForm()
+        forms[key] = name
+    return name
 
 
 # ---------------------------------------------------------------------------
-# Local test endpoints (do not use in production)
+# Carton barcodes (optional)
 # ---------------------------------------------------------------------------
+# LABEL_BARCODE=gs1-128 adds a GS1-128 symbol under BOX/QTY; LABEL_BARCODE=qr
+# adds a GS1 QR code in the bottom-right corner. Both carry the element string
+#   (400) PO#   (241) item code from the description   (90) box n/total
+# Only the box number changes between the labels of a description, so the
+# static part of the symbol goes into the label's Form XObject and only the
+# rest is encoded and drawn per label: the Code 128 prefix and its checksum
+# contribution are computed once, and QR codes use a fixed version and mask so
+# the function patterns are static and only data modules are placed per label
+# (which also skips the 8-way mask search).
+
+LABEL_BARCODE = os.environ.get("LABEL_BARCODE", "").lower()   # "", "gs1-128" or "qr"
+LABEL_BARCODES = ("", "gs1-128", "qr")
+LABEL_BARCODE_ITEM_CODE_LEN = 8
+
+_BARCODE_MAX_MODULE_PT = 1.0        # Code 128 X-dimension cap
+_BARCODE_MIN_HEIGHT_PT = 10
+_BARCODE_QR_MAX_PT = 0.75 * inch
+_BARCODE_QR_MASK = 0
+_GS1_FNC1 = "\xf1"                  # FNC1 in Code 128 data
+_CODE128_STOP = 106
+
+
+def _resolve_label_barcode(barcode=None) -> str:
+    barcode = LABEL_BARCODE if barcode is None else (barcode or "").lower()
+    if barcode not in LABEL_BARCODES:
+        raise ValueError(f"Unknown label barcode '{barcode}' (use gs1-128 or qr)")
+    return barcode
+
+
+def _label_barcode_value(text, max_len=None):
+    """A-Z, 0-9 and '-' only — valid in GS1 AIs and in QR alphanumeric mode."""
+    value = re.sub(r"[^A-Z0-9]+", "-", str(text).upper()).strip("-")
+    return value[:max_len].rstrip("-") if max_len else value
+
+
+def _label_barcode_fields(po_number, description):
+    """(PO, item code) as encoded in the barcode."""
+    return (
+        _label_barcode_value(po_number, 30) or "0",
+        _label_barcode_value(description, LABEL_BARCODE_ITEM_CODE_LEN) or "0",
+    )
 
-@app.route("/test-parse", methods=["POST"])
-def test_parse():
+
+def _label_barcode_area(fmt, barcode):
+    """(x, y, w, h) of the barcode in label coordinates."""
+    pad = fmt.padding
+    if barcode == "qr":
+        # Square in the bottom-right corner, below the name/description block
+        text_h = 10 + 3 + fmt.desc_lines * (8 + 2)
+        side = min(_BARCODE_QR_MAX_PT, fmt.label_h - 2 * pad - text_h)
+        area = (fmt.label_w - pad - side, pad, side, side)
+    else:
+        # Strip between the bottom padding and the BOX/QTY line
+        area = (pad, pad, fmt.label_w - 2 * pad, fmt.box_baseline - pad - 3)
+    if area[3] < _BARCODE_MIN_HEIGHT_PT:
+        raise ValueError(f"Label sheet format '{fmt.name}' has no room for a {barcode} barcode")
+    return area
+
+
+# --- GS1-128 ---
+
+# Code 128 symbol values 0-106 as bar/space module widths, bar first (ISO/IEC 15417)
+_CODE128_PATTERNS = (
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212",
+    "221213", "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221",
+    "223211", "221132", "221231", "213212", "223112", "312131", "311222", "321122", "321221",
+    "312212", "322112", "322211", "212123", "212321", "232121", "111323", "131123", "131321",
+    "112313", "132113", "132311", "211313", "231113", "231311", "112133", "112331", "132131",
+    "113123", "113321", "133121", "313121", "211331", "231131", "213113", "213311", "213131",
+    "311123", "311321", "331121", "312113", "312311", "332111", "314111", "221411", "431111",
+    "111224", "111422", "121124", "121421", "141122", "141221", "112214", "112412", "122114",
+    "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111", "111242",
+    "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311",
+    "113141", "114131", "311141", "411131", "211412", "211214", "211232", "2331112",
+)
+_CODE128_QUIET_MODULES = 10         # GS1 minimum quiet zone on each side of the symbol
+
+
+@functools.lru_cache(maxsize=None)
+def _code128_runs(value):
+    """((offset, width), ...) bar runs of one symbol value in modules, plus its total width."""
+    runs, x = [], 0
+    for i, ch in enumerate(_CODE128_PATTERNS[value]):
+        w = int(ch)
+        if i % 2 == 0:
+            runs.append((x, w))
+        x += w
+    return tuple(runs), x
+
+
+def _code128_encode(data, code_set=None):
     """
-    Test PDF parsing without Monday.com.
-    Usage: curl -X POST -F "file=@packing_slip.pdf" http://localhost:5000/test-parse
+    Encode data (FNC1 as "\\xf1") into Code 128 set B/C symbol values.
+    code_set=None starts a new symbol; "B" or "C" continues one from that set.
+    Returns (values, code_set at the end).
     """
-    if "file" not in request.files:
-        return jsonify({"error": "No file provided — use form field 'file'"}), 400
-    f = request.files["file"]
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-        f.save(tmp.name)
-        parsed = parse_packing_slip(tmp.name)
-    grouped = group_line_items(parsed["line_items"])
-    return jsonify({
+    values = []
+
+    def digit_run(i):
+        j = i
+        while j < len(data) and "0" <= data[j] <= "9":
+            j += 1
+        return j - i
+
+    if code_set is None:
+        code_set = "C" if data.startswith(_GS1_FNC1) or digit_run(0) >= 4 else "B"
+        values.append(105 if code_set == "C" else 104)
+    i = 0
+    while i < len(data):
+        if data[i] == _GS1_FNC1:
+            values.append(102)
+            i += 1
+            continue
+        run = digit_run(i)
+        if code_set == "C":
+            if run >= 2:
+                values.append(int(data[i:i + 2]))
+                i += 2
+            else:
+                values.append(100)      # Code B
+                code_set = "B"
+        elif run >= 4 and run % 2 == 0:
+            values.append(99)           # Code C
+            code_set = "C"
+        else:
+            values.append(ord(data[i]) - 32)
+            i += 1
+    return values, code_set
+
+
+@functools.lru_cache(maxsize=256)
+def _gs1_128_symbol(fmt, po_number, description, total_boxes):
+    """
+    Per-description GS1-128 layout: the encoded prefix up to AI (90), its
+    checksum contribution, a module width that fits the longest n/total plus a
+    quiet zone on both sides, and the x offsets of the prefix and the suffix.
+    """
+    po_value, item_code = _label_barcode_fields(po_number, description)
+    values, code_set = _code128_encode(f"{_GS1_FNC1}400{po_value}{_GS1_FNC1}241{item_code}{_GS1_FNC1}90")
+    weighted = values[0] + sum(i * v for i, v in enumerate(values[1:], 1))
+    prefix_modules = sum(_code128_runs(v)[1] for v in values)
+    # A code-set switch never costs more than one symbol over the character count
+    suffix_modules = (len(f"{total_boxes}/{total_boxes}") + 1) * 11 + 11 + 13
+    x, y, w, h = _label_barcode_area(fmt, "gs1-128")
+    quiet = 2 * _CODE128_QUIET_MODULES
+    module_w = min(_BARCODE_MAX_MODULE_PT, w / (prefix_modules + suffix_modules + quiet))
+    start_x = _CODE128_QUIET_MODULES * module_w
+    return tuple(values), code_set, weighted, module_w, start_x, start_x + prefix_modules * module_w
+
+
+def _draw_code128(c, values, x, y, module_w, height):
+    """Fill the bars of consecutive symbol values as a single path."""
+    p = c.beginPath()
+    for v in values:
+        runs, width = _code128_runs(v)
+        for off, w in runs:
+            p.rect(x + off * module_w, y, w * module_w, height)
+        x += width * module_w
+    c.drawPath(p, stroke=0, fill=1)
+
+
+# --- QR ---
+# Splitting a QR code into static and per-label modules needs reportlab's
+# qrencoder internals (makeImpl, dataPosIterator, createData, QRUtil.getMask),
+# which the public widget doesn't expose; requirements.txt pins reportlab to
+# the tested minor version. If a reportlab without them is installed anyway,
+# each label draws its whole symbol through the public QrCodeWidget instead.
+
+def _qr_payload(po_number, description, box_num, total_boxes):
+    # GS1 QR (FNC1 in first position): '%' is the GS separator in alphanumeric mode
+    po_value, item_code = _label_barcode_fields(po_number, description)
+    return f"400{po_value}%241{item_code}%90{box_num}/{total_boxes}"
+
+
+@functools.lru_cache(maxsize=64)
+def _qr_static(version):
+    """
+    Everything about a version-`version` QR code (level M, fixed mask) that
+    doesn't depend on the data: module count, dark function-pattern modules,
+    the data module positions in placement order and their mask bits.
+    """
+    from reportlab.graphics.barcode import qrencoder
+    qr = qrencoder.QRCode(version, qrencoder.QRErrorCorrectLevel.M)
+    qr.addData(qrencoder.QRFNC1First())
+    qr.addData("0")
+    qr.makeImpl(False, _BARCODE_QR_MASK)
+    n = qr.moduleCount
+    positions = tuple(qr.dataPosIterator())
+    data_cells = set(positions)
+    static = tuple(
+        (col, row) for row in range(n) for col in range(n)
+        if qr.modules[row][col] and (col, row) not in data_cells
+    )
+    mask = qrencoder.QRUtil.getMask(_BARCODE_QR_MASK)
+    return n, static, positions, tuple(bool(mask(row, col)) for col, row in positions)
+
+
+@functools.lru_cache(maxsize=256)
+def _qr_version(po_number, description, total_boxes):
+    """Smallest version that holds the longest payload of the description."""
+    from reportlab.graphics.barcode import qrencoder
+    qr = qrencoder.QRCode(None, qrencoder.QRErrorCorrectLevel.M)
+    qr.addData(qrencoder.QRFNC1First())
+    qr.addData(qrencoder.QRAlphaNum(_qr_payload(po_number, description, total_boxes, total_boxes)))
+    return qr.calculate_version()
+
+
+def _qr_data_cells(version, payload):
+    """Dark data modules for payload — the per-label part of the symbol."""
+    from reportlab.graphics.barcode import qrencoder
+    n, _, positions, mask_bits = _qr_static(version)
+    data = qrencoder.QRCode.createData(
+        version, qrencoder.QRErrorCorrectLevel.M,
+        [qrencoder.QRFNC1First(), qrencoder.QRAlphaNum(payload)],
+    )
+    bits = itertools.chain(
+        (bool(byte & (0x80 >> k)) for byte in data for k in range(8)), itertools.repeat(False)
+    )
+    return [pos for pos, bit, m in zip(positions, bits, mask_bits) if bit != m]
+
+
+@functools.lru_cache(maxsize=1)
+def _qr_split_available() -> bool:
+    """Whether the installed qrencoder still has the internals the static/per-label split uses."""
+    try:
+        _qr_data_cells(_qr_version("PO", "", 1), _qr_payload("PO", "", 1, 1))
+    except (AttributeError, TypeError) as e:
+        log.warning(f"[labels] reportlab qrencoder internals changed ({e!r}) — drawing QR codes whole per label")
+        return False
+    return True
+
+
+def _draw_qr_widget(c, payload, x, y, size):
+    """The whole GS1 QR symbol for payload, through reportlab's public QrCodeWidget."""
+    from reportlab.graphics import renderPDF
+    from reportlab.graphics.barcode import qrencoder
+    from reportlab.graphics.barcode.qr import QrCodeWidget
+    from reportlab.graphics.shapes import Drawing
+    widget = QrCodeWidget(
+        [qrencoder.QRFNC1First(), qrencoder.QRAlphaNum(payload)],
+        barLevel="M", barBorder=0, barWidth=size, barHeight=size,
+    )
+    renderPDF.draw(Drawing(size, size, widget), c, x, y)
+
+
+def _draw_qr_cells(c, cells, x, y, n, module):
+    """Fill QR modules (col, row from the top-left) as one path of horizontal runs."""
+    rows = collections.defaultdict(list)
+    for col, row in cells:
+        rows[row].append(col)
+    p = c.beginPath()
+    for row, cols in rows.items():
+        cols.sort()
+        start = prev = cols[0]
+        for col in cols[1:] + [None]:
+            if col == prev + 1:
+                prev = col
+                continue
+            p.rect(x + start * module, y + (n - 1 - row) * module, (prev - start + 1) * module, module)
+            start = prev = col
+    c.drawPath(p, stroke=0, fill=1)
+
+
+def _draw_label_barcode_static(c, fmt, barcode, po_number, description, total_boxes):
+    """The description-invariant part of the barcode, in label-local coordinates."""
+    x, y, w, h = _label_barcode_area(fmt, barcode)
+    if barcode == "qr":
+        if _qr_split_available():   # else the whole symbol is drawn per label
+            n, static, _, _ = _qr_static(_qr_version(po_number, description, total_boxes))
+            _draw_qr_cells(c, static, x, y, n, w / n)
+    else:
+        values, _, _, module_w, start_x, _ = _gs1_128_symbol(
+            fmt, po_number, description, total_boxes
+        )
+        _draw_code128(c, values, x + start_x, y, module_w, h)
+
+
+def _draw_label_barcode(c, lx, ly, fmt, barcode, po_number, description, box_num, total_boxes):
+    """The per-carton part of the barcode, at label origin (lx, ly)."""
+    x, y, w, h = _label_barcode_area(fmt, barcode)
+    if barcode == "qr":
+        if not _qr_split_available():
+            _draw_qr_widget(c, _qr_payload(po_number, description, box_num, total_boxes), lx + x, ly + y, w)
+            return
+        version = _qr_version(po_number, description, total_boxes)
+        n = _qr_static(version)[0]
+        cells = _qr_data_cells(version, _qr_payload(po_number, description, box_num, total_boxes))
+        _draw_qr_cells(c, cells, lx + x, ly + y, n, w / n)
+    else:
+        values, code_set, weighted, module_w, _, suffix_x = _gs1_128_symbol(
+            fmt, po_number, description, total_boxes
+        )
+        suffix, _ = _code128_encode(f"{box_num}/{total_boxes}", code_set)
+        check = (weighted + sum(i * v for i, v in enumerate(suffix, len(values)))) % 103
+        _draw_code128(c, suffix + [check, _CODE128_STOP], lx + x + suffix_x, ly + y, module_w, h)
+
+
+def _draw_label_static(c, customer_name, po_number, description, barcode, total_boxes, fmt):
+    """
+    Customer name, wrapped description, PO# and the static part of the
+    barcode — identical for every carton of a description.
+    """
+    pad = fmt.padding
+    text_w = fmt.label_w - 2 * pad      # max width available for text
+    c.setFillColorRGB(0, 0, 0)
+
+    # --- Layout top-down ---
+    NAME_SIZE = 10
+    DESC_SIZE = 8
+    PO_SIZE   = 8
+
+    cursor = fmt.label_h - pad  # start just below top edge
+
+    # Customer name
+    c.setFont("Helvetica-Bold", NAME_SIZE)
+    c.drawString(pad, cursor - NAME_SIZE, customer_name)
+    cursor -= NAME_SIZE + 3
+
+    # Description — wrap to fmt.desc_lines (2 on OL5350) if too long
+    c.setFont("Helvetica", DESC_SIZE)
+    for line in _wrap_label_text(description, "Helvetica", DESC_SIZE, text_w, fmt.desc_lines):
+        c.drawString(pad, cursor - DESC_SIZE, line)
+        cursor -= DESC_SIZE + 2
+
+    # PO#
+    c.setFont("Helvetica", PO_SIZE)
+    c.drawString(pad, cursor - PO_SIZE, f"PO# {po_number}")
+
+    if barcode:
+        _draw_label_barcode_static(c, fmt, barcode, po_number, description, total_boxes)
+
+
+def _draw_label_at_origin(c, customer_name, po_number, description, box_num, total_boxes, qty,
+                          forms, fmt, barcode):
+    """
+    Draw a single shipping label with its corner at the canvas origin. No border.
+
+    The invariant block (customer, description, PO#) is a Form XObject shared
+    by every label with the same description; only BOX/QTY (and the box part
+    of the barcode, if any) are drawn per label.
+    Pass the same `forms` dict for every label on a canvas.
+    """
+    c.doForm(_label_form(
+        c, forms, ("ship", customer_name, po_number, description, barcode, total_boxes), fmt,
+        _draw_label_static, customer_name, po_number, description, barcode, total_boxes,
+    ))
+
+    pad = fmt.padding
+    qty_right = fmt.label_w - pad
+    if barcode:
+        _draw_label_barcode(c, 0, 0, fmt, barcode, po_number, description, box_num, total_boxes)
+        if barcode == "qr":
+            qty_right = _label_barcode_area(fmt, barcode)[0] - 3   # left of the QR code
+
+    # --- BOX / QTY — fixed position from bottom, raised to avoid cut-off ---
+    # One text object in the default (black) fill, no per-label state resets
+    BOX_SIZE = 9
+    qty_text = f"QTY: {qty:,}"
+    t = c.beginText(pad, fmt.box_baseline)
+    t.setFont("Helvetica-Bold", BOX_SIZE)
+    t.textOut(f"BOX: {box_num}/{total_boxes}")
+    t.setTextOrigin(qty_right - c.stringWidth(qty_text, "Helvetica-Bold", BOX_SIZE), fmt.box_baseline)
+    t.textOut(qty_text)
+    c.drawText(t)
+
+
+# ---------------------------------------------------------------------------
+# ZPL output for thermal label printers
+# ---------------------------------------------------------------------------
+# Same label plans as the PDF builders, emitted as ZPL II so Zebra printers
+# skip the rasterize-and-spool step. The static text of each description
+# (shipping) or SKU (prelim) is downloaded once as a stored format (^DF);
+# shipping labels then recall it (^XF) with only their BOX/QTY field data, and
+# prelim labels — identical within a SKU — print it num_labels times with ^PQ.
+# Label size and layout follow the sheet format, converted to printer dots.
+
+LABEL_ZPL_DPI = int(os.environ.get("LABEL_ZPL_DPI", "203"))
+# Also upload a .zpl next to every labels PDF from the webhooks
+LABEL_ZPL_OUTPUT = os.environ.get("LABEL_ZPL_OUTPUT", "").lower() in ("1", "true", "yes")
+
+_ZPL_NAME_SIZE = 10   # pt — same type sizes as the PDF labels
+_ZPL_TEXT_SIZE = 8
+_ZPL_BOX_SIZE = 9
+
+
+def _zpl_dots(pt, dpi):
+    return round(pt * dpi / 72)
+
+
+def _zpl_field_data(text):
+    """Escape text for ^FH field data: ^ ~ _ and non-ASCII bytes become _XX (UTF-8 under ^CI28)."""
+    return "".join(
+        "".join(f"_{b:02X}" for b in ch.encode("utf-8"))
+        if ch in "^~_" or not " " <= ch <= "}" else ch
+        for ch in str(text)
+    )
+
+
+def _zpl_text(x, y, size, text, dpi, block_w=None, align="L"):
+    """One text field; x/y are pt from the label's top-left, size in pt."""
+    h = _zpl_dots(size, dpi)
+    field = f"^FO{_zpl_dots(x, dpi)},{_zpl_dots(y, dpi)}^A0N,{h},{h}"
+    if block_w:
+        field += f"^FB{_zpl_dots(block_w, dpi)},1,0,{align}"
+    return field + f"^FH^FD{_zpl_field_data(text)}^FS"
+
+
+def _zpl_static_fields(fmt, dpi, heading, description, po_text, desc_lines):
+    """Heading, wrapped description and PO line, laid out like _draw_label_static."""
+    pad = fmt.padding
+    text_w = fmt.label_w - 2 * pad
+    y = pad
+    fields = [_zpl_text(pad, y, _ZPL_NAME_SIZE, heading, dpi)]
+    y += _ZPL_NAME_SIZE + 3
+    for line in _wrap_label_text(description, "Helvetica", _ZPL_TEXT_SIZE, text_w, desc_lines):
+        fields.append(_zpl_text(pad, y, _ZPL_TEXT_SIZE, line, dpi))
+        y += _ZPL_TEXT_SIZE + 2
+    fields.append(_zpl_text(pad, y, _ZPL_TEXT_SIZE, po_text, dpi))
+    return "".join(fields)
+
+
+def _zpl_setup(fmt, dpi):
+    return (
+        f"^XA^CI28^PW{_zpl_dots(fmt.label_w, dpi)}^LL{_zpl_dots(fmt.label_h, dpi)}"
+        f"^LH0,0^XZ\n"
+    )
+
+
+def _zpl_cleanup(names):
+    """Delete exactly the stored formats this job downloaded from printer DRAM."""
+    if not names:
+        return ""
+    return "^XA" + "".join(f"^IDR:{name}.ZPL^FS" for name in names) + "^XZ\n"
+
+
+def build_labels_zpl(customer_name, po_number, grouped_items, out_path, sheet_format=None,
+                     dpi=LABEL_ZPL_DPI):
+    """
+    Write the shipping labels as ZPL: one stored format per description, then
+    one short ^XF recall per carton carrying only BOX/QTY.
+    Returns the total number of labels.
+    """
+    fmt = get_label_sheet_format(sheet_format)
+    pad = fmt.padding
+    box_top = fmt.label_h - fmt.box_baseline - _ZPL_BOX_SIZE
+    formats = {}
+    count = 0
+    with open(out_path, "w", encoding="ascii", newline="\n") as out:
+        out.write(_zpl_setup(fmt, dpi))
+        for desc, box_num, total, qty in _iter_label_plan(grouped_items):
+            name = formats.get(desc)
+            if name is None:
+                name = formats[desc] = f"S{len(formats)}"
+                box_h = _zpl_dots(_ZPL_BOX_SIZE, dpi)
+                out.write(
+                    f"^XA^DFR:{name}.ZPL^FS"
+                    + _zpl_static_fields(fmt, dpi, customer_name, desc, f"PO# {po_number}",
+                                         fmt.desc_lines)
+                    + f"^FO{_zpl_dots(pad, dpi)},{_zpl_dots(box_top, dpi)}"
+                      f"^A0N,{box_h},{box_h}^FN1^FS"
+                    + f"^FO{_zpl_dots(pad, dpi)},{_zpl_dots(box_top, dpi)}"
+                      f"^A0N,{box_h},{box_h}^FB{_zpl_dots(fmt.label_w - 2 * pad, dpi)},1,0,R^FN2^FS"
+                    + "^XZ\n"
+                )
+            out.write(
+                f"^XA^XFR:{name}.ZPL^FN1^FDBOX: {box_num}/{total}^FS"
+                f"^FN2^FDQTY: {qty:,}^FS^XZ\n"
+            )
+            count += 1
+        out.write(_zpl_cleanup(formats.values()))
+    log.info(
+        f"Generated labels ZPL: {count} labels, {len(formats)} formats → {out_path} "
+        f"({Path(out_path).stat().st_size:,} bytes)"
+    )
+    return count
+
+
+# ---------------------------------------------------------------------------
+# Label plan metadata and revisions
+# ---------------------------------------------------------------------------
+# Every labels PDF carries the grouped plan it was built from in its document
+# info (/LabelPlan, written as a small incremental update). When a revised
+# packing slip arrives, the plan in the item's latest Shipping Labels PDF is
+# diffed against the new one by (description, box #), and a delta PDF holding
+# only new or changed labels is uploaded alongside the full set. Box numbers
+# come from the full plan, so every delta label matches its full-set twin.
+
+LABEL_PLAN_VERSION = 1
+LABEL_DELTA_UPLOAD = os.environ.get("LABEL_DELTA_UPLOAD", "1").lower() not in ("0", "false", "no")
+
+
+def _label_plan_doc(customer_name, po_number, grouped_items, sheet_format=None, barcode=None):
+    return {
+        "v": LABEL_PLAN_VERSION,
+        "customer": customer_name,
+        "po": po_number,
+        "sheet": get_label_sheet_format(sheet_format).name,
+        "barcode": _resolve_label_barcode(barcode),
+        "groups": grouped_items,
+    }
+
+
+def _stamp_label_plan(pdf_path, plan: dict) -> None:
+    """Store the label plan in the PDF's document info without rewriting the pages."""
+    from pypdf import PdfWriter
+    pdf_path = Path(pdf_path)
+    tmp_path = pdf_path.with_suffix(".stamp.pdf")
+    writer = PdfWriter(str(pdf_path), incremental=True)
+    writer.add_metadata({"/LabelPlan": json.dumps(plan, separators=(",", ":"))})
+    writer.write(str(tmp_path))
+    os.replace(tmp_path, pdf_path)
+
+
+def _read_label_plan(pdf_path) -> dict | None:
+    """The label plan stored in a labels PDF, or None if it has none (or an older version)."""
+    from pypdf import PdfReader
+    try:
+        raw = (PdfReader(str(pdf_path)).metadata or {}).get("/LabelPlan")
+        plan = json.loads(raw) if raw else None
+    except Exception as e:
+        log.warning(f"[labels] could not read label plan from {pdf_path}: {e}")
+        return None
+    if not plan or plan.get("v") != LABEL_PLAN_VERSION:
+        return None
+    return plan
+
+
+def diff_label_plans(old_groups, new_groups) -> tuple:
+    """
+    Compare two grouped label plans label by label, keyed by (description, box #).
+
+    Returns (changed, removed): the set of keys in the new plan whose label is
+    new or prints differently (total boxes or qty), and the sorted keys that
+    only exist in the old plan.
+    """
+    old = {(d, b): (t, q) for d, b, t, q in _iter_label_plan(old_groups)}
+    changed = set()
+    for desc, box_num, total, qty in _iter_label_plan(new_groups):
+        if old.pop((desc, box_num), None) != (total, qty):
+            changed.add((desc, box_num))
+    return changed, sorted(old)
+
+
+def build_labels_delta_pdf(customer_name, po_number, grouped_items, changed, out_path,
+                           sheet_format=None, barcode=None):
+    """Render only the labels whose (description, box #) is in `changed`. Returns the label count."""
+    fmt = get_label_sheet_format(sheet_format)
+    barcode = _resolve_label_barcode(barcode)
+    plan = (e for e in _iter_label_plan(grouped_items) if (e[0], e[1]) in changed)
+    c = _label_canvas(out_path, fmt)
+    count = _render_shipping_labels(c, customer_name, po_number, barcode, plan, fmt)
+    _save_label_canvas(c, out_path)
+    _log_label_pdf("labels delta", count, out_path)
+    return count
+
+
+def _fetch_previous_label_plan(item_id, tmp_dir) -> dict | None:
+    """Label plan of the item's most recent Shipping Labels PDF, if any."""
+    url, name = get_latest_file_url(item_id, SHIPPING_LABELS_COLUMN_ID, suffix=".pdf")
+    if not url:
+        return None
+    path = Path(tmp_dir) / "previous_labels.pdf"
+    download_file(url, path)
+    plan = _read_label_plan(path)
+    path.unlink()
+    if plan is None:
+        log.info(f"[labels] previous labels '{name}' carry no label plan — no delta")
+    return plan
+
+
+def _label_delta(previous: dict | None, current: dict):
+    """
+    Labels to reprint after a revision: (changed, removed), or None when there
+    is nothing to diff against or the whole set has to be reprinted anyway.
+    """
+    if previous is None:
+        return None
+    header = ("customer", "po", "sheet", "barcode")
+    if any(previous.get(k) != current[k] for k in header):
+        log.info("[labels] customer, PO or label format changed since the last labels — no delta")
+        return None
+    changed, removed = diff_label_plans(previous["groups"], current["groups"])
+    total = sum(g["total_cartons"] for g in current["groups"])
+    log.info(
+        f"[labels] revision: {len(changed)} of {total} labels new or changed, "
+        f"{len(removed)} no longer in the plan"
+    )
+    for desc, box_num in removed[:20]:
+        log.info(f"[labels]   removed: '{desc}' box {box_num}")
+    if len(changed) == total:
+        return None
+    return changed, removed
+
+
+# ---------------------------------------------------------------------------
+# End-to-end processing
+# ---------------------------------------------------------------------------
+
+@_timed_pipeline("packing_slip")
+def _process_packing_slip(item_id):
+    """Download packing slip, parse it, generate labels, upload to Monday."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_in = Path(tmp) / "packing_slip.pdf"
+        pdf_out = Path(tmp) / f"shipping_labels_{item_id}.pdf"
+
+        log.info(f"Fetching packing slip file URL for item {item_id}")
+        with _stage("packing_slip", "monday_query"):
+            url, filename = get_packing_slip_url(item_id)
+        log.info(f"Downloading: {filename}")
+        with _stage("packing_slip", "download"):
+            download_file(url, pdf_in)
+
+        log.info("Parsing packing slip")
+        with _stage("packing_slip", "parse"):
+            parsed = parse_packing_slip(pdf_in)
+
+        if not parsed["line_items"]:
+            raise RuntimeError("No line items found in packing slip — check PDF format")
+
+        grouped = group_line_items(parsed["line_items"])
+        total_labels = sum(g["total_cartons"] for g in grouped)
+        plan = _label_plan_doc(parsed["customer_name"], parsed["po_number"], grouped)
+
+        previous = None
+        if LABEL_DELTA_UPLOAD:
+            try:
+                with _stage("packing_slip", "previous_labels"):
+                    previous = _fetch_previous_label_plan(item_id, tmp)
+            except Exception as e:
+                log.warning(f"[labels] could not fetch previous labels for item {item_id}: {e}")
+
+        log.info(
+            f"Generating {total_labels} labels for "
+            f"'{parsed['customer_name']}' PO# {parsed['po_number']}"
+        )
+        if total_labels > LABEL_STREAM_MIN_LABELS:
+            # Large run: render in parts and upload each as soon as it's saved
+            with _stage("packing_slip", "render") as render:
+                def upload_part(path, part_no, count):
+                    log.info(f"Uploading labels part {part_no} ({count} labels) to Monday.com")
+                    _stamp_label_plan(path, plan)
+                    with _stage("packing_slip", "upload") as upload:
+                        upload_labels_to_monday(item_id, path)
+                    render.excluded += upload.seconds
+                    path.unlink()
+
+                build_labels_pdf_parts(
+                    parsed["customer_name"], parsed["po_number"], grouped,
+                    tmp, f"shipping_labels_{item_id}", on_part=upload_part,
+                )
+        else:
+            with _stage("packing_slip", "render"):
+                build_labels_pdf(parsed["customer_name"], parsed["po_number"], grouped, pdf_out)
+                _stamp_label_plan(pdf_out, plan)
+
+            log.info("Uploading labels to Monday.com")
+            with _stage("packing_slip", "upload"):
+                upload_labels_to_monday(item_id, pdf_out)
+        _metrics.inc("labels_total", total_labels, kind="shipping")
+
+        delta = _label_delta(previous, plan)
+        if delta and delta[0]:
+            # Uploaded last and stamped with the full plan, so the next revision
+            # diffs against the current set whichever file it picks up
+            delta_out = Path(tmp) / f"shipping_labels_{item_id}_delta.pdf"
+            with _stage("packing_slip", "render_delta"):
+                build_labels_delta_pdf(
+                    parsed["customer_name"], parsed["po_number"], grouped, delta[0], delta_out
+                )
+                _stamp_label_plan(delta_out, plan)
+            log.info("Uploading labels delta to Monday.com")
+            with _stage("packing_slip", "upload"):
+                upload_labels_to_monday(item_id, delta_out)
+
+        if LABEL_ZPL_OUTPUT:
+            # ZPL stays small at any label count, so it is always a single file
+            zpl_out = pdf_out.with_suffix(".zpl")
+            with _stage("packing_slip", "render_zpl"):
+                build_labels_zpl(parsed["customer_name"], parsed["po_number"], grouped, zpl_out)
+            with _stage("packing_slip", "upload"):
+                upload_labels_to_monday(item_id, zpl_out)
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+
+@app.route("/webhook/monday", methods=["GET"])
+def webhook_verify():
+    """Monday.com webhook URL verification."""
+    challenge = request.args.get("challenge")
+    if challenge:
+        return jsonify({"challenge": challenge})
+    return "OK", 200
+
+
+@app.route("/webhook/monday", methods=["POST"])
+@_profiled_route("packing_slip")
+@_traced_webhook("packing_slip")
+def webhook_handler():
+    try:
+        body = request.get_json(force=True, silent=True) or {}
+
+        # Monday.com sends a JSON challenge on first registration
+        if "challenge" in body:
+            return jsonify({"challenge": body["challenge"]})
+
+        event = body.get("event", body)
+        item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
+        column_id = event.get("columnId") or event.get("column_id")
+
+        log.info(f"Webhook — item={item_id}, column={column_id}")
+
+        if not item_id:
+            log.warning("No item_id in webhook payload, ignoring")
+            return jsonify({"status": "ignored", "reason": "no item_id"}), 200
+
+        if column_id and column_id != PACKING_SLIP_COLUMN_ID:
+            log.info(f"Column {column_id} is not Packing Slip, ignoring")
+            return jsonify({"status": "ignored", "reason": "wrong column"}), 200
+
+        try:
+            _process_packing_slip(item_id)
+        except Exception as exc:
+            log.exception(f"Processing error for item {item_id}: {exc}")
+            return jsonify({"status": "error", "message": str(exc)}), 200
+
+        return jsonify({"status": "ok"}), 200
+
+    except Exception as exc:
+        log.exception(f"Unexpected webhook error: {exc}")
+        return jsonify({"status": "error", "message": str(exc)}), 200
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Stage timings and counters since this process started (Prometheus text format)."""
+    return _metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+# ---------------------------------------------------------------------------
+# Local test endpoints (do not use in production)
+# ---------------------------------------------------------------------------
+
+@app.route("/test-parse", methods=["POST"])
+def test_parse():
+    """
+    Test PDF parsing without Monday.com.
+    Usage: curl -X POST -F "file=@packing_slip.pdf" http://localhost:5000/test-parse
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file provided — use form field 'file'"}), 400
+    f = request.files["file"]
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        f.save(tmp.name)
+        parsed = parse_packing_slip(tmp.name)
+    grouped = group_line_items(parsed["line_items"])
+    return jsonify({
         "customer_name": parsed["customer_name"],
         "po_number": parsed["po_number"],
         "grouped_items": grouped,
@@ -554,14 +2178,23 @@ def test_parse():
 
 
 @app.route("/test-labels", methods=["POST"])
+@_profiled_route("test_labels")
 def test_labels():
     """
     Generate and return the labels PDF for a packing slip.
     Usage: curl -X POST -F "file=@packing_slip.pdf" http://localhost:5000/test-labels -o labels.pdf
+    Add ?sheet=<format> to preview another registered label sheet format, and
+    ?format=zpl to get the ZPL printer stream instead of the PDF.
+    Add ?profile=<PROFILE_SECRET> (or an X-Profile header) to write a cProfile
+    of the run to PROFILE_DIR.
     """
     from flask import send_file
     if "file" not in request.files:
         return jsonify({"error": "No file provided — use form field 'file'"}), 400
+    try:
+        fmt = get_label_sheet_format(request.args.get("sheet"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     f = request.files["file"]
     with tempfile.TemporaryDirectory() as tmp:
         pdf_in = Path(tmp) / "input.pdf"
@@ -569,7 +2202,20 @@ def test_labels():
         f.save(pdf_in)
         parsed = parse_packing_slip(pdf_in)
         grouped = group_line_items(parsed["line_items"])
-        build_labels_pdf(parsed["customer_name"], parsed["po_number"], grouped, pdf_out)
+        if request.args.get("format") == "zpl":
+            zpl_out = pdf_out.with_suffix(".zpl")
+            build_labels_zpl(
+                parsed["customer_name"], parsed["po_number"], grouped, zpl_out, sheet_format=fmt
+            )
+            return send_file(
+                zpl_out,
+                mimetype="text/plain",
+                as_attachment=True,
+                download_name="shipping_labels.zpl",
+            )
+        build_labels_pdf(
+            parsed["customer_name"], parsed["po_number"], grouped, pdf_out, sheet_format=fmt
+        )
         return send_file(
             pdf_out,
             mimetype="application/pdf",
@@ -578,12 +2224,6 @@ def test_labels():
         )
 
 
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5001))
-    log.info(f"Starting server on port {port}")
-    app.run(host="0.0.0.0", port=port, debug=True)
-
-
 # ---------------------------------------------------------------------------
 # Prelim Label Feature — Job Ticket Webhook
 # Triggered when a Job Ticket PDF is uploaded to the Job Ticket column.
@@ -596,7 +2236,7 @@ JOB_TICKET_COLUMN_ID = "file_mksn8rw8"
 PRELIM_LABEL_COLUMN_ID = "file_mm2cy8fm"
 
 
-def get_job_ticket_url(item_id):
+def get_job_ticket_url(item_id, deadline: float | None = None):
     """Return the (url, name) of the most recent file in the Job Ticket column."""
     query = """
     query GetJobTicket($itemId: ID!) {
@@ -616,7 +2256,7 @@ def get_job_ticket_url(item_id):
       }
     }
     """
-    data = monday_request(query, {"itemId": str(item_id)})
+    data = monday_request(query, {"itemId": str(item_id)}, deadline)
     items = data.get("data", {}).get("items", [])
     if not items:
         raise RuntimeError(f"Item {item_id} not found")
@@ -640,7 +2280,9 @@ def parse_job_ticket(pdf_path):
 
     Handles four known field naming conventions:
       - Pouch JT:          has "POUCH TYPE" field; QTY TO PRINT{A-RR}, DETAIL  SKU{A-O} / DETAIL SKU{P+}
-      - Non-Pouch JT:      has "QTY TO PRINTA" but no "POUCH TYPE"; Item # in single-letter field (A-N)
+                           (rows on added pages carry a _P{page} suffix)
+      - Non-Pouch JT:      has "QTY TO PRINTA" but no "POUCH TYPE"; Item # in single-letter field (A-N),
+                           then overflow rows P{page}_R{row}_ITEM / _QTY on pages P2, P3, …
       - Old Smokiez/DANK:  has "QTY TO PRINTRow1"; description in "NOTESRow1" or "ITEM Row1"
       - WCC-style numbered: has "07 Text Field 4"; rows at Text Field 14/15, 19/20, … (+5 per row)
 
@@ -659,6 +2301,14 @@ def parse_job_ticket(pdf_path):
 
     reader = PdfReader(str(pdf_path))
     fields = reader.get_fields() or {}
+    # The Non-Pouch P2–P4 overflow widgets aren't registered in the AcroForm
+    # field list; read those straight off the page annotations
+    for page in reader.pages:
+        for annot in page.get("/Annots") or ():
+            annot = annot.get_object()
+            name = annot.get("/T")
+            if annot.get("/Subtype") == "/Widget" and name is not None and str(name) not in fields:
+                fields[str(name)] = annot
 
     def field_val(name):
         f = fields.get(name)
@@ -727,9 +2377,15 @@ def parse_job_ticket(pdf_path):
             + ["AA", "BB", "CC", "DD", "EE", "FF", "GG", "HH", "II", "JJ",
                "KK", "LL", "MM", "NN", "OO", "PP", "QQ", "RR"]
         )
-        for row in rows_ao + rows_p_plus:
-            qty = parse_qty(field_val(f"QTY TO PRINT{row}"))
-            detail_key = f"DETAIL  SKU{row}" if row in rows_ao else f"DETAIL SKU{row}"
+        rows = [(row, "") for row in rows_ao + rows_p_plus]
+        # Long orders continue on added pages: "QTY TO PRINTP_P3", "DETAIL SKUP_P3", …
+        page = 3
+        while f"QTY TO PRINT{rows_p_plus[0]}_P{page}" in fields:
+            rows += [(row, f"_P{page}") for row in rows_p_plus]
+            page += 1
+        for row, sfx in rows:
+            qty = parse_qty(field_val(f"QTY TO PRINT{row}{sfx}"))
+            detail_key = f"DETAIL  SKU{row}" if row in rows_ao else f"DETAIL SKU{row}{sfx}"
             description = field_val(detail_key)
             if qty > 0 and description:
                 skus.append({"description": description, "num_labels": math.ceil(qty / 400)})
@@ -750,6 +2406,16 @@ def parse_job_ticket(pdf_path):
             description = field_val(L)  # "Item #" column
             if qty > 0 and description:
                 skus.append({"description": description, "num_labels": math.ceil(qty / 400)})
+        # Overflow pages P2, P3, … (24 rows each); P2 rows 01–14 carry a _P2 suffix
+        page = 2
+        while f"P{page}_R01_ITEM{'_P2' if page == 2 else ''}" in fields:
+            for r in range(1, 25):
+                sfx = "_P2" if page == 2 and r <= 14 else ""
+                qty = parse_qty(field_val(f"P{page}_R{r:02d}_QTY{sfx}"))
+                description = field_val(f"P{page}_R{r:02d}_ITEM{sfx}")
+                if qty > 0 and description:
+                    skus.append({"description": description, "num_labels": math.ceil(qty / 400)})
+            page += 1
     elif has_row_numbers:
         # Old Smokiez / DANK format: numbered rows Row1–Row20 + Row1_2–Row10_2
         row_ids = [str(n) for n in range(1, 21)] + [f"{n}_2" for n in range(1, 11)]
@@ -787,76 +2453,138 @@ def parse_job_ticket(pdf_path):
     }
 
 
-def _draw_prelim_label(c, x, y, client_name, po_display, description):
-    """Draw a single prelim label. Same dimensions as shipping labels; no BOX/QTY."""
-    pad = LABEL_PAD
-    text_w = LABEL_W - 2 * pad
-
-    c.saveState()
-    clip = c.beginPath()
-    clip.rect(x, y, LABEL_W, LABEL_H)
-    c.clipPath(clip, stroke=0, fill=0)
+def _draw_prelim_label_static(c, client_name, po_display, description, fmt):
+    """Prelim label content in label-local coordinates (drawn once per SKU as a form)."""
+    pad = fmt.padding
+    text_w = fmt.label_w - 2 * pad
     c.setFillColorRGB(0, 0, 0)
 
     NAME_SIZE = 10
     DESC_SIZE = 8
     PO_SIZE = 8
 
-    cursor = y + LABEL_H - pad
+    cursor = fmt.label_h - pad
 
     # Client name (bold)
     c.setFont("Helvetica-Bold", NAME_SIZE)
-    c.drawString(x + pad, cursor - NAME_SIZE, client_name)
+    c.drawString(pad, cursor - NAME_SIZE, client_name)
     cursor -= NAME_SIZE + 3
 
-    # SKU description — wrap up to 3 lines
+    # SKU description — no BOX/QTY row, so one more line than shipping labels (3 on OL5350)
     c.setFont("Helvetica", DESC_SIZE)
-    desc_lines = simpleSplit(description, "Helvetica", DESC_SIZE, text_w)[:3]
-    for line in desc_lines:
-        c.drawString(x + pad, cursor - DESC_SIZE, line)
+    for line in _wrap_label_text(description, "Helvetica", DESC_SIZE, text_w, fmt.desc_lines + 1):
+        c.drawString(pad, cursor - DESC_SIZE, line)
         cursor -= DESC_SIZE + 2
 
     # PO#
     c.setFont("Helvetica", PO_SIZE)
-    c.drawString(x + pad, cursor - PO_SIZE, po_display)
+    c.drawString(pad, cursor - PO_SIZE, po_display)
+
+
+def _iter_prelim_plan(skus):
+    """Lazily yield one description per prelim label, SKU by SKU."""
+    for sku in skus:
+        for _ in range(sku["num_labels"]):
+            yield sku["description"]
+
+
+def _prelim_po_display(po_number):
+    return f"PO# {po_number}" if not po_number.upper().startswith("PO#") else po_number
+
 
-    c.restoreState()
+def _render_prelim_labels(c, client_name, po_display, plan, fmt):
+    """Draw every prelim label in `plan` onto canvas c, one sheet per page. Returns the label count."""
+    forms = {}
+    i = 0
+    for description in _iter_label_slots(c, fmt, plan):
+        c.doForm(_label_form(
+            c, forms, ("prelim", client_name, po_display, description), fmt,
+            _draw_prelim_label_static, client_name, po_display, description,
+        ))
+        i += 1
+    return i
 
 
-def build_prelim_labels_pdf(client_name, po_number, skus, out_path):
+def build_prelim_labels_pdf(client_name, po_number, skus, out_path, parallel=None,
+                            sheet_format=None):
     """
-    Generate a merged prelim labels PDF (3×7 grid, 21 per page).
+    Generate a merged prelim labels PDF on the given sheet format (default
+    OL5350: 3×7 grid, 21 per page).
     Labels from all SKUs fill the grid continuously — no wasted space between SKUs.
-    Returns total label count.
+    Returns total label count. `parallel` works as in build_labels_pdf.
     """
-    po_display = f"PO# {po_number}" if not po_number.upper().startswith("PO#") else po_number
-
-    all_descriptions = []
-    for sku in skus:
-        for _ in range(sku["num_labels"]):
-            all_descriptions.append(sku["description"])
+    fmt = get_label_sheet_format(sheet_format)
+    po_display = _prelim_po_display(po_number)
+
+    total = sum(sku["num_labels"] for sku in skus)
+    if parallel is None:
+        # Profiled requests render in-process, where the profiler can see it
+        parallel = (total > LABEL_PARALLEL_MIN_LABELS and LABEL_RENDER_WORKERS > 1
+                    and _active_profile.get() is None)
+    if parallel and total:
+        count = _render_labels_parallel(
+            "prelim", (client_name, po_display), skus, total, out_path, fmt
+        )
+        if count is not None:
+            _log_label_pdf("prelim labels", count, out_path)
+            return count
 
-    c = canvas.Canvas(str(out_path), pagesize=letter)
+    c = _label_canvas(out_path, fmt)
+    total = _render_prelim_labels(c, client_name, po_display, _iter_prelim_plan(skus), fmt)
 
-    if not all_descriptions:
+    if not total:
         c.setFont("Helvetica", 10)
-        c.drawString(H_LEFT_MARGIN, PAGE_HEIGHT / 2, "No SKUs found in Job Ticket")
-        c.save()
+        c.drawString(fmt.left_margin, fmt.page_h / 2, "No SKUs found in Job Ticket")
+        _save_label_canvas(c, out_path)
         return 0
 
-    for i, description in enumerate(all_descriptions):
-        if i > 0 and i % LABELS_PER_PAGE == 0:
-            c.showPage()
-        lx, ly = _label_origin(i % LABELS_PER_PAGE)
-        _draw_prelim_label(c, lx, ly, client_name, po_display, description)
-
-    c.save()
-    total = len(all_descriptions)
-    log.info(f"Generated prelim labels PDF: {total} labels → {out_path}")
+    _save_label_canvas(c, out_path)
+    _log_label_pdf("prelim labels", total, out_path)
     return total
 
 
-def upload_prelim_labels_to_monday(item_id, pdf_path):
+def build_prelim_labels_pdf_parts(client_name, po_number, skus, out_dir, base_name,
+                                  pages_per_part=LABEL_PART_PAGES, on_part=None,
+                                  sheet_format=None):
+    """Streaming variant of build_prelim_labels_pdf — see _build_label_parts."""
+    fmt = get_label_sheet_format(sheet_format)
+    po_display = _prelim_po_display(po_number)
+    return _build_label_parts(
+        _iter_prelim_plan(skus),
+        lambda c, part_plan: _render_prelim_labels(c, client_name, po_display, part_plan, fmt),
+        out_dir, base_name, pages_per_part, fmt, on_part,
+    )
+
+
+def build_prelim_labels_zpl(client_name, po_number, skus, out_path, sheet_format=None,
+                            dpi=LABEL_ZPL_DPI):
+    """
+    Write the prelim labels as ZPL: one stored format per SKU, printed
+    num_labels times with ^PQ. Returns total label count.
+    """
+    fmt = get_label_sheet_format(sheet_format)
+    po_display = _prelim_po_display(po_number)
+    names = []
+    count = 0
+    with open(out_path, "w", encoding="ascii", newline="\n") as out:
+        out.write(_zpl_setup(fmt, dpi))
+        for i, sku in enumerate(s for s in skus if s["num_labels"] > 0):
+            name = f"P{i}"
+            names.append(name)
+            out.write(
+                f"^XA^DFR:{name}.ZPL^FS"
+                + _zpl_static_fields(fmt, dpi, client_name, sku["description"], po_display,
+                                     fmt.desc_lines + 1)
+                + "^XZ\n"
+            )
+            out.write(f"^XA^XFR:{name}.ZPL^PQ{sku['num_labels']}^XZ\n")
+            count += sku["num_labels"]
+        out.write(_zpl_cleanup(names))
+    log.info(f"Generated prelim labels ZPL: {count} labels → {out_path}")
+    return count
+
+
+def upload_prelim_labels_to_monday(item_id, pdf_path, deadline: float | None = None):
     """Upload the prelim labels PDF to the Prelim Label column on Monday.com."""
     token = get_token()
     mutation = """
@@ -874,38 +2602,48 @@ def upload_prelim_labels_to_monday(item_id, pdf_path):
         file_bytes = f.read()
 
     filename = Path(pdf_path).name
-    resp = requests.post(
-        MONDAY_FILE_API_URL,
-        headers={"Authorization": token, "API-Version": "2024-01"},
-        files={
-            "query": (None, mutation),
-            "variables": (None, json.dumps(variables)),
-            "map": (None, json.dumps({"file": ["variables.file"]})),
-            "file": (filename, file_bytes, "application/pdf"),
-        },
-        timeout=60,
-    )
-    resp.raise_for_status()
+    with _span("monday.upload", file=filename, bytes=len(file_bytes)) as span:
+        resp = requests.post(
+            MONDAY_FILE_API_URL,
+            headers={"Authorization": token, "API-Version": "2024-01"},
+            files={
+                "query": (None, mutation),
+                "variables": (None, json.dumps(variables)),
+                "map": (None, json.dumps({"file": ["variables.file"]})),
+                "file": (filename, file_bytes, _upload_mimetype(pdf_path)),
+            },
+            timeout=_budget_timeout(deadline, 60),
+        )
+        span.set(status=resp.status_code)
+        resp.raise_for_status()
     result = resp.json()
     if "errors" in result:
         raise RuntimeError(f"Upload error: {result['errors']}")
+    _metrics.inc("bytes_total", len(file_bytes), direction="upload")
     log.info(f"Uploaded {filename} to Prelim Label column for item {item_id}")
     return result
 
 
-def _process_job_ticket(item_id):
-    """Download job ticket, parse it, generate prelim labels, upload to Monday."""
+@_timed_pipeline("job_ticket")
+def _process_job_ticket(item_id, deadline: float | None = None):
+    """
+    Download job ticket, parse it, generate prelim labels, upload to Monday.
+    `deadline` (absolute time.monotonic()) caps the Monday calls' timeouts.
+    """
     with tempfile.TemporaryDirectory() as tmp:
         pdf_in = Path(tmp) / "job_ticket.pdf"
         pdf_out = Path(tmp) / f"prelim_labels_{item_id}.pdf"
 
         log.info(f"Fetching job ticket file URL for item {item_id}")
-        url, filename = get_job_ticket_url(item_id)
+        with _stage("job_ticket", "monday_query"):
+            url, filename = get_job_ticket_url(item_id, deadline)
         log.info(f"Downloading: {filename}")
-        download_file(url, pdf_in)
+        with _stage("job_ticket", "download"):
+            download_file(url, pdf_in, deadline=deadline)
 
         log.info("Parsing job ticket")
-        parsed = parse_job_ticket(pdf_in)
+        with _stage("job_ticket", "parse"):
+            parsed = parse_job_ticket(pdf_in)
 
         if not parsed["skus"]:
             raise RuntimeError("No SKUs found in job ticket — check PDF format")
@@ -915,12 +2653,39 @@ def _process_job_ticket(item_id):
             f"Generating {total_labels} prelim labels for "
             f"'{parsed['client_name']}' PO# {parsed['po_number']}"
         )
-        build_prelim_labels_pdf(
-            parsed["client_name"], parsed["po_number"], parsed["skus"], pdf_out
-        )
+        if total_labels > LABEL_STREAM_MIN_LABELS:
+            # Large run: render in parts and upload each as soon as it's saved
+            with _stage("job_ticket", "render") as render:
+                def upload_part(path, part_no, count):
+                    log.info(f"Uploading prelim labels part {part_no} ({count} labels) to Monday.com")
+                    with _stage("job_ticket", "upload") as upload:
+                        upload_prelim_labels_to_monday(item_id, path, deadline)
+                    render.excluded += upload.seconds
+                    path.unlink()
+
+                build_prelim_labels_pdf_parts(
+                    parsed["client_name"], parsed["po_number"], parsed["skus"],
+                    tmp, f"prelim_labels_{item_id}", on_part=upload_part,
+                )
+        else:
+            with _stage("job_ticket", "render"):
+                build_prelim_labels_pdf(
+                    parsed["client_name"], parsed["po_number"], parsed["skus"], pdf_out
+                )
 
-        log.info("Uploading prelim labels to Monday.com")
-        upload_prelim_labels_to_monday(item_id, pdf_out)
+            log.info("Uploading prelim labels to Monday.com")
+            with _stage("job_ticket", "upload"):
+                upload_prelim_labels_to_monday(item_id, pdf_out, deadline)
+        _metrics.inc("labels_total", total_labels, kind="prelim")
+
+        if LABEL_ZPL_OUTPUT:
+            zpl_out = pdf_out.with_suffix(".zpl")
+            with _stage("job_ticket", "render_zpl"):
+                build_prelim_labels_zpl(
+                    parsed["client_name"], parsed["po_number"], parsed["skus"], zpl_out
+                )
+            with _stage("job_ticket", "upload"):
+                upload_prelim_labels_to_monday(item_id, zpl_out, deadline)
 
 
 @app.route("/webhook/job-ticket", methods=["GET"])
@@ -933,6 +2698,8 @@ def job_ticket_webhook_verify():
 
 
 @app.route("/webhook/job-ticket", methods=["POST"])
+@_profiled_route("job_ticket")
+@_traced_webhook("job_ticket")
 def job_ticket_webhook_handler():
     try:
         body = request.get_json(force=True, silent=True) or {}
@@ -979,6 +2746,58 @@ PRICING_BOARD_ID = "7035178904"
 PRICING_PI_COLUMN_ID = "text_mksn7xdc"
 PRICING_INVOICE_COLUMN_ID = "file_mknhcwtm"
 PROOF_STATUS_COLUMN_ID = "status3__1"
+PROOF_APPROVED_LABEL = "Proof Approved"
+ITEM_PI_COLUMN_ID = "text_mksn14en"
+
+# Wall-clock budget for one Proof Approved run (Vercel maxDuration is 300 s).
+# Only the Job Ticket uploads — the part that must not be lost — may run on
+# into the grace period between the budget and the hard limit.
+PROOF_APPROVED_BUDGET_S = float(os.environ.get("PROOF_APPROVED_BUDGET_S", "270"))
+PROOF_APPROVED_GRACE_S = float(os.environ.get("PROOF_APPROVED_GRACE_S", "20"))
+
+# Optional work after the upload is handed to a follow-up request (which gets a
+# budget of its own) when less than this much of the budget is left: prelim
+# labels go to the Job Ticket webhook, error updates back to the Proof Approved
+# one (?followup=error-update, authorised by FOLLOWUP_SECRET). Without a
+# FOLLOWUP_BASE_URL (default: this Vercel deployment) the work runs inline.
+PRELIM_LABELS_MIN_S = float(os.environ.get("PRELIM_LABELS_MIN_S", "60"))
+ERROR_UPDATE_MIN_S = float(os.environ.get("ERROR_UPDATE_MIN_S", "10"))
+FOLLOWUP_BASE_URL = (
+    os.environ.get("FOLLOWUP_BASE_URL")
+    or (f"https://{os.environ['VERCEL_URL']}" if os.environ.get("VERCEL_URL") else "")
+).rstrip("/")
+FOLLOWUP_SECRET = os.environ.get("FOLLOWUP_SECRET", "")
+# (Flask route, Vercel function) per follow-up job
+_FOLLOWUP_PATHS = {
+    "prelim-labels": ("/webhook/job-ticket", "/api/webhook_job_ticket"),
+    "error-update": ("/webhook/proof-approved", "/api/webhook_proof_approved"),
+}
+
+# Pouch JTs are filled and uploaded on this many threads. Fills are pure-Python
+# pypdf work (GIL-bound); the win is uploads overlapping each other, the fills
+# and the Claude spec stream.
+JT_WORKERS = int(os.environ.get("JT_WORKERS", "4"))
+
+# Upload multi-size pouch orders as one multi-lot JT instead of one per size
+POUCH_JT_COMBINED = os.environ.get("POUCH_JT_COMBINED", "").strip().lower() in ("1", "true", "yes")
+
+# Filled JT output: "standard" keeps every template page and live fields;
+# "slim" drops unused overflow pages and recompresses; "flat" also bakes the
+# filled fields into the page content (blank fields stay editable).
+JT_OUTPUT_PROFILE = os.environ.get("JT_OUTPUT_PROFILE", "standard").strip().lower()
+JT_OUTPUT_PROFILES = ("standard", "slim", "flat")
+
+# Invoice specs extracted ahead of approval (POST /webhook/proof-approved?prefetch=1
+# on earlier proof status or PI# changes) or by an earlier run, keyed by PI# and
+# invoice asset id — a new invoice file has a new asset id. The cache is a local
+# directory, so it only helps runs that share it with the prefetch (one server
+# process, or a warm serverless instance).
+JT_SPEC_CACHE = os.environ.get("JT_SPEC_CACHE", "1").strip().lower() not in ("0", "false", "no")
+JT_SPEC_CACHE_DIR = Path(
+    os.environ.get("JT_SPEC_CACHE_DIR") or Path(tempfile.gettempdir()) / "jt-spec-cache"
+)
+JT_SPEC_CACHE_TTL_S = float(os.environ.get("JT_SPEC_CACHE_TTL_S", str(14 * 24 * 3600)))
+JT_SPEC_CACHE_VERSION = 1
 
 POUCH_JT_TEMPLATE_PATH = (
     Path(__file__).resolve().parent
@@ -996,18 +2815,6 @@ NONPOUCH_JT_WITHAPP_TEMPLATE_PATH = (
     / "Non-Pouch_JT_WITH_Application April2026.pdf"
 )
 
-# Row letters used in the Pouch JT form (order = fill order)
-# Rows A–O: DETAIL field has DOUBLE SPACE ("DETAIL  SKU{row}")
-# Rows P+:  DETAIL field has SINGLE SPACE ("DETAIL SKU{row}")
-_JT_ROWS_AO = list("ABCDEFGHIJKLMNO")
-_JT_ROWS_P_PLUS = (
-    list("PQRSTUVWXYZ")
-    + ["AA", "BB", "CC", "DD", "EE", "FF", "GG", "HH", "II", "JJ",
-       "KK", "LL", "MM", "NN", "OO", "PP", "QQ", "RR"]
-)
-_JT_ALL_ROWS = _JT_ROWS_AO + _JT_ROWS_P_PLUS
-
-
 def _format_initials_from_text(people_text: str) -> str:
     """
     Convert a people column's text value (e.g. 'John Doe, Jane Smith') to
@@ -1023,7 +2830,7 @@ def _format_initials_from_text(people_text: str) -> str:
     return "/".join(parts)
 
 
-def _get_item_data_for_jt(item_id: int) -> dict:
+def _get_item_data_for_jt(item_id: int, deadline: float | None = None) -> dict:
     """
     Fetch header data and subitems from the Monday item for Job Ticket filling.
 
@@ -1077,7 +2884,7 @@ def _get_item_data_for_jt(item_id: int) -> dict:
       }
     }
     """
-    data = monday_request(query, {"itemId": str(item_id)})
+    data = monday_request(query, {"itemId": str(item_id)}, deadline)
     items = data.get("data", {}).get("items", [])
     if not items:
         raise RuntimeError(f"Item {item_id} not found")
@@ -1121,7 +2928,7 @@ def _get_item_data_for_jt(item_id: int) -> dict:
     order_date = get_text("order date", "date")
 
     # PI# — prefer known column ID, fall back to title match
-    pi_cv = col_by_id.get("text_mksn14en", {})
+    pi_cv = col_by_id.get(ITEM_PI_COLUMN_ID, {})
     pi_number = (pi_cv.get("text") or "").strip() or get_text("pi #", "pi#", "pi", "pi number")
 
     # Column title is "PO#" on this board
@@ -1170,7 +2977,7 @@ def _get_item_data_for_jt(item_id: int) -> dict:
     }
 
 
-def _post_monday_error_update(item_id: int, error_msg: str) -> None:
+def _post_monday_error_update(item_id: int, error_msg: str, deadline: float | None = None) -> None:
     """Post an error message as a Monday.com update on the item so it's visible without Vercel logs."""
     try:
         mutation = """
@@ -1181,21 +2988,79 @@ def _post_monday_error_update(item_id: int, error_msg: str) -> None:
         monday_request(mutation, {
             "itemId": str(item_id),
             "body": f"⚠️ Proof Approved automation error:\n\n{error_msg}",
-        })
+        }, deadline)
     except Exception as e:
         log.warning(f"[proof-approved] could not post error update to Monday: {e}")
 
 
-def _find_invoice_on_pricing_board(pi_number: str) -> tuple:
+def _defer_followup(job: str, item_id: int, error_msg: str = "") -> bool:
     """
-    Search the Pricing board for an item whose PI# column matches pi_number.
-    Returns (url, filename, customer_name) of the most recent invoice file attached.
-    customer_name comes from the "Client" dropdown column on the Pricing board.
+    Hand an optional job ("prelim-labels" or "error-update") to a new request on
+    this deployment. The error-update follow-up answers once the update is
+    posted, so its status is waited for (up to ERROR_UPDATE_MIN_S); prelim
+    labels outlive any wait, so that request is only sent.
+    False when follow-ups aren't configured or the hand-off wasn't confirmed —
+    the caller then runs the job inline.
+    """
+    if not FOLLOWUP_BASE_URL or (job == "error-update" and not FOLLOWUP_SECRET):
+        return False
+    path = _FOLLOWUP_PATHS[job][1 if os.environ.get("VERCEL") else 0]
+    url = FOLLOWUP_BASE_URL + path
+    if job == "prelim-labels":
+        # Same payload Monday sends when a JT lands in the Job Ticket column
+        body, headers = {"event": {"pulseId": item_id, "columnId": JOB_TICKET_COLUMN_ID}}, {}
+    else:
+        url += f"?followup={job}"
+        body = {"item_id": item_id, "message": error_msg}
+        headers = {"X-Followup-Secret": FOLLOWUP_SECRET}
+    if _current_trace_id():
+        headers[TRACE_HEADER] = _current_trace_id()     # the follow-up continues this trace
+    confirm = job == "error-update"
+    try:
+        resp = requests.post(url, json=body, headers=headers,
+                             timeout=(3, ERROR_UPDATE_MIN_S if confirm else 2))
+        resp.raise_for_status()
+        if confirm and resp.json().get("status") != "ok":
+            raise RuntimeError(f"follow-up answered {resp.text[:200]}")
+    except requests.exceptions.ReadTimeout:
+        if confirm:
+            log.warning(
+                f"[followup] {job} for item {item_id} not confirmed within {ERROR_UPDATE_MIN_S:.0f}s "
+                f"— running it inline"
+            )
+            return False
+        # The follow-up keeps running without us; a failure there is only in its own logs
+        log.warning(f"[followup] {job} for item {item_id} sent to {path}, delivery unconfirmed")
+        return True
+    except (requests.RequestException, ValueError, RuntimeError) as e:
+        log.warning(f"[followup] could not hand off {job} for item {item_id}: {e}")
+        return False
+    log.info(f"[followup] {job} for item {item_id} → {path}")
+    return True
+
+
+def _followup_authorized(secret: str | None) -> bool:
+    return bool(FOLLOWUP_SECRET) and hmac.compare_digest(secret or "", FOLLOWUP_SECRET)
 
-    File download strategy: Monday's protected_static CDN URLs cannot be downloaded
-    with an API token. Instead we get the assetId from the file column value JSON,
-    then call assets(ids: [assetId]) { public_url } which returns a pre-signed S3 URL
-    valid for 1 hour — no auth header needed to download.
+
+def _report_proof_approved_error(item_id: int, error_msg: str, deadline: float | None = None) -> None:
+    """
+    Post a failed run's error as a Monday update — from a follow-up request when
+    less than ERROR_UPDATE_MIN_S of the budget is left, else inline.
+    """
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining < ERROR_UPDATE_MIN_S and _defer_followup("error-update", item_id, error_msg):
+            return
+        deadline += PROOF_APPROVED_GRACE_S
+    _post_monday_error_update(item_id, error_msg, deadline)
+
+
+def _find_invoice_asset(pi_number: str, deadline: float | None = None) -> tuple:
+    """
+    (asset_id, filename, customer_name) of the latest invoice file on the
+    Pricing board item for pi_number. The asset id changes whenever a new
+    invoice file is attached.
     """
     query = """
     query FindInvoice($boardId: ID!, $columnId: String!, $value: String!) {
@@ -1220,7 +3085,7 @@ def _find_invoice_on_pricing_board(pi_number: str) -> tuple:
         "boardId": PRICING_BOARD_ID,
         "columnId": PRICING_PI_COLUMN_ID,
         "value": str(pi_number),
-    })
+    }, deadline)
     items = (
         data.get("data", {})
         .get("items_page_by_column_values", {})
@@ -1250,14 +3115,22 @@ def _find_invoice_on_pricing_board(pi_number: str) -> tuple:
 
     if not asset_id:
         raise RuntimeError(f"No invoice file attached for PI# '{pi_number}'")
+    return str(asset_id), name, customer_name
+
+
+def _invoice_asset_url(asset_id: str, name: str, pi_number: str, deadline: float | None = None) -> tuple:
+    """
+    (download url, filename) for an invoice asset — a pre-signed URL, valid for 1 hour.
 
-    # Query the assets API for a pre-signed public_url (downloadable without auth)
+    Monday's protected_static CDN URLs cannot be downloaded with an API token,
+    so the asset's pre-signed S3 public_url is used instead (no auth header).
+    """
     assets_query = """
     query GetAsset($ids: [ID!]!) {
       assets(ids: $ids) { id name public_url url }
     }
     """
-    assets_data = monday_request(assets_query, {"ids": [str(asset_id)]})
+    assets_data = monday_request(assets_query, {"ids": [str(asset_id)]}, deadline)
     assets = assets_data.get("data", {}).get("assets", [])
     if not assets:
         raise RuntimeError(f"Asset {asset_id} not found for PI# '{pi_number}'")
@@ -1273,7 +3146,7 @@ def _find_invoice_on_pricing_board(pi_number: str) -> tuple:
         )
 
     log.info(f"[find-invoice] PI#{pi_number} → asset {asset_id} '{name}' url_type={'public' if asset.get('public_url') else 'protected'}")
-    return url, name, customer_name
+    return url, name
 
 
 def _extract_invoice_text(pdf_path) -> str:
@@ -1287,14 +3160,33 @@ def _extract_invoice_text(pdf_path) -> str:
     return "\n\n".join(parts)
 
 
-def _extract_pouch_specs(invoice_text: str) -> list:
-    """
-    Call Claude API to extract all pouch line items from the invoice.
-
-    Returns a list of spec dicts — one per distinct "Pouches:" line item.
-    Returns an empty list if the invoice contains no pouch products.
-    Each dict has all spec fields as strings ("" if not found on the invoice).
-    """
+# ---------------------------------------------------------------------------
+# Claude API — shared client, bounded concurrency and token-budget accounting
+# ---------------------------------------------------------------------------
+# One Anthropic client is reused for the life of the process so connections are
+# pooled. Every call goes through _claude_gate: at most CLAUDE_MAX_IN_FLIGHT
+# requests run at once across all concurrent Proof Approved runs, and calls
+# wait (rather than fail) while the rolling one-minute input/output token
+# budget is spent. Each call's usage and latency is recorded per Monday item.
+
+CLAUDE_MAX_IN_FLIGHT = int(os.environ.get("CLAUDE_MAX_IN_FLIGHT", "4"))
+# 0 disables the corresponding per-minute budget
+CLAUDE_INPUT_TOKENS_PER_MIN = int(os.environ.get("CLAUDE_INPUT_TOKENS_PER_MIN", "0"))
+CLAUDE_OUTPUT_TOKENS_PER_MIN = int(os.environ.get("CLAUDE_OUTPUT_TOKENS_PER_MIN", "0"))
+
+# USD per million (input, output) tokens — used for the per-item cost estimate
+_CLAUDE_PRICE_PER_MTOK = {
+    "claude-sonnet-4-6": (3.0, 15.0),
+    "claude-haiku-4-5": (1.0, 5.0),
+}
+
+_claude_client = None
+_claude_client_lock = threading.Lock()
+
+
+def _get_claude_client():
+    """Return the process-wide Anthropic client, creating it on first use."""
+    global _claude_client
     import anthropic as _ant
 
     api_key = (
@@ -1305,9 +3197,452 @@ def _extract_pouch_specs(invoice_text: str) -> list:
     if not api_key:
         raise RuntimeError("ANTHROPIC_API_KEY environment variable is not set")
 
-    client = _ant.Anthropic(api_key=api_key)
+    with _claude_client_lock:
+        if _claude_client is None:
+            _claude_client = _ant.Anthropic(api_key=api_key)
+        return _claude_client
 
-    prompt = (
+
+class _ClaudeGate:
+    """Process-wide in-flight limit plus rolling per-minute token budgets."""
+
+    WINDOW_S = 60.0
+    MAX_ITEMS = 500     # per-item totals kept, least recently updated dropped first
+
+    def __init__(self, max_in_flight, input_tpm, output_tpm):
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._input_tpm = input_tpm
+        self._output_tpm = output_tpm
+        self._lock = threading.Lock()
+        self._window = collections.deque()   # [timestamp, input_tokens, output_tokens]
+        self.calls = collections.deque(maxlen=500)
+        self.by_item = collections.OrderedDict()
+
+    def _reserve(self, est_input, est_output, start_by=None):
+        """
+        Block until the estimate fits the rolling budget, then reserve it.
+        Raises TimeoutError when the budget won't free up before `start_by`.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] > self.WINDOW_S:
+                    self._window.popleft()
+                used_in = sum(e[1] for e in self._window)
+                used_out = sum(e[2] for e in self._window)
+                fits_in = not self._input_tpm or used_in + est_input <= self._input_tpm
+                fits_out = not self._output_tpm or used_out + est_output <= self._output_tpm
+                # An empty window always admits the call so oversized requests can't deadlock
+                if (fits_in and fits_out) or not self._window:
+                    entry = [now, est_input, est_output]
+                    self._window.append(entry)
+                    return entry
+                wait = self._window[0][0] + self.WINDOW_S - now
+            if start_by is not None and now + wait > start_by:
+                raise TimeoutError(
+                    f"Claude token budget spent for another {wait:.0f}s — past the request deadline"
+                )
+            log.info(f"[claude-gate] token budget spent — waiting {wait:.1f}s")
+            time.sleep(min(max(wait, 0.1), 5.0))
+
+    @contextlib.contextmanager
+    def call(self, tag: str, model: str, est_input: int, est_output: int, item_id=None,
+             deadline: float | None = None):
+        """
+        Hold a budget reservation and an in-flight slot for one Claude call.
+
+        The budget is reserved first, so a call waiting for tokens doesn't hold
+        a slot other callers could use. With an absolute time.monotonic()
+        `deadline`, neither wait runs past the last moment a call could still
+        start (see _claude_call_timeout); TimeoutError is raised instead.
+
+        Yields a record(usage) callback; pass it the response's `usage` so the
+        reservation is corrected to actual tokens and the call is accounted.
+        The call is traced as a claude.<tag> span, including the time queued.
+        """
+        with _span(f"claude.{tag}", model=model, item_id=item_id) as span:
+            queued = time.monotonic()
+            start_by = (None if deadline is None
+                        else deadline - CLAUDE_DEADLINE_RESERVE_S - CLAUDE_MIN_CALL_S)
+            entry = self._reserve(est_input, est_output, start_by)
+            wait = None if start_by is None else max(start_by - time.monotonic(), 0)
+            if not self._slots.acquire(timeout=wait):
+                with self._lock:
+                    self._window.remove(entry)
+                raise TimeoutError(
+                    f"no Claude slot free within {time.monotonic() - queued:.0f}s — past the request deadline"
+                )
+            usage_seen = {}
+            started = time.monotonic()
+            try:
+                span.set(queued_ms=round((started - queued) * 1000, 1))
+
+                def record(usage):
+                    usage_seen["input"] = getattr(usage, "input_tokens", 0) or 0
+                    usage_seen["output"] = getattr(usage, "output_tokens", 0) or 0
+
+                yield record
+            finally:
+                self._slots.release()
+                elapsed = time.monotonic() - started
+                in_tok = usage_seen.get("input", 0)
+                out_tok = usage_seen.get("output", 0)
+                with self._lock:
+                    if usage_seen:
+                        entry[1], entry[2] = in_tok, out_tok
+                    price_in, price_out = _CLAUDE_PRICE_PER_MTOK.get(model, (0.0, 0.0))
+                    cost = (in_tok * price_in + out_tok * price_out) / 1_000_000
+                    self.calls.append({
+                        "tag": tag, "item_id": item_id, "model": model,
+                        "input_tokens": in_tok, "output_tokens": out_tok,
+                        "seconds": round(elapsed, 3), "cost_usd": round(cost, 5),
+                    })
+                    totals = self.by_item.setdefault(item_id, {
+                        "calls": 0, "input_tokens": 0, "output_tokens": 0,
+                        "seconds": 0.0, "cost_usd": 0.0,
+                    })
+                    totals["calls"] += 1
+                    totals["input_tokens"] += in_tok
+                    totals["output_tokens"] += out_tok
+                    totals["seconds"] += elapsed
+                    totals["cost_usd"] += cost
+                    self.by_item.move_to_end(item_id)
+                    while len(self.by_item) > self.MAX_ITEMS:
+                        self.by_item.popitem(last=False)
+                span.set(input_tokens=in_tok, output_tokens=out_tok, cost_usd=round(cost, 5))
+                _metrics.observe("claude_call_seconds", elapsed, model=model)
+                _metrics.inc("claude_tokens_total", in_tok, model=model, direction="input")
+                _metrics.inc("claude_tokens_total", out_tok, model=model, direction="output")
+                log.info(
+                    f"[claude-usage] {tag} item={item_id} model={model} "
+                    f"in={in_tok} out={out_tok} {elapsed:.2f}s ~${cost:.4f}"
+                )
+
+    def item_summary(self, item_id) -> dict:
+        with self._lock:
+            return dict(self.by_item.get(item_id, {}))
+
+
+_claude_gate = _ClaudeGate(
+    CLAUDE_MAX_IN_FLIGHT, CLAUDE_INPUT_TOKENS_PER_MIN, CLAUDE_OUTPUT_TOKENS_PER_MIN
+)
+
+
+def _log_claude_item_usage(item_id) -> None:
+    summary = _claude_gate.item_summary(item_id)
+    if summary:
+        log.info(
+            f"[claude-usage] item {item_id} total: {summary['calls']} call(s), "
+            f"in={summary['input_tokens']} out={summary['output_tokens']}, "
+            f"{summary['seconds']:.2f}s, ~${summary['cost_usd']:.4f}"
+        )
+
+
+# ---------------------------------------------------------------------------
+# Claude model tiers and per-call deadlines
+# ---------------------------------------------------------------------------
+# Simple single-item invoices try CLAUDE_FAST_MODEL first and only escalate to
+# CLAUDE_MODEL when the fast answer fails validation (e.g. a dropdown value not
+# in the template's option list) or the call errors/times out. Every call's
+# timeout is capped by what is left of the request budget, keeping
+# CLAUDE_DEADLINE_RESERVE_S for the fills and uploads that follow.
+
+CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "claude-sonnet-4-6")
+CLAUDE_FAST_MODEL = os.environ.get("CLAUDE_FAST_MODEL", "claude-haiku-4-5")   # "" disables
+CLAUDE_CALL_TIMEOUT_S = float(os.environ.get("CLAUDE_CALL_TIMEOUT_S", "120"))
+CLAUDE_FAST_TIMEOUT_S = float(os.environ.get("CLAUDE_FAST_TIMEOUT_S", "30"))
+CLAUDE_DEADLINE_RESERVE_S = float(os.environ.get("CLAUDE_DEADLINE_RESERVE_S", "30"))
+CLAUDE_MIN_CALL_S = 10.0
+CLAUDE_STREAM_GRACE_S = 10.0    # consumer waits this long past a stream's own timeout
+CLAUDE_FAST_MAX_CHARS = 4000
+
+# Lines that open an invoice line item ("Pouches: …", "Labels: …")
+_INVOICE_LINE_ITEM_RE = re.compile(r"^\s*(pouches|labels?|sleeves?)\s*:", re.IGNORECASE | re.MULTILINE)
+_INVOICE_POUCH_LINE_RE = re.compile(r"^\s*pouches\s*:", re.IGNORECASE | re.MULTILINE)
+
+
+def _is_simple_invoice(text: str) -> bool:
+    """Short invoice with at most one line item — a candidate for the fast model."""
+    return len(text) <= CLAUDE_FAST_MAX_CHARS and len(_INVOICE_LINE_ITEM_RE.findall(text)) <= 1
+
+
+def _claude_model_tiers(simple: bool) -> list:
+    """Models to try in order: [fast, main] for simple invoices, else [main]."""
+    if simple and CLAUDE_FAST_MODEL and CLAUDE_FAST_MODEL != CLAUDE_MODEL:
+        return [CLAUDE_FAST_MODEL, CLAUDE_MODEL]
+    return [CLAUDE_MODEL]
+
+
+def _claude_call_timeout(deadline: float | None, fast: bool = False) -> float:
+    """
+    Timeout (seconds) for the next Claude call given an absolute time.monotonic()
+    deadline. Raises TimeoutError when too little budget is left to start one.
+    """
+    cap = CLAUDE_FAST_TIMEOUT_S if fast else CLAUDE_CALL_TIMEOUT_S
+    if deadline is None:
+        return cap
+    remaining = deadline - time.monotonic() - CLAUDE_DEADLINE_RESERVE_S
+    if remaining < CLAUDE_MIN_CALL_S:
+        raise TimeoutError(
+            f"only {max(remaining, 0):.0f}s of request budget left — not starting a Claude call"
+        )
+    return min(cap, remaining)
+
+
+# ---------------------------------------------------------------------------
+# Invoice relevance trimming — send Claude only the line-item / spec region
+# ---------------------------------------------------------------------------
+# ProForma invoices carry addresses, bank details and a long terms & conditions
+# block that Claude doesn't need. Dropping those sections before the old
+# 8000-char cutoff cuts input tokens (and latency) and lets more line items fit.
+# Lines are only ever removed, never reordered, so any line item that survived
+# the plain `invoice_text[:8000]` truncation still lands inside the limit.
+
+CLAUDE_INVOICE_CHAR_LIMIT = 8000
+
+# Headings that open a section Claude never needs
+_INVOICE_SKIP_HEADING_RE = re.compile(
+    r"^\s*(terms\s*(&|and)\s*conditions|terms of sale|conditions of sale|"
+    r"warranty|disclaimer|bank(ing)?\s+(details|info)|wire\s+(transfer|instructions)|"
+    r"remit\s+to|payment\s+(terms|instructions)|bill\s+to|ship\s+to|sold\s+to|"
+    r"thank\s+you)\b",
+    re.IGNORECASE,
+)
+# Address blocks are short; terms/bank sections run until the next relevant heading
+_INVOICE_ADDRESS_HEADING_RE = re.compile(r"^\s*(bill|ship|sold)\s+to\b", re.IGNORECASE)
+_INVOICE_ADDRESS_MAX_LINES = 6
+
+# Headings that open (or return to) the line-item / spec region
+_INVOICE_KEEP_HEADING_RE = re.compile(
+    r"^\s*(description|item|qty|quantity|product|pouches\s*:|labels?\s*:|"
+    r"job\s+spec|spec(ification)?s?|material|size|notes?)\b",
+    re.IGNORECASE,
+)
+# Lines that look like a line item or a spec value — always kept
+_INVOICE_ITEM_LINE_RE = re.compile(
+    r"(pouch|label|sleeve|\$\s?[\d,]+\.\d{2}|\d+(\.\d+)?\s*(\"|in\b|inch|mm\b)|"
+    r"\d+(\.\d+)?\s*[x×]\s*\d)",
+    re.IGNORECASE,
+)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 chars/token) used for trim reporting and budgeting."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _trim_invoice_text(invoice_text: str, limit: int | None = CLAUDE_INVOICE_CHAR_LIMIT) -> tuple:
+    """
+    Drop boilerplate sections (addresses, terms, bank details) from invoice text.
+
+    Returns (trimmed_text, stats) where trimmed_text is at most `limit` chars
+    (uncapped when limit is None) and stats = {"orig_chars", "sent_chars", "orig_tokens", "sent_tokens"}.
+    Falls back to plain truncation if no line-item-looking lines are found.
+    """
+    kept_pages = []
+    found_items = False
+    for page_text in invoice_text.split("\n\n"):
+        kept = []
+        skipping = False
+        address_left = 0
+        for line in page_text.split("\n"):
+            is_item = bool(_INVOICE_ITEM_LINE_RE.search(line))
+            found_items = found_items or is_item
+            if _INVOICE_SKIP_HEADING_RE.match(line) and not is_item:
+                skipping = True
+                address_left = (
+                    _INVOICE_ADDRESS_MAX_LINES if _INVOICE_ADDRESS_HEADING_RE.match(line) else 0
+                )
+                continue
+            if skipping:
+                if is_item or _INVOICE_KEEP_HEADING_RE.match(line):
+                    skipping = False
+                elif address_left:
+                    address_left -= 1
+                    skipping = address_left > 0
+                    continue
+                else:
+                    continue
+            kept.append(line)
+        if kept:
+            kept_pages.append("\n".join(kept))
+
+    trimmed = "\n\n".join(kept_pages) if found_items else invoice_text
+    trimmed = trimmed[:limit]
+    stats = {
+        "orig_chars": len(invoice_text),
+        "sent_chars": len(trimmed),
+        "orig_tokens": _estimate_tokens(invoice_text),
+        "sent_tokens": _estimate_tokens(trimmed),
+    }
+    return trimmed, stats
+
+
+def _log_trim_stats(tag: str, stats: dict) -> None:
+    orig = stats["orig_tokens"]
+    saved = orig - stats["sent_tokens"]
+    pct = (100 * saved / orig) if orig else 0
+    log.info(
+        f"[{tag}] invoice trimmed {stats['orig_chars']} → {stats['sent_chars']} chars "
+        f"(~{orig} → ~{stats['sent_tokens']} tokens, -{pct:.0f}%)"
+    )
+
+
+CLAUDE_MAX_CONCURRENCY = int(os.environ.get("CLAUDE_MAX_CONCURRENCY", "4"))
+
+
+def _chunk_invoice_text(text: str, limit: int = CLAUDE_INVOICE_CHAR_LIMIT) -> list:
+    """
+    Split invoice text into chunks of at most `limit` chars.
+
+    Chunks break only where a line item starts ("Pouches:", "Labels:" …), so
+    each item — with its continuation lines — lands whole in exactly one chunk
+    and the chunk results can be concatenated without de-duplication. An item
+    longer than `limit` on its own is split on line boundaries (logged).
+    """
+    if len(text) <= limit:
+        return [text]
+    lines = text.split("\n")
+    starts = [i for i, line in enumerate(lines) if i and _INVOICE_LINE_ITEM_RE.match(line)]
+    blocks = [lines[a:b] for a, b in zip([0] + starts, starts + [len(lines)])]
+
+    chunks = []
+    current, size = [], 0
+    for block in blocks:
+        block_size = sum(len(line) + 1 for line in block)
+        if current and size + block_size > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        if block_size <= limit:
+            current.extend(block)
+            size += block_size
+            continue
+        log.warning(
+            f"[claude] invoice line item of {block_size} chars exceeds the "
+            f"{limit}-char chunk limit — splitting it across chunks"
+        )
+        for line in block:
+            if current and size + len(line) + 1 > limit:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(line[:limit])
+            size += min(len(line), limit) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class _StreamingSpecArrayParser:
+    """
+    Incrementally parse a streamed JSON array of objects.
+
+    feed() accepts text deltas as they arrive and returns every object whose
+    closing brace has been seen, so callers can act on each item before the
+    model has finished the rest of the array. Text before the opening "[" and
+    after the closing "]" is ignored, as the old bracket scan did.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buf = []
+
+    def feed(self, text: str) -> list:
+        objects = []
+        for ch in text:
+            if self.done:
+                break
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = ["{"]
+                elif ch == "]":
+                    self.done = True
+                continue
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(json.loads("".join(self._buf)))
+                    self._buf = []
+        return objects
+
+
+# Pouch JT dropdown for each spec key. The allowed values are the field's
+# options in the template manifest, less the "SELECT" placeholder.
+_POUCH_DROPDOWN_FIELDS = {
+    "premium_white": "Dropdown1",
+    "substrate": "Dropdown2",
+    "color": "Dropdown3",
+    "lamination": "Dropdown4",
+    "zipper": "Dropdown5",
+    "hang_hole": "Dropdown6",
+    "tear_notches": "Dropdown8",
+    "seal_type": "Dropdown9",
+    "corner": "Dropdown10",
+}
+_JT_DROPDOWN_PLACEHOLDER = "SELECT"
+
+
+def _pouch_dropdown_options() -> dict:
+    """Spec key → allowed dropdown values, read from the Pouch JT manifest."""
+    fields = get_jt_manifest(POUCH_JT_TEMPLATE_PATH)["fields"]
+    return {
+        key: tuple(o for o in fields[name].get("options", ()) if o != _JT_DROPDOWN_PLACEHOLDER)
+        for key, name in _POUCH_DROPDOWN_FIELDS.items()
+    }
+
+
+def _pouch_spec_problems(spec: dict) -> list:
+    """Return validation problems for one pouch spec ([] when it looks usable)."""
+    problems = []
+    for key, options in _pouch_dropdown_options().items():
+        val = str(spec.get(key) or "").strip()
+        if val and val not in options:
+            problems.append(f"{key}={val!r} not in options")
+    return problems
+
+
+def _pouch_specs_problems(specs_list: list, invoice_text: str) -> list:
+    """Validate a complete pouch extraction against the dropdown options and line count."""
+    problems = []
+    if not specs_list and _INVOICE_POUCH_LINE_RE.search(invoice_text):
+        problems.append("no items returned for an invoice with a Pouches: line")
+    for i, spec in enumerate(specs_list, 1):
+        problems.extend(f"item {i}: {p}" for p in _pouch_spec_problems(spec))
+    return problems
+
+
+def _build_pouch_prompt(invoice_text: str, part: int = 1, parts: int = 1) -> str:
+    part_note = ""
+    if parts > 1:
+        part_note = (
+            f"NOTE: This is part {part} of {parts} of a long invoice, split between line "
+            "items. Extract only the pouch line items that appear in this part; the "
+            "other parts are extracted separately.\n\n"
+        )
+    dropdown_lines = "\n".join(
+        f"- {key}: {' | '.join(options)}" for key, options in _pouch_dropdown_options().items()
+    )
+    return (
         "You are a packaging production assistant extracting job specifications "
         "from a ProForma invoice.\n\n"
         "TASK: Find every distinct pouch/bag product line item (lines starting with "
@@ -1325,22 +3660,15 @@ def _extract_pouch_specs(invoice_text: str) -> list:
         "- pms_swatch: Pantone/PMS color (e.g. \"PMS 123 C\"), or \"\" if none\n"
         "- details: Any spec notes not captured in the fields above, or \"\"\n\n"
         "DROPDOWN FIELDS — match EXACTLY to one of the options, or \"\" if unclear:\n"
-        "- premium_white: NONE | 1 HIT | 2 HIT\n"
-        "- substrate: MET PET | PCR MET PET | WHITE MET PET | CLEAR PET | OTHER *\n"
-        "- color: CMYK | CMY | CMYK + WHITE | CMY + WHITE | K ONLY\n"
-        "- lamination: GLOSS | MATTE | SOFT TOUCH | HOLOGRAPHIC | OTHER *\n"
-        "- zipper: CR ZIPPER (24MM) | NON - CR ZIPPER (10MM) | NO ZIPPER\n"
-        "- hang_hole: NONE | CIRCLE (8MM) | SOMBERO\n"
-        "- tear_notches: YES | NO\n"
-        "- seal_type: K WITH SKIRT | K WITHOUT SKIRT | 3SS\n"
-        "- corner: SQUARE | 0.25\" ROUND CORNER\n\n"
+        f"{dropdown_lines}\n\n"
         "SUBSTRATE MAPPING: METPET → MET PET\n"
         "ZIPPER MAPPING: Freshlock CR (24mm) → CR ZIPPER (24MM)\n"
         "CORNER MAPPING: Rounded → 0.25\" ROUND CORNER\n"
         "COLOR MAPPING: CMYK + White → CMYK + WHITE\n"
         "LAMINATION MAPPING: Matte Laminate → MATTE\n"
         "SEAL MAPPING: K-Seal With Skirt → K WITH SKIRT\n\n"
-        f"INVOICE TEXT:\n{invoice_text[:8000]}\n\n"
+        f"{part_note}"
+        f"INVOICE TEXT:\n{invoice_text}\n\n"
         "Respond with ONLY a valid JSON array (no markdown, no extra text). "
         "One object per pouch line item. Return [] if no pouch products found.\n"
         '[{"sku": "", "pouch_type": "", "width": "", "height": "", "gusset": "", '
@@ -1349,61 +3677,263 @@ def _extract_pouch_specs(invoice_text: str) -> list:
         '"tear_notches": "", "seal_type": "", "corner": ""}]'
     )
 
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=2048,
-        messages=[{"role": "user", "content": prompt}],
-    )
 
-    response_text = message.content[0].text.strip()
-    # Extract the first complete JSON array by counting bracket depth
+def _stream_pouch_chunk(client, prompt: str, out_q, item_id=None,
+                        model: str = CLAUDE_MODEL, deadline: float | None = None,
+                        cancel: threading.Event | None = None) -> None:
+    """
+    Stream one pouch-extraction call, pushing ("started", None) onto out_q once
+    the gate admits it, ("spec", dict) as each object completes, then
+    ("done", None) — or ("error", exc) on failure.
+    Runs on a worker thread so the consumer can fill JTs while Claude generates.
+    Setting `cancel` closes the stream at the next delta (the consumer gave up),
+    so an abandoned call stops generating billed tokens.
+    """
+    max_tokens = 2048
+    parser = _StreamingSpecArrayParser()
+    text_parts = []
+    try:
+        if cancel is not None and cancel.is_set():
+            return
+        with _claude_gate.call(
+            "pouch", model, _estimate_tokens(prompt), max_tokens, item_id, deadline
+        ) as record:
+            out_q.put(("started", None))
+            # Timed from here: the time spent queued in the gate is already gone
+            timeout = _claude_call_timeout(deadline)
+            call_deadline = time.monotonic() + timeout
+            with client.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout,
+            ) as stream:
+                for delta in stream.text_stream:
+                    if cancel is not None and cancel.is_set():
+                        log.info("[claude] pouch stream cancelled — consumer stopped")
+                        return
+                    if time.monotonic() > call_deadline:
+                        raise TimeoutError(f"Claude stream exceeded its {timeout:.0f}s deadline")
+                    text_parts.append(delta)
+                    for obj in parser.feed(delta):
+                        out_q.put(("spec", obj))
+                record(stream.get_final_message().usage)
+        if not parser.done:
+            raise RuntimeError(
+                f"Claude returned unexpected response: {''.join(text_parts).strip()[:300]}"
+            )
+        out_q.put(("done", None))
+    except Exception as e:
+        out_q.put(("error", e))
+
+
+def _extract_pouch_specs_fast(client, prompt: str, invoice_text: str, model: str,
+                              item_id=None, deadline: float | None = None) -> list | None:
+    """
+    One non-streamed call on the fast tier. Returns the validated spec list, or
+    None when the call fails or the answer doesn't validate (caller escalates).
+    """
+    max_tokens = 2048
+    try:
+        with _claude_gate.call(
+            "pouch-fast", model, _estimate_tokens(prompt), max_tokens, item_id, deadline
+        ) as record:
+            timeout = _claude_call_timeout(deadline, fast=True)    # after any queueing
+            message = client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout,
+            )
+            record(message.usage)
+    except Exception as e:
+        log.warning(f"[claude] fast tier {model} failed ({e}) — escalating to {CLAUDE_MODEL}")
+        return None
+
+    parser = _StreamingSpecArrayParser()
+    try:
+        specs_list = parser.feed(message.content[0].text)
+    except ValueError as e:
+        specs_list, parser.done = [], False
+        log.warning(f"[claude] fast tier returned malformed JSON: {e}")
+    problems = _pouch_specs_problems(specs_list, invoice_text) if parser.done else ["no JSON array"]
+    if problems:
+        log.info(f"[claude] fast tier {model} failed validation ({'; '.join(problems)}) — escalating")
+        return None
+    return specs_list
+
+
+def _iter_pouch_specs(invoice_text: str, item_id=None, deadline: float | None = None):
+    """
+    Yield pouch spec dicts one at a time as Claude streams them.
+
+    Each object is yielded as soon as its closing brace arrives, so the caller
+    can start filling job tickets before generation finishes. Invoices whose
+    trimmed text exceeds CLAUDE_INVOICE_CHAR_LIMIT are split into chunks at
+    line-item starts, with no overlap, so each item is in exactly one chunk;
+    chunks stream concurrently (at most CLAUDE_MAX_CONCURRENCY in flight) and
+    items are still yielded in invoice order.
+    Simple single-item invoices try the fast model tier first (not streamed,
+    since it must validate before anything is yielded). `deadline` is an
+    absolute time.monotonic() value that caps every call's timeout.
+    """
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = _get_claude_client()
+
+    trimmed_text, trim_stats = _trim_invoice_text(invoice_text, limit=None)
+    _log_trim_stats("claude", trim_stats)
+    chunks = _chunk_invoice_text(trimmed_text)
+    if len(chunks) > 1:
+        log.info(f"[claude] long invoice — streaming {len(chunks)} chunks in parallel")
+
+    count = 0
+
+    def logged(spec):
+        nonlocal count
+        count += 1
+        log.info(
+            f"[claude] pouch item {count}: sku='{spec.get('sku')}' "
+            f"size={spec.get('width')}x{spec.get('height')}x"
+            f"{spec.get('gusset')} substrate='{spec.get('substrate')}'"
+        )
+        return spec
+
+    tiers = _claude_model_tiers(len(chunks) == 1 and _is_simple_invoice(trimmed_text))
+    if len(tiers) > 1:
+        fast_specs = _extract_pouch_specs_fast(
+            client, _build_pouch_prompt(chunks[0]), trimmed_text, tiers[0], item_id, deadline
+        )
+        if fast_specs is not None:
+            for spec in fast_specs:
+                yield logged(spec)
+            return
+
+    queues = [queue.Queue() for _ in chunks]
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(CLAUDE_MAX_CONCURRENCY, len(chunks))))
+    try:
+        for part, q in enumerate(queues, 1):
+            prompt = _build_pouch_prompt(chunks[part - 1], part, len(chunks))
+            pool.submit(_in_current_context(_stream_pouch_chunk), client, prompt, q, item_id,
+                        tiers[-1], deadline, cancel)
+
+        # Drain chunk queues in order: chunk 1 streams live, later chunks buffer
+        # until their predecessors finish, which keeps the _1…_N order stable.
+        # A chunk still queued for a worker or a gate slot is bounded only by
+        # the request deadline; once its stream has started, a gap longer than
+        # one call's timeout means the worker died or stalled.
+        for part, q in enumerate(queues, 1):
+            started = False
+            while True:
+                if started:
+                    wait = _budget_timeout(deadline, CLAUDE_CALL_TIMEOUT_S + CLAUDE_STREAM_GRACE_S)
+                else:
+                    wait = None if deadline is None else _budget_timeout(deadline, float("inf"))
+                try:
+                    kind, payload = q.get(timeout=wait)
+                except queue.Empty:
+                    if not started:
+                        raise TimeoutError(
+                            f"Claude stream for part {part}/{len(chunks)} never started "
+                            f"before the request deadline"
+                        ) from None
+                    raise TimeoutError(
+                        f"Claude stream for part {part}/{len(chunks)} sent nothing for {wait:.0f}s"
+                    ) from None
+                if kind == "started":
+                    started = True
+                    continue
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise payload
+                problems = _pouch_spec_problems(payload)
+                if problems:
+                    log.warning(f"[claude] pouch item has invalid fields: {'; '.join(problems)}")
+                yield logged(payload)
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_pouch_specs(invoice_text: str, item_id=None, deadline: float | None = None) -> list:
+    """
+    Call Claude API to extract all pouch line items from the invoice.
+
+    Returns a list of spec dicts — one per distinct "Pouches:" line item.
+    Returns an empty list if the invoice contains no pouch products.
+    Each dict has all spec fields as strings ("" if not found on the invoice).
+    Use _iter_pouch_specs to act on items while the response is still streaming.
+    """
+    specs_list = list(_iter_pouch_specs(invoice_text, item_id, deadline))
+    log.info(f"[claude] extracted {len(specs_list)} pouch line item(s)")
+    return specs_list
+
+
+def _parse_nonpouch_response(response_text: str) -> tuple:
+    """
+    Parse a non-pouch extraction response.
+
+    Returns (specs, ok): specs is the dict or None for "no label products";
+    ok is False when the response couldn't be parsed at all.
+    """
+    if response_text.lower() in ("null", "none", ""):
+        return None, True
+
+    # Extract the first complete JSON object by counting brace depth.
+    # re.search with DOTALL is greedy and matches first-{ to last-}, which
+    # breaks when Claude adds trailing text or multiple objects.
     json_str = None
-    start = response_text.find("[")
+    start = response_text.find("{")
     if start != -1:
         depth = 0
         for i, ch in enumerate(response_text[start:], start):
-            if ch == "[":
+            if ch == "{":
                 depth += 1
-            elif ch == "]":
+            elif ch == "}":
                 depth -= 1
                 if depth == 0:
                     json_str = response_text[start : i + 1]
                     break
+
     if not json_str:
-        raise RuntimeError(f"Claude returned unexpected response: {response_text[:300]}")
+        log.warning(f"[claude-nonpouch] unexpected response (no JSON object): {response_text[:300]}")
+        return None, False
 
-    specs_list = json.loads(json_str)
-    if not isinstance(specs_list, list):
-        raise RuntimeError(f"Claude returned non-list JSON: {response_text[:300]}")
+    specs = json.loads(json_str)
+    if not isinstance(specs, dict):
+        log.warning("[claude-nonpouch] Claude returned non-dict JSON — skipping")
+        return None, False
+    return specs, True
 
-    log.info(f"[claude] extracted {len(specs_list)} pouch line item(s)")
-    for i, s in enumerate(specs_list, 1):
-        log.info(
-            f"  [{i}] sku='{s.get('sku')}' size={s.get('width')}x"
-            f"{s.get('height')}x{s.get('gusset')} substrate='{s.get('substrate')}'"
-        )
-    return specs_list
 
+def _nonpouch_specs_problems(specs: dict | None, ok: bool, invoice_text: str) -> list:
+    """Validate a fast-tier non-pouch answer before trusting it."""
+    if not ok:
+        return ["unparseable response"]
+    if specs is None:
+        if re.search(r"^\s*(labels?|sleeves?)\s*:", invoice_text, re.IGNORECASE | re.MULTILINE):
+            return ["null returned for an invoice with a label line"]
+        return []
+    return [f"missing {k}" for k in ("product_name", "size") if not str(specs.get(k) or "").strip()]
 
-def _extract_nonpouch_specs(invoice_text: str) -> dict | None:
+
+def _extract_nonpouch_specs(invoice_text: str, item_id=None, deadline: float | None = None) -> dict | None:
     """
     Call Claude API to extract non-pouch label job specs from the invoice.
 
     Returns a dict with keys: product_name, size, material_coating, has_application, details
     Returns None if the invoice does not describe a label job (e.g. it is pouch-only or
     contains no label line items), so _process_proof_approved can skip silently.
+    Simple single-item invoices try the fast model tier first; `deadline` caps
+    each call's timeout (see _claude_call_timeout).
     """
-    import anthropic as _ant
+    client = _get_claude_client()
 
-    api_key = (
-        os.environ.get("ANTHROPIC_API_KEY")
-        or os.environ.get("Anthropic_API_Key")
-        or ""
-    ).strip()
-    if not api_key:
-        raise RuntimeError("ANTHROPIC_API_KEY environment variable is not set")
-
-    client = _ant.Anthropic(api_key=api_key)
+    trimmed_text, trim_stats = _trim_invoice_text(invoice_text)
+    _log_trim_stats("claude-nonpouch", trim_stats)
 
     prompt = (
         "You are a packaging production assistant extracting job specifications "
@@ -1425,47 +3955,54 @@ def _extract_nonpouch_specs(invoice_text: str) -> dict | None:
         "- details: Any additional relevant spec notes not captured above, or \"\"\n\n"
         "Return ONLY a valid JSON object (no markdown). "
         "Return the literal value null (not a JSON object) if no label products are present.\n\n"
-        f"INVOICE TEXT:\n{invoice_text[:8000]}"
+        f"INVOICE TEXT:\n{trimmed_text}"
     )
 
-    message = client.messages.create(
-        model="claude-sonnet-4-6",
-        max_tokens=1024,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    max_tokens = 1024
+    tiers = _claude_model_tiers(_is_simple_invoice(trimmed_text))
+    for tier, model in enumerate(tiers):
+        last = tier == len(tiers) - 1
+        try:
+            with _claude_gate.call(
+                "nonpouch", model, _estimate_tokens(prompt), max_tokens, item_id, deadline
+            ) as record:
+                timeout = _claude_call_timeout(deadline, fast=not last)    # after any queueing
+                message = client.messages.create(
+                    model=model,
+                    max_tokens=max_tokens,
+                    messages=[{"role": "user", "content": prompt}],
+                    timeout=timeout,
+                )
+                record(message.usage)
+        except Exception as e:
+            if last:
+                raise
+            log.warning(f"[claude-nonpouch] fast tier {model} failed ({e}) — escalating to {tiers[-1]}")
+            continue
 
-    response_text = message.content[0].text.strip()
-    log.info(f"[claude-nonpouch] raw response: {response_text[:300]}")
+        response_text = message.content[0].text.strip()
+        log.info(f"[claude-nonpouch] {model} raw response: {response_text[:300]}")
+        try:
+            specs, ok = _parse_nonpouch_response(response_text)
+        except ValueError as e:
+            if last:
+                raise
+            specs, ok = None, False
+            log.warning(f"[claude-nonpouch] malformed JSON from {model}: {e}")
+        if not last:
+            problems = _nonpouch_specs_problems(specs, ok, trimmed_text)
+            if problems:
+                log.info(
+                    f"[claude-nonpouch] fast tier {model} failed validation "
+                    f"({'; '.join(problems)}) — escalating"
+                )
+                continue
+        break
 
-    if response_text.lower() in ("null", "none", ""):
+    if specs is None:
         log.info("[claude-nonpouch] invoice has no label products — skipping")
         return None
 
-    # Extract the first complete JSON object by counting brace depth.
-    # re.search with DOTALL is greedy and matches first-{ to last-}, which
-    # breaks when Claude adds trailing text or multiple objects.
-    json_str = None
-    start = response_text.find("{")
-    if start != -1:
-        depth = 0
-        for i, ch in enumerate(response_text[start:], start):
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    json_str = response_text[start : i + 1]
-                    break
-
-    if not json_str:
-        log.warning(f"[claude-nonpouch] unexpected response (no JSON object): {response_text[:300]}")
-        return None
-
-    specs = json.loads(json_str)
-    if not isinstance(specs, dict):
-        log.warning("[claude-nonpouch] Claude returned non-dict JSON — skipping")
-        return None
-
     log.info(
         f"[claude-nonpouch] specs: product='{specs.get('product_name')}' "
         f"size='{specs.get('size')}' mc='{specs.get('material_coating')}' "
@@ -1474,28 +4011,683 @@ def _extract_nonpouch_specs(invoice_text: str) -> dict | None:
     return specs
 
 
-def _fill_nonpouch_jt(template_path, item_data: dict, specs: dict, subitems: list, out_path) -> None:
-    """
-    Fill a Non-Pouch Job Ticket PDF template and save to out_path.
+# ---------------------------------------------------------------------------
+# Job Ticket template manifests
+# What a fill needs to know about a template — each field's type, flags,
+# options and widgets (page, annotation index, rect), and the item rows in
+# fill order — is introspected once and kept as JSON next to the PDF
+# ("<template>.manifest.json", written by build_jt_manifests.py). A manifest
+# whose sha256 no longer matches its PDF is rebuilt (and rewritten) on load.
+# ---------------------------------------------------------------------------
+
+JT_MANIFEST_VERSION = 1
 
-    Page 0 has 14 AcroForm rows (letters A–N) filled via update_page_form_field_values:
-      - DETAIL  SKU{L}  (double-space; row N has a space before N: 'DETAIL  SKU N')
-      - QTY TO PRINT{L} (row N: 'QTY TO PRINT N')
-      - M&C {L}         (always has a space)
-      - FILE NAME{L}    (row N: 'FILE NAME N')
-      - {L}             (just the letter — the item# column)
+# Item-row columns by field name. The templates spell them inconsistently
+# ("DETAIL  SKUA" / "DETAIL SKUP", "QTY TO PRINT N", "P2_R01_ITEM_P2" /
+# "P2_R15_ITEM"); the manifest keeps the real name of every cell.
+_JT_ROW_FIELD_RES = (
+    re.compile(r"^(?P<col>QTY TO PRINT|DETAIL +SKU|M&C|FILE NAME|RERUN PI) ?(?P<row>[A-Z]{1,2})$"),
+    re.compile(r"^(?P<row>[A-Z]{1,2})$"),     # ITEM # column
+    re.compile(r"^P(?P<sheet>\d+)_R(?P<row>\d+)_(?P<col>ITEM|QTY|SIZE|MC|FILE)(?:_P\d+)?$"),
+)
+_JT_ROW_COLUMNS = {
+    None: "item", "QTY TO PRINT": "qty", "DETAIL SKU": "detail", "M&C": "mc",
+    "FILE NAME": "file", "RERUN PI": "rerun",
+    "ITEM": "item", "QTY": "qty", "SIZE": "size", "MC": "mc", "FILE": "file",
+}
+_JT_FIELD_TYPES = {"/Tx": "text", "/Ch": "choice", "/Btn": "button", "/Sig": "signature"}
+
+JT_TEMPLATE_PATHS = (POUCH_JT_TEMPLATE_PATH, NONPOUCH_JT_NOAPP_TEMPLATE_PATH,
+                     NONPOUCH_JT_WITHAPP_TEMPLATE_PATH)
+
+_jt_manifests: dict[Path, tuple] = {}    # template path → (mtime_ns, size, manifest)
+_jt_manifest_lock = threading.Lock()
+
+
+def _jt_manifest_path(template_path) -> Path:
+    return Path(template_path).with_suffix(".manifest.json")
+
+
+def build_jt_manifest(reader, name: str, digest: str) -> dict:
+    """Introspect a parsed JT template (pypdf PdfReader) into its manifest."""
+    def inherited(node, key, default=None):
+        while node is not None:
+            node = node.get_object()
+            if key in node:
+                return node[key]
+            node = node.get("/Parent")
+        return default
+
+    fields = {}
+    for field_name, slots in _index_jt_widgets(reader).items():
+        widgets = []
+        for page_no, annot_no, own_name in slots:
+            annot = reader.pages[page_no]["/Annots"][annot_no].get_object()
+            x1, y1, x2, y2 = (round(float(v), 2) for v in annot["/Rect"])
+            widgets.append([page_no, annot_no, own_name,
+                            [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]])
+        annot = reader.pages[slots[0][0]]["/Annots"][slots[0][1]].get_object()
+        field = annot if "/FT" in annot and "/T" in annot else annot["/Parent"].get_object()
+        entry = {
+            "type": _JT_FIELD_TYPES.get(inherited(field, "/FT"), "other"),
+            "flags": int(inherited(field, "/Ff", 0)),
+            "widgets": widgets,
+        }
+        if "/Opt" in field:
+            entry["options"] = [str(o[0] if isinstance(o, list) else o)
+                                for o in field["/Opt"].get_object()]
+        fields[field_name] = entry
+    return {
+        "version": JT_MANIFEST_VERSION,
+        "template": name,
+        "sha256": digest,
+        "pages": len(reader.pages),
+        "fields": fields,
+        "rows": _jt_manifest_rows(fields),
+    }
 
-    Pages 1–3 have P2/P3/P4 overflow rows (72 rows) set via direct annotation scanning:
-      P2 rows 01–14 have _P2 suffix; rows 15–24 don't. P3/P4 rows have no suffix.
 
-    Total capacity: 86 rows.
+def _jt_manifest_rows(fields: dict) -> list:
     """
+    Item rows, top to bottom and page by page:
+    [{"key": "A", "page": 0, "cols": {"qty": "QTY TO PRINTA", …}}, …].
+    Overflow rows ("P2_R01", …) also carry their sheet number (2 for P2).
+    """
+    rows: dict = {}
+    for name in fields:
+        for pattern in _JT_ROW_FIELD_RES:
+            m = pattern.match(name)
+            if m:
+                break
+        else:
+            continue
+        g = m.groupdict()
+        key = f"P{g['sheet']}_R{g['row']}" if g.get("sheet") else g["row"]
+        row = rows.setdefault(key, {"key": key, "cols": {}})
+        if g.get("sheet"):
+            row["sheet"] = int(g["sheet"])
+        row["cols"][_JT_ROW_COLUMNS[re.sub(" +", " ", g["col"]) if g.get("col") else None]] = name
+
+    def position(row):
+        page_no, _, _, (x1, _, _, y2) = fields[row["cols"]["qty"]]["widgets"][0]
+        return page_no, -y2, x1
+
+    # a lone letter field without a QTY cell (e.g. "PI") isn't a row
+    ordered = sorted((row for row in rows.values() if "qty" in row["cols"]), key=position)
+    for row in ordered:
+        row["page"] = position(row)[0]
+    return ordered
+
+
+def write_jt_manifest(template_path, data: bytes | None = None, digest: str | None = None,
+                      reader=None) -> dict:
+    """Build a template's manifest from the PDF and write it next to the PDF."""
+    import io
+    from pypdf import PdfReader
+
+    path = Path(template_path).resolve()
+    if data is None:
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+    manifest = build_jt_manifest(reader or PdfReader(io.BytesIO(data)), path.name, digest)
+    mpath = _jt_manifest_path(path)
+    try:
+        mpath.write_text(json.dumps(manifest, separators=(",", ":")) + "\n")
+    except OSError as e:
+        # Read-only deploys (Vercel) keep the rebuilt manifest in memory
+        log.warning(f"[jt-manifest] could not write {mpath.name}: {e}")
+    return manifest
+
+
+def _read_jt_manifest(path: Path, data: bytes, digest: str, reader=None) -> dict:
+    """The stored manifest for these template bytes, rebuilt if missing or stale."""
+    mpath = _jt_manifest_path(path)
+    try:
+        manifest = json.loads(mpath.read_text())
+    except FileNotFoundError:
+        manifest = None
+    except ValueError as e:
+        log.warning(f"[jt-manifest] ignoring unreadable {mpath.name}: {e}")
+        manifest = None
+    if manifest and (manifest.get("version"), manifest.get("sha256")) == (JT_MANIFEST_VERSION, digest):
+        return manifest
+    log.info(f"[jt-manifest] {mpath.name} missing or stale — rebuilding from {path.name}")
+    return write_jt_manifest(path, data, digest, reader)
+
+
+def get_jt_manifest(template_path) -> dict:
+    """Manifest for a template; re-checked when the PDF's mtime/size change."""
+    path = Path(template_path).resolve()
+    st = path.stat()
+    with _jt_manifest_lock:
+        cached = _jt_manifests.get(path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        data = path.read_bytes()
+        manifest = _read_jt_manifest(path, data, hashlib.sha256(data).hexdigest())
+        _jt_manifests[path] = (st.st_mtime_ns, st.st_size, manifest)
+        return manifest
+
+
+def _jt_manifest_widgets(manifest: dict) -> dict:
+    """The manifest's widget slots as a JTTemplate.widgets index."""
+    return {
+        name: tuple((page_no, annot_no, own_name) for page_no, annot_no, own_name, _ in f["widgets"])
+        for name, f in manifest["fields"].items()
+    }
+
+
+def _jt_main_rows(manifest: dict) -> list:
+    """Item rows on the template's first row page."""
+    rows = manifest["rows"]
+    return [row for row in rows if row["page"] == rows[0]["page"]]
+
+
+def _jt_overflow_rows(manifest: dict) -> list:
+    """Item rows on the template's overflow pages, in fill order."""
+    rows = manifest["rows"]
+    return [row for row in rows if row["page"] != rows[0]["page"]]
+
+
+def _rename_jt_row(row: dict, rename) -> dict:
+    """A manifest row for a renamed page copy (see _add_jt_pages)."""
+    return {**row, "cols": {col: rename(name) for col, name in row["cols"].items()}}
+
+
+# ---------------------------------------------------------------------------
+# Job Ticket template cache
+# The JT templates are 1.1–1.7 MB AcroForm PDFs. Each is parsed once per
+# process; fills clone the cached document instead of re-reading the file.
+# A changed template is picked up on the next fill: the file is re-hashed
+# when its mtime/size moves and re-parsed only if the content differs.
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class JTTemplate:
+    path: Path
+    mtime_ns: int
+    size: int
+    sha256: str
+    reader: object      # pypdf PdfReader, fully resolved — never written to
+    manifest: dict
+    # field name → ((page, annot index, widget has its own /T), …)
+    widgets: dict
+
+
+_jt_templates: dict[Path, JTTemplate] = {}
+# PdfReader resolves objects lazily and is not thread-safe; clones go through this
+_jt_template_lock = threading.Lock()
+
+
+def _load_jt_template(path: Path, st, data: bytes, digest: str) -> JTTemplate:
+    import io
     from pypdf import PdfReader, PdfWriter
+
+    t0 = time.perf_counter()
+    reader = PdfReader(io.BytesIO(data))
+    PdfWriter(clone_from=reader)    # resolve every object now rather than on the first fill
+    with _jt_manifest_lock:
+        cached = _jt_manifests.get(path)
+        if cached and cached[2]["sha256"] == digest:
+            manifest = cached[2]
+        else:
+            manifest = _read_jt_manifest(path, data, digest, reader)
+            _jt_manifests[path] = (st.st_mtime_ns, st.st_size, manifest)
+    widgets = _jt_manifest_widgets(manifest)
+    log.info(
+        f"[jt-template] parsed {path.name} ({len(data)} bytes, {len(reader.pages)} pages, "
+        f"{len(widgets)} fields) in {(time.perf_counter() - t0) * 1000:.0f} ms"
+    )
+    return JTTemplate(path, st.st_mtime_ns, st.st_size, digest, reader, manifest, widgets)
+
+
+def _index_jt_widgets(reader) -> dict:
+    """
+    Map every field name to the widget annotations that display it.
+
+    Names follow update_page_form_field_values' matching: a widget answers to
+    its field's fully qualified name and to the field's own /T. A clone keeps
+    page and /Annots order, so (page, annot index) addresses the same widget
+    in every filled copy.
+    """
+    index = collections.defaultdict(list)
+    for page_no, page in enumerate(reader.pages):
+        _index_jt_page(index, page_no, page)
+    return {name: tuple(slots) for name, slots in index.items()}
+
+
+def _index_jt_page(index, page_no, page) -> None:
+    """Add one page's widgets to a name → [slot, …] index."""
+    annots = page.get("/Annots")
+    for annot_no, ref in enumerate(annots.get_object() if annots else ()):
+        annot = ref.get_object()
+        if annot.get("/Subtype") != "/Widget":
+            continue
+        if "/FT" in annot and "/T" in annot:
+            field = annot
+        else:
+            field = annot.get("/Parent")
+            if field is None:
+                continue
+            field = field.get_object()
+        parts, node = [], field
+        while node is not None:
+            node = node.get_object()
+            if "/T" in node:
+                parts.insert(0, str(node["/T"]))
+            node = node.get("/Parent")
+        slot = (page_no, annot_no, "/T" in annot)
+        for name in {".".join(parts), str(field.get("/T", ""))} - {""}:
+            index[name].append(slot)
+
+
+def _jt_widgets(writer, template: JTTemplate, names, own_name_only=False):
+    """Widget annotations in a cloned template for the given field names."""
+    for name in names:
+        for page_no, annot_no, has_own_name in template.widgets.get(name, ()):
+            if own_name_only and not has_own_name:
+                continue
+            yield writer.pages[page_no]["/Annots"][annot_no].get_object()
+
+
+def _jt_pages(template: JTTemplate, *names) -> set:
+    """Page numbers holding a widget of any of the named fields."""
+    return {page_no for name in names for page_no, _, _ in template.widgets.get(name, ())}
+
+
+def _add_jt_pages(writer, template: JTTemplate, sources, at=None) -> JTTemplate:
+    """
+    Insert copies of template pages at page `at` (default: the end), renaming
+    the fields on each copy. Returns `template` with a widget index that
+    also covers the copies (slots of pages after `at` are shifted).
+
+    sources is [(source template, page number, rename), …]; rename maps a
+    top-level field name to the copy's. A page of `template` itself is copied
+    from the writer, so the copy shares its content stream, fonts and images;
+    a page of another template is cloned from that template's reader, once
+    per writer. Call before filling: copies start from the blank template.
+
+    Only the copied pages' annotations are visited, so adding n pages costs
+    O(n) however many there are.
+    """
+    at = len(writer.pages) if at is None else at
+    index = collections.defaultdict(list)
+    for name, slots in template.widgets.items():
+        index[name] = [(p + len(sources) if p >= at else p, a, own) for p, a, own in slots]
+
+    acro_fields = writer.root_object["/AcroForm"]["/Fields"]
+    # Reading a cached template's reader is not thread-safe
+    borrowed = any(src is not template for src, _, _ in sources)
+    with _jt_template_lock if borrowed else contextlib.nullcontext():
+        src_pages = [writer.pages[page_no] if src is template else src.reader.pages[page_no]
+                     for src, page_no, _ in sources]
+        for i, ((_, _, rename), src_page) in enumerate(zip(sources, src_pages)):
+            page = _copy_jt_page(writer, src_page, rename, acro_fields, at + i)
+            _index_jt_page(index, at + i, page)
+    return dataclasses.replace(template, widgets={name: tuple(slots) for name, slots in index.items()})
+
+
+def _copy_jt_page(writer, src_page, rename, acro_fields, page_no):
+    """Insert one renamed page copy for _add_jt_pages; returns the new page."""
+    from pypdf.generic import ArrayObject, DictionaryObject, NameObject, TextStringObject
+
+    def share(value):
+        return value.clone(writer)      # writer objects come back as they are
+
+    box = src_page.mediabox
+    writer.insert_blank_page(box.width, box.height, page_no)
+    page = writer.pages[page_no]
+    for key, value in src_page.items():
+        if key not in ("/Type", "/Parent", "/Annots", "/Resources", "/PieceInfo", "/Thumb"):
+            page[NameObject(key)] = share(value)
+
+    # Flattening appends to a /Contents array and to /Resources /XObject in place
+    contents = page.get("/Contents")
+    if contents is not None and isinstance(contents.get_object(), ArrayObject):
+        page[NameObject("/Contents")] = ArrayObject(contents.get_object())
+    resources = DictionaryObject(
+        {NameObject(k): share(v) for k, v in src_page["/Resources"].items()}
+    )
+    if "/XObject" in resources:
+        resources[NameObject("/XObject")] = DictionaryObject(resources["/XObject"].items())
+    page[NameObject("/Resources")] = resources
+
+    # Each widget gets its own field: a parent shared with another page
+    # (the pouch "W") is copied with just this page's kids
+    page[NameObject("/Annots")] = ArrayObject()
+    parents: dict = {}
+    for ref in src_page.get("/Annots", ()):
+        src = ref.get_object()
+        annot = writer.add_annotation(page, DictionaryObject(
+            {NameObject(k): share(v) for k, v in src.items() if k not in ("/P", "/Parent")}
+        ))
+        annot_ref = annot.indirect_reference
+        if src.get("/Subtype") != "/Widget":
+            continue
+        if "/Parent" not in src:
+            if "/T" in src:
+                annot[NameObject("/T")] = TextStringObject(rename(str(src["/T"])))
+                acro_fields.append(annot_ref)
+            continue
+        field = src["/Parent"].get_object()
+        parent = parents.get(field.indirect_reference.idnum)
+        if parent is None:
+            # a forced clone is always a new indirect object, even of a field
+            # that's already in the writer
+            parent = field.clone(writer, force_duplicate=True, ignore_fields=("/Kids", "/Parent"))
+            parent[NameObject("/T")] = TextStringObject(rename(str(field.get("/T", ""))))
+            parent[NameObject("/Kids")] = ArrayObject()
+            acro_fields.append(parent.indirect_reference)
+            parents[field.indirect_reference.idnum] = parent
+        parent["/Kids"].append(annot_ref)
+        annot[NameObject("/Parent")] = parent.indirect_reference
+    return page
+
+
+def _set_jt_fields(writer, template: JTTemplate, fields: dict, flatten=False) -> None:
+    """
+    update_page_form_field_values for just the widgets in `fields`.
+
+    pypdf compares every annotation on a page with every field passed in, so
+    each page's /Annots is narrowed to the indexed widgets for the call and
+    restored afterwards. Pages without a filled field are not visited.
+    With flatten, the appearances are also drawn into the page content.
+    """
+    from pypdf.generic import ArrayObject, NameObject, RectangleObject
+
+    by_page: dict = collections.defaultdict(lambda: ({}, set()))
+    for name, value in fields.items():
+        for page_no, annot_no, _ in template.widgets.get(name, ()):
+            page_fields, annot_nos = by_page[page_no]
+            page_fields[name] = value
+            annot_nos.add(annot_no)
+
+    for page_no in sorted(by_page):
+        page_fields, annot_nos = by_page[page_no]
+        page = writer.pages[page_no]
+        annots = page.raw_get("/Annots")    # restored as the same reference
+        all_annots = annots.get_object()
+        if flatten:
+            # pypdf draws a flattened appearance at /Rect's first corner; some
+            # template rects are stored top-down, which lands it a row too high
+            for i in annot_nos:
+                annot = all_annots[i].get_object()
+                x1, y1, x2, y2 = (float(v) for v in annot["/Rect"])
+                annot[NameObject("/Rect")] = RectangleObject(
+                    [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]
+                )
+        page[NameObject("/Annots")] = ArrayObject(all_annots[i] for i in sorted(annot_nos))
+        try:
+            writer.update_page_form_field_values(page, page_fields, flatten=flatten)
+        finally:
+            page[NameObject("/Annots")] = annots
+
+
+def _resolve_jt_output_profile(profile=None) -> str:
+    profile = JT_OUTPUT_PROFILE if profile is None else (profile or "standard").lower()
+    if profile not in JT_OUTPUT_PROFILES:
+        raise ValueError(f"Unknown JT output profile '{profile}' (use standard, slim or flat)")
+    return profile
+
+
+def _finish_jt(writer, template: JTTemplate, fields: dict, overflow_pages, profile) -> None:
+    """
+    Apply the slim/flat output profile to a filled template copy.
+
+    Must run after every widget lookup: dropping pages renumbers them. With
+    "flat" the fields were filled with flatten=True, so their text is already
+    in the page content; their widgets are kept but hidden and read-only, so
+    the values (/V) survive merging and parse_job_ticket can still read the
+    uploaded JT.
+
+    Both profiles also drop what only the authoring tool uses: Illustrator's
+    private editing data (/PieceInfo — most of each template's bytes), page
+    thumbnails and the XMP packet.
+    """
+    from pypdf.generic import NameObject, NumberObject
+
+    writer.xmp_metadata = None
+    for page in writer.pages:
+        page.pop(NameObject("/PieceInfo"), None)
+        page.pop(NameObject("/Thumb"), None)
+
+    if profile == "flat":
+        for annot in _jt_widgets(writer, template, fields):
+            annot.pop(NameObject("/AP"), None)
+            annot[NameObject("/F")] = NumberObject(int(annot.get("/F", 0)) | 2)      # Hidden
+            field = annot if "/T" in annot else annot["/Parent"].get_object()
+            field[NameObject("/Ff")] = NumberObject(int(field.get("/Ff", 0)) | 1)    # ReadOnly
+
+    # Overflow pages that no filled field needs. A field that also has a
+    # widget on a main page (the pouch "W" shares its parent with the row-W
+    # cell on the overflow page) doesn't keep an overflow page alive.
+    used = set()
+    for name in fields:
+        pages = _jt_pages(template, name)
+        if pages <= set(overflow_pages):
+            used |= pages
+    unused = sorted(set(overflow_pages) - used, reverse=True)
+    if unused:
+        acro_fields = writer.root_object["/AcroForm"]["/Fields"]
+        for page_no in unused:
+            _drop_jt_page_fields(writer.pages[page_no], acro_fields)
+            writer.remove_page(page_no)
+
+
+def _drop_jt_page_fields(page, acro_fields) -> None:
+    """Remove a page's widgets from the AcroForm field tree."""
+    from pypdf.generic import NameObject
+
+    def without(array, ref):
+        idnum = ref.indirect_reference.idnum
+        array[:] = [r for r in array if getattr(r, "idnum", None) != idnum]
+
+    annots = page.get("/Annots")
+    for ref in annots.get_object() if annots else ():
+        widget = ref.get_object()
+        if widget.get("/Subtype") != "/Widget":
+            continue
+        parent = widget.get("/Parent")
+        if parent is None:
+            without(acro_fields, widget)
+            continue
+        parent = parent.get_object()
+        kids = parent.get("/Kids")
+        if kids is not None:
+            without(kids.get_object(), widget)
+            if not kids.get_object() and "/Parent" not in parent:
+                without(acro_fields, parent)
+                parent.pop(NameObject("/Kids"), None)
+
+
+def _jt_objects(writer, roots) -> dict:
+    """{idnum: object} for every writer object reachable from `roots`."""
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject
+
+    found = {}
+    stack = [roots]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, DictionaryObject):      # includes streams
+            children = obj.values()
+        elif isinstance(obj, (ArrayObject, list)):
+            children = obj
+        else:
+            continue
+        for child in children:
+            if isinstance(child, IndirectObject):
+                if child.pdf is not writer or child.idnum in found:
+                    continue
+                found[child.idnum] = child = child.get_object()
+            stack.append(child)
+    return found
+
+
+def _drop_unreachable_objects(writer) -> None:
+    """
+    Empty every object no longer reachable from the catalog, so the next
+    compress_identical_objects pass frees all of them.
+
+    compress_identical_objects only drops objects nothing refers to, one level
+    per call, and never frees a cycle (a dropped page and its widgets' /P);
+    what a dropped page or /PieceInfo leaves behind is a chain. Each emptied
+    object is tagged with its own number: pypdf can redirect a live reference
+    to an identical orphan and then free that orphan.
+    """
+    from pypdf.errors import PdfReadError
+    from pypdf.generic import ArrayObject, NameObject, NumberObject, StreamObject
+
+    reachable = _jt_objects(writer, [writer.root_object])
+    reachable[writer.root_object.indirect_reference.idnum] = writer.root_object
+    info = writer.metadata
+    idnum = 0
+    while True:
+        idnum += 1
+        try:
+            obj = writer.get_object(idnum)
+        except IndexError:
+            break
+        except PdfReadError:    # already freed
+            continue
+        if idnum in reachable or (info is not None and obj == info):
+            continue
+        if isinstance(obj, StreamObject):
+            # keep what decoding needs: pypdf still hashes the orphan once
+            for key in [k for k in obj if k not in ("/Filter", "/DecodeParms")]:
+                del obj[key]
+            obj[NameObject("/Unreachable")] = NumberObject(idnum)
+        elif isinstance(obj, ArrayObject):
+            obj[:] = [NumberObject(idnum)]
+        elif hasattr(obj, "clear"):
+            obj.clear()
+            obj[NameObject("/Unreachable")] = NumberObject(idnum)
+
+
+def _compress_jt(writer) -> None:
+    """Deduplicate and Flate-compress a JT writer (slim/flat output)."""
+    import zlib
+    from pypdf.generic import NameObject, StreamObject
+
+    _drop_unreachable_objects(writer)
+    writer.compress_identical_objects()
+    for page in writer.pages:
+        page.compress_content_streams(level=9)
+    for obj in _jt_objects(writer, [writer.root_object]).values():
+        if isinstance(obj, StreamObject) and "/Filter" not in obj:
+            # pypdf's regenerated /AP streams are stored uncompressed; a decoded
+            # stream's set_data stores the bytes as given
+            data = obj.get_data()
+            obj[NameObject("/Filter")] = NameObject("/FlateDecode")
+            obj.set_data(zlib.compress(data, 9))
+
+
+def _write_jt(writer, template: JTTemplate, out_path, profile) -> None:
+    """Write a filled JT, compressed unless the profile is "standard"."""
+    if profile != "standard":
+        _compress_jt(writer)
+    with open(str(out_path), "wb") as f:
+        writer.write(f)
+    _metrics.inc("jt_pages_total", len(writer.pages))
+    log.info(
+        f"[jt-output] {profile}: {len(template.reader.pages)} → {len(writer.pages)} pages, "
+        f"{template.size} B template → {Path(out_path).stat().st_size} B {Path(out_path).name}"
+    )
+
+
+def get_jt_template(template_path) -> JTTemplate:
+    """Parsed template for template_path, re-loaded if the file has changed."""
+    path = Path(template_path).resolve()
+    st = path.stat()
+    with _jt_template_lock:
+        cached = _jt_templates.get(path)
+        if cached and (cached.mtime_ns, cached.size) == (st.st_mtime_ns, st.st_size):
+            return cached
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if cached and cached.sha256 == digest:
+            entry = dataclasses.replace(cached, mtime_ns=st.st_mtime_ns, size=st.st_size)
+        else:
+            if cached:
+                log.info(f"[jt-template] {path.name} changed on disk — reloading")
+            entry = _load_jt_template(path, st, data, digest)
+        _jt_templates[path] = entry
+        return entry
+
+
+def _open_jt_template(template_path):
+    """The cached template and a fresh PdfWriter holding a private copy of it."""
+    from pypdf import PdfWriter
+
+    template = get_jt_template(template_path)
+    with _jt_template_lock:
+        return template, PdfWriter(clone_from=template.reader)
+
+
+def warm_jt_templates() -> None:
+    """Parse every Job Ticket template up front (server start / serverless cold start)."""
+    for path in JT_TEMPLATE_PATHS:
+        try:
+            get_jt_template(path)
+        except Exception as e:
+            # Non-fatal: the fill retries the load and reports the error there
+            log.warning(f"[jt-template] could not preload {Path(path).name}: {e}")
+
+
+def _add_nonpouch_overflow_pages(writer, template: JTTemplate, count: int) -> tuple:
+    """
+    Give a Non-Pouch JT room for `count` overflow rows.
+
+    Returns (template, rows): the template with its widget index extended
+    and the manifest rows to fill, in order. The NoAPP template has P2–P4;
+    later pages are copies of the last with its sheet number replaced
+    (P5_R01_ITEM, …). The WITH_APP template has none, so its overflow pages
+    are borrowed from the NoAPP template and go before the Application page.
+    """
+    own = _jt_overflow_rows(template.manifest)
+    src = template if own else get_jt_template(NONPOUCH_JT_NOAPP_TEMPLATE_PATH)
+    by_page: dict = {}
+    for row in _jt_overflow_rows(src.manifest):
+        by_page.setdefault(row["page"], []).append(row)
+    pages = list(by_page)
+    last_sheet = by_page[pages[-1]][0]["sheet"]
+
+    rows, sources = [], []
+    for k in itertools.count():
+        if len(rows) >= count:
+            break
+        if k < len(pages):
+            page_no, rename = pages[k], str
+        else:
+            sheet = last_sheet + k - len(pages) + 1
+            page_no = pages[-1]
+            rename = functools.partial(re.sub, rf"^P{last_sheet}_", f"P{sheet}_")
+        if src is not template or k >= len(pages):
+            sources.append((src, page_no, rename))
+        rows += [_rename_jt_row(row, rename) for row in by_page[page_no]]
+    if sources:
+        log.info(f"[fill-nonpouch-jt] adding {len(sources)} overflow page(s)")
+        at = (max(row["page"] for row in own) if own else template.manifest["rows"][0]["page"]) + 1
+        template = _add_jt_pages(writer, template, sources, at=at)
+    return template, rows
+
+
+def _fill_nonpouch_jt(template_path, item_data: dict, specs: dict, subitems: list, out_path,
+                      profile=None) -> None:
+    """
+    Fill a Non-Pouch Job Ticket PDF template and save to out_path.
+
+    Page 0 has 14 item rows (letters A–N), pages 1–3 the P2/P3/P4 overflow
+    rows (24 each); the field names of each row come from the template
+    manifest. The page-0 DETAIL SKU column holds the SIZE on this template.
+    Longer lists get more pages as needed, copies of P4 with fields named
+    P5_R01_ITEM, … (see _add_nonpouch_overflow_pages), so nothing is truncated.
+
+    profile selects the output profile (JT_OUTPUT_PROFILE by default).
+    """
     from pypdf.generic import NameObject, create_string_object
 
-    reader = PdfReader(str(template_path))
-    writer = PdfWriter()
-    writer.append(reader)
+    profile = _resolve_jt_output_profile(profile)
+    template, writer = _open_jt_template(template_path)
 
     size = (specs.get("size") or "").strip()
     mc = (specs.get("material_coating") or "").strip()
@@ -1503,7 +4695,7 @@ def _fill_nonpouch_jt(template_path, item_data: dict, specs: dict, subitems: lis
     # -----------------------------------------------------------------------
     # Page 0: AcroForm rows A–N (14 rows)
     # -----------------------------------------------------------------------
-    _PAGE0_LETTERS = list("ABCDEFGHIJKLMN")  # 14 letters
+    page0_rows = _jt_main_rows(template.manifest)
 
     acroform_fields: dict[str, str] = {}
     def _a(k, v):
@@ -1518,76 +4710,51 @@ def _fill_nonpouch_jt(template_path, item_data: dict, specs: dict, subitems: lis
     _a("CUSTOMER PO", item_data.get("customer_po", ""))
 
     # Page 0 item rows — fill as many as we have subitems (up to 14)
-    page0_subitems = subitems[: len(_PAGE0_LETTERS)]
-    overflow_subitems = subitems[len(_PAGE0_LETTERS):]
-
-    for i, subitem in enumerate(page0_subitems):
-        L = _PAGE0_LETTERS[i]
-        # Row N has a leading space before the letter in most field names
-        sp = " " if L == "N" else ""
-        item_name = (subitem.get("name") or "").strip()
-        qty = (subitem.get("qty") or "").strip()
-        # Item # column ({L}) = SKU/subitem name
-        _a(L, item_name)
-        # DETAIL  SKU{L} = SIZE column on the non-pouch template
-        _a(f"DETAIL  SKU{sp}{L}", size)
-        _a(f"QTY TO PRINT{sp}{L}", qty)
-        _a(f"M&C {L}", mc)
+    page0_subitems = subitems[: len(page0_rows)]
+    overflow_subitems = subitems[len(page0_rows):]
+
+    for row, subitem in zip(page0_rows, page0_subitems):
+        cols = row["cols"]
+        # Item # column = SKU/subitem name
+        _a(cols["item"], (subitem.get("name") or "").strip())
+        _a(cols["detail"], size)
+        _a(cols["qty"], (subitem.get("qty") or "").strip())
+        _a(cols["mc"], mc)
         # FILE NAME left blank for team to fill
 
     # -----------------------------------------------------------------------
-    # Pages 1–3: overflow rows (P2/P3/P4)
+    # Pages 1–3: overflow rows (P2/P3/P4), then added pages P5, P6, …
     # -----------------------------------------------------------------------
     row_field_values: dict[str, str] = {}
     if overflow_subitems:
-        slots: list[tuple[int, int, bool]] = []
-        for r in range(1, 15):    # P2 rows 01–14: have _P2 suffix
-            slots.append((2, r, True))
-        for r in range(15, 25):   # P2 rows 15–24: no suffix
-            slots.append((2, r, False))
-        for r in range(1, 25):    # P3 rows 01–24
-            slots.append((3, r, False))
-        for r in range(1, 25):    # P4 rows 01–24
-            slots.append((4, r, False))
-
-        for slot_idx, subitem in enumerate(overflow_subitems[: len(slots)]):
-            p, r, has_suffix = slots[slot_idx]
-            sfx = f"_P{p}" if has_suffix else ""
-            rr = f"{r:02d}"
-            row_field_values[f"P{p}_R{rr}_ITEM{sfx}"] = (subitem.get("name") or "").strip()
-            row_field_values[f"P{p}_R{rr}_QTY{sfx}"] = (subitem.get("qty") or "").strip()
-            row_field_values[f"P{p}_R{rr}_SIZE{sfx}"] = size
-            row_field_values[f"P{p}_R{rr}_MC{sfx}"] = mc
+        template, overflow_rows = _add_nonpouch_overflow_pages(writer, template, len(overflow_subitems))
+
+        for row, subitem in zip(overflow_rows, overflow_subitems):
+            cols = row["cols"]
+            row_field_values[cols["item"]] = (subitem.get("name") or "").strip()
+            row_field_values[cols["qty"]] = (subitem.get("qty") or "").strip()
+            row_field_values[cols["size"]] = size
+            row_field_values[cols["mc"]] = mc
 
         # Pre-set Ff=4096 (multiline) on overflow ITEM annotations so pypdf
         # generates wrapping appearances — matching how page-1 fields behave.
         # Page-1 fields already have Ff=4096 in the template; overflow fields don't.
         from pypdf.generic import NumberObject
         _ff_multiline = NumberObject(4096)
-        for page in writer.pages:
-            annots_ref = page.get("/Annots")
-            if not annots_ref:
-                continue
-            annots = annots_ref.get_object() if hasattr(annots_ref, "get_object") else annots_ref
-            for ref in annots:
-                try:
-                    annot = ref.get_object()
-                except Exception:
-                    continue
-                field_name = str(annot.get("/T", ""))
-                if field_name in row_field_values:
-                    annot[NameObject("/Ff")] = _ff_multiline
+        for annot in _jt_widgets(writer, template, row_field_values, own_name_only=True):
+            annot[NameObject("/Ff")] = _ff_multiline
 
-        log.info(f"[fill-nonpouch-jt] overflow: {len(row_field_values)} P2/P3/P4 rows")
+        log.info(f"[fill-nonpouch-jt] overflow: {len(overflow_subitems)} rows")
 
     # Fill ALL fields (page-1 + overflow) with update_page_form_field_values so
     # pypdf generates consistent /AP streams for every page uniformly.
     all_fields = {**acroform_fields, **row_field_values}
-    for page in writer.pages:
-        writer.update_page_form_field_values(page, all_fields)
+    _set_jt_fields(writer, template, all_fields, flatten=profile == "flat")
 
-    with open(str(out_path), "wb") as f:
-        writer.write(f)
+    if profile != "standard":
+        overflow_qty = (row["cols"]["qty"] for row in _jt_overflow_rows(template.manifest))
+        _finish_jt(writer, template, all_fields, _jt_pages(template, *overflow_qty), profile)
+    _write_jt(writer, template, out_path, profile)
 
     log.info(
         f"[fill-nonpouch-jt] {len(acroform_fields)} AcroForm fields "
@@ -1595,13 +4762,19 @@ def _fill_nonpouch_jt(template_path, item_data: dict, specs: dict, subitems: lis
     )
 
 
-def _fill_pouch_jt(template_path, item_data: dict, pouch_specs: dict, subitems: list, out_path) -> None:
+def _fill_pouch_jt(template_path, item_data: dict, pouch_specs: dict, subitems: list, out_path,
+                   profile=None) -> None:
     """Fill the Pouch Job Ticket PDF template and save to out_path."""
-    from pypdf import PdfReader, PdfWriter
+    profile = _resolve_jt_output_profile(profile)
+    writer = _build_pouch_jt(template_path, item_data, pouch_specs, subitems, profile)
+    _write_jt(writer, get_jt_template(template_path), out_path, profile)
 
-    reader = PdfReader(str(template_path))
-    writer = PdfWriter()
-    writer.append(reader)
+
+def _build_pouch_jt(template_path, item_data: dict, pouch_specs: dict, subitems: list,
+                    profile=None):
+    """Fill a private copy of the Pouch Job Ticket template; returns the PdfWriter."""
+    profile = _resolve_jt_output_profile(profile)
+    template, writer = _open_jt_template(template_path)
 
     fields: dict = {}
 
@@ -1631,17 +4804,7 @@ def _fill_pouch_jt(template_path, item_data: dict, pouch_specs: dict, subitems:
     _DROPDOWN_DEFAULTS = {
         "Dropdown6": "NONE",  # hang_hole: if not specified, default to None
     }
-    for field_name, spec_key in [
-        ("Dropdown1", "premium_white"),
-        ("Dropdown2", "substrate"),
-        ("Dropdown3", "color"),
-        ("Dropdown4", "lamination"),
-        ("Dropdown5", "zipper"),
-        ("Dropdown6", "hang_hole"),
-        ("Dropdown8", "tear_notches"),
-        ("Dropdown9", "seal_type"),
-        ("Dropdown10", "corner"),
-    ]:
+    for spec_key, field_name in _POUCH_DROPDOWN_FIELDS.items():
         val = (pouch_specs.get(spec_key) or "").strip()
         if not val:
             val = _DROPDOWN_DEFAULTS.get(field_name, "")
@@ -1650,49 +4813,91 @@ def _fill_pouch_jt(template_path, item_data: dict, pouch_specs: dict, subitems:
     # Details text area
     _set("DETAILSRow1", (pouch_specs.get("details") or "").strip())
 
-    # Subitem rows — fill QTY and DETAIL SKU; leave ITEM# blank (team fills it)
-    for i, subitem in enumerate(subitems[: len(_JT_ALL_ROWS)]):
-        row = _JT_ALL_ROWS[i]
-        qty = (subitem.get("qty") or "").strip()
-        sku_name = (subitem.get("name") or "").strip()
-        _set(f"QTY TO PRINT{row}", qty)
-        # Rows A–O have DOUBLE SPACE before SKU; P+ have single space
-        detail_key = f"DETAIL  SKU{row}" if row in _JT_ROWS_AO else f"DETAIL SKU{row}"
-        _set(detail_key, sku_name)
-
-    for page in writer.pages:
-        writer.update_page_form_field_values(page, fields)
-
-    # After filling, increase font size for dimension fields and force re-render.
-    # update_page_form_field_values bakes a cached appearance (/AP); deleting it
-    # makes PDF viewers fall back to /DA (Default Appearance) which we set to 12pt.
+    # Subitem rows — fill QTY and DETAIL SKU; leave ITEM# blank (team fills it).
+    # Rows past RR go on copies of the P–RR page with a _P{n} name suffix.
+    rows = template.manifest["rows"]
+    last_page = rows[-1]["page"]
+    page_rows = [row for row in rows if row["page"] == last_page]
+    extra_pages = -(-max(len(subitems) - len(rows), 0) // len(page_rows))
+    if extra_pages:
+        first = last_page + 2       # 1-based number of the first added page
+        renames = [lambda name, n=n: f"{name}_P{n}" for n in range(first, first + extra_pages)]
+        template = _add_jt_pages(writer, template, [(template, last_page, rename) for rename in renames])
+        rows = rows + [_rename_jt_row(row, rename) for rename in renames for row in page_rows]
+        log.info(f"[fill-jt] adding {extra_pages} overflow page(s)")
+
+    for row, subitem in zip(rows, subitems):
+        _set(row["cols"]["qty"], (subitem.get("qty") or "").strip())
+        _set(row["cols"]["detail"], (subitem.get("name") or "").strip())
+
+    # Dimension fields use a 12pt font. update_page_form_field_values bakes a
+    # cached appearance (/AP); deleting it after the fill makes PDF viewers fall
+    # back to /DA (Default Appearance). Flattened output keeps the 12pt /AP.
     from pypdf.generic import NameObject, create_string_object
-    _DIM_FIELDS = {"W", "H", "G"}
-    for page in writer.pages:
-        annots = page.get("/Annots") or []
-        for ref in annots:
-            try:
-                annot = ref.get_object()
-            except Exception:
-                continue
-            t = str(annot.get("/T", ""))
-            if t not in _DIM_FIELDS:
-                continue
-            da = str(annot.get("/DA", "/Helv 8 Tf 0 g"))
-            new_da = re.sub(r"[\d.]+\s+Tf", "12 Tf", da)
-            if "Tf" not in new_da:
-                new_da = "/Helv 12 Tf 0 g"
-            annot[NameObject("/DA")] = create_string_object(new_da)
+    _DIM_FIELDS = ("W", "H", "G")
+    dim_annots = list(_jt_widgets(writer, template, _DIM_FIELDS, own_name_only=True))
+    for annot in dim_annots:
+        da = str(annot.get("/DA", "/Helv 8 Tf 0 g"))
+        new_da = re.sub(r"[\d.]+\s+Tf", "12 Tf", da)
+        if "Tf" not in new_da:
+            new_da = "/Helv 12 Tf 0 g"
+        annot[NameObject("/DA")] = create_string_object(new_da)
+
+    _set_jt_fields(writer, template, fields, flatten=profile == "flat")
+
+    if profile != "flat":
+        for annot in dim_annots:
             if NameObject("/AP") in annot:
                 del annot[NameObject("/AP")]
 
-    with open(str(out_path), "wb") as f:
-        writer.write(f)
+    if profile != "standard":
+        overflow_qty = (row["cols"]["qty"] for row in _jt_overflow_rows(template.manifest))
+        overflow_pages = _jt_pages(template, *overflow_qty)
+        _finish_jt(writer, template, fields, overflow_pages, profile)
+
+    log.info(f"[fill-jt] filled {len(fields)} fields")
+    return writer
+
 
-    log.info(f"[fill-jt] wrote {len(fields)} fields → {out_path}")
+def _combine_pouch_jts(lots: list, out_path, profile=None) -> None:
+    """
+    Merge filled pouch JTs — [(sku, PdfWriter), …] in lot order — into one
+    multi-lot PDF with an outline entry per lot.
+
+    Lot 1 keeps the template's field names, so parse_job_ticket reads it as a
+    normal pouch JT (every lot carries the same subitem rows). Later lots get
+    " LOT{n}" appended to their top-level field names so each lot stays
+    separately editable. Objects that are identical across lots (fonts,
+    images, static page content) are stored once.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import NameObject, TextStringObject
+
+    profile = _resolve_jt_output_profile(profile)
+    if len(lots) == 1:
+        _write_jt(lots[0][1], get_jt_template(POUCH_JT_TEMPLATE_PATH), out_path, profile)
+        return
+
+    combined = PdfWriter()
+    for n, (sku, writer) in enumerate(lots, 1):
+        if n > 1:
+            for ref in writer.root_object["/AcroForm"]["/Fields"]:
+                field = ref.get_object()
+                field[NameObject("/T")] = TextStringObject(f"{field['/T']} LOT{n}")
+        combined.append(writer, outline_item=f"Lot {n}" + (f" — {sku}" if sku else ""))
+    combined.set_need_appearances_writer(True)
+    if profile == "standard":
+        combined.compress_identical_objects()
+    else:
+        _compress_jt(combined)
+    with open(str(out_path), "wb") as f:
+        combined.write(f)
+    _metrics.inc("jt_pages_total", len(combined.pages))
+    log.info(f"[fill-jt] combined {len(lots)} pouch JTs → {out_path} ({Path(out_path).stat().st_size} bytes)")
 
 
-def _upload_file_to_monday_column(item_id: int, file_path, column_id: str) -> None:
+def _upload_file_to_monday_column(item_id: int, file_path, column_id: str,
+                                  deadline: float | None = None) -> None:
     """Upload any file to a specified Monday.com file column."""
     token = get_token()
     mutation = """
@@ -1707,42 +4912,202 @@ def _upload_file_to_monday_column(item_id: int, file_path, column_id: str) -> No
         file_bytes = f.read()
 
     filename = Path(file_path).name
-    resp = requests.post(
-        MONDAY_FILE_API_URL,
-        headers={"Authorization": token, "API-Version": "2024-01"},
-        files={
-            "query": (None, mutation),
-            "variables": (None, json.dumps(variables)),
-            "map": (None, json.dumps({"file": ["variables.file"]})),
-            "file": (filename, file_bytes, "application/pdf"),
-        },
-        timeout=60,
-    )
-    resp.raise_for_status()
+    with _span("monday.upload", file=filename, bytes=len(file_bytes)) as span:
+        resp = requests.post(
+            MONDAY_FILE_API_URL,
+            headers={"Authorization": token, "API-Version": "2024-01"},
+            files={
+                "query": (None, mutation),
+                "variables": (None, json.dumps(variables)),
+                "map": (None, json.dumps({"file": ["variables.file"]})),
+                "file": (filename, file_bytes, _upload_mimetype(file_path)),
+            },
+            timeout=_budget_timeout(deadline, 60),
+        )
+        span.set(status=resp.status_code)
+        resp.raise_for_status()
     result = resp.json()
     if "errors" in result:
         raise RuntimeError(f"Upload error: {result['errors']}")
+    _metrics.inc("bytes_total", len(file_bytes), direction="upload")
     log.info(f"[upload] {filename} → column '{column_id}' on item {item_id}")
 
 
-def _process_proof_approved(item_id: int) -> None:
+def _spec_cache_path(pi_number: str, asset_id: str) -> Path:
+    safe = lambda s: re.sub(r"[^\w.-]", "_", str(s))
+    return JT_SPEC_CACHE_DIR / f"{safe(pi_number)}__{safe(asset_id)}.json"
+
+
+def _load_spec_cache(pi_number: str, asset_id: str) -> dict | None:
+    """Cached invoice specs for this PI# and invoice file, or None."""
+    if not JT_SPEC_CACHE:
+        return None
+    path = _spec_cache_path(pi_number, asset_id)
+    try:
+        entry = json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning(f"[spec-cache] ignoring unreadable {path.name}: {e}")
+        return None
+    if entry.get("version") != JT_SPEC_CACHE_VERSION or time.time() - entry.get("created", 0) > JT_SPEC_CACHE_TTL_S:
+        path.unlink(missing_ok=True)
+        return None
+    return entry
+
+
+def _store_spec_cache(pi_number: str, asset_id: str, pouch_specs: list,
+                      nonpouch_specs: dict | None = None, invoice_name: str = "") -> None:
+    """Cache the specs extracted from one invoice file (entries for older files of the PI# go)."""
+    if not JT_SPEC_CACHE:
+        return
+    path = _spec_cache_path(pi_number, asset_id)
+    entry = {
+        "version": JT_SPEC_CACHE_VERSION,
+        "created": time.time(),
+        "pi_number": pi_number,
+        "asset_id": asset_id,
+        "invoice_name": invoice_name,
+        "pouch_specs": pouch_specs,
+        "nonpouch_specs": nonpouch_specs,
+    }
+    try:
+        JT_SPEC_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old in JT_SPEC_CACHE_DIR.glob(path.name.split("__")[0] + "__*.json"):
+            if old not in (path, _uploaded_jts_path(pi_number, asset_id)):
+                old.unlink(missing_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(entry))
+        tmp_path.replace(path)
+    except OSError as e:
+        # Non-fatal: the specs are only re-extracted next time
+        log.warning(f"[spec-cache] could not write {path.name}: {e}")
+        return
+    log.info(f"[spec-cache] stored PI#{pi_number} asset {asset_id}")
+
+
+def _uploaded_jts_path(pi_number: str, asset_id: str) -> Path:
+    return _spec_cache_path(pi_number, asset_id).with_suffix(".uploaded.json")
+
+
+def _load_uploaded_jts(pi_number: str, asset_id: str) -> set:
+    """JT file names a failed run for this invoice file already uploaded."""
+    path = _uploaded_jts_path(pi_number, asset_id)
+    try:
+        return set(json.loads(path.read_text()))
+    except FileNotFoundError:
+        return set()
+    except (OSError, ValueError) as e:
+        log.warning(f"[spec-cache] ignoring unreadable {path.name}: {e}")
+        return set()
+
+
+def _store_uploaded_jts(pi_number: str, asset_id: str, names) -> None:
+    """Record the JTs a failed run uploaded (an empty set clears the record)."""
+    path = _uploaded_jts_path(pi_number, asset_id)
+    try:
+        if not names:
+            path.unlink(missing_ok=True)
+            return
+        JT_SPEC_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(sorted(names)))
+    except OSError as e:
+        log.warning(f"[spec-cache] could not write {path.name}: {e}")
+
+
+@_timed_pipeline("prefetch")
+def _prefetch_invoice_specs(item_id: int) -> str:
+    """
+    Steps 1–5a of Proof Approved ahead of approval: find the invoice for the
+    item's PI#, extract its text and specs, and cache them for the approval
+    run. Returns what happened ("prefetched", "cached" or "no PI#").
+    """
+    deadline = time.monotonic() + PROOF_APPROVED_BUDGET_S
+    try:
+        item_data = _get_item_data_for_jt(item_id, deadline)
+    except Exception as e:
+        raise RuntimeError(f"[step 1 fetch-item] {e}") from e
+    pi_number = item_data.get("pi_number", "").strip()
+    if not pi_number:
+        return "no PI#"
+
+    try:
+        asset_id, invoice_name, _ = _find_invoice_asset(pi_number, deadline)
+        if _load_spec_cache(pi_number, asset_id):
+            log.info(f"[prefetch] PI#{pi_number} asset {asset_id} already cached")
+            return "cached"
+        invoice_url, invoice_name = _invoice_asset_url(asset_id, invoice_name, pi_number, deadline)
+    except Exception as e:
+        raise RuntimeError(f"[step 2 find-invoice PI#{pi_number}] {e}") from e
+
+    with tempfile.TemporaryDirectory() as _tmp:
+        invoice_path = Path(_tmp) / "invoice.pdf"
+        try:
+            download_file(invoice_url, invoice_path, deadline=deadline)
+        except Exception as e:
+            raise RuntimeError(f"[step 3 download-invoice] {e}") from e
+        try:
+            invoice_text = _extract_invoice_text(invoice_path)
+        except Exception as e:
+            raise RuntimeError(f"[step 4 extract-text] {e}") from e
+
+    try:
+        pouch_specs = _extract_pouch_specs(invoice_text, item_id, deadline)
+    except Exception as e:
+        raise RuntimeError(f"[step 5a claude-pouch] {e}") from e
+    nonpouch_specs = None
+    if not pouch_specs:
+        try:
+            nonpouch_specs = _extract_nonpouch_specs(invoice_text, item_id, deadline)
+        except Exception as e:
+            raise RuntimeError(f"[step 5b claude-nonpouch] {e}") from e
+    _store_spec_cache(pi_number, asset_id, pouch_specs, nonpouch_specs, invoice_name)
+    _log_claude_item_usage(item_id)
+    log.info(
+        f"[prefetch] item {item_id} PI#{pi_number}: {len(pouch_specs)} pouch spec(s)"
+        + ("" if pouch_specs else f", non-pouch={'yes' if nonpouch_specs else 'no'}")
+    )
+    return "prefetched"
+
+
+def _is_proof_approved_event(event: dict) -> bool:
+    """True for a Proof Status change to "Proof Approved" (the label text in the event value)."""
+    value = event.get("value")
+    label = value.get("label") if isinstance(value, dict) else None
+    text = label.get("text") if isinstance(label, dict) else label
+    return str(text or "").strip().lower() == PROOF_APPROVED_LABEL.lower()
+
+
+@_timed_pipeline("proof_approved")
+def _process_proof_approved(item_id: int, deadline: float | None = None) -> None:
     """
     End-to-end handler for Proof Approved trigger:
       1. Fetch item data (customer, PI#, subitems, …) from Monday
       2. Find and download ProForma invoice from Pricing board via PI#
       3. Extract invoice text
+         (2–3 and the Claude calls are skipped when the specs for this invoice
+         file were cached by a prefetch or an earlier run)
       4a. If pouch line items found → fill Pouch JT template (one per distinct size)
       4b. Else if label line items found → fill Non-Pouch JT template (NoAPP or WITH_Application)
       4c. Else → skip silently
       5. Upload filled PDF(s) to Job Ticket column
       6. Directly generate prelim labels (Monday may not fire the JT webhook for uploads)
+
+    `deadline` (absolute time.monotonic(), default PROOF_APPROVED_BUDGET_S from
+    now) caps every Monday, download and Claude call. The JT uploads may run
+    into PROOF_APPROVED_GRACE_S past it; prelim labels are handed to a
+    follow-up request when less than PRELIM_LABELS_MIN_S is left.
     """
+    if deadline is None:
+        deadline = time.monotonic() + PROOF_APPROVED_BUDGET_S
+    upload_deadline = deadline + PROOF_APPROVED_GRACE_S
     with tempfile.TemporaryDirectory() as _tmp:
         tmp = Path(_tmp)
 
         try:
             log.info(f"[proof-approved] step 1/6 — fetching item data for {item_id}")
-            item_data = _get_item_data_for_jt(item_id)
+            with _stage("proof_approved", "monday_query"):
+                item_data = _get_item_data_for_jt(item_id, deadline)
         except Exception as e:
             raise RuntimeError(f"[step 1 fetch-item] {e}") from e
 
@@ -1753,7 +5118,14 @@ def _process_proof_approved(item_id: int) -> None:
 
         try:
             log.info(f"[proof-approved] step 2/6 — looking up invoice for PI# {pi_number}")
-            invoice_url, invoice_name, pricing_customer = _find_invoice_on_pricing_board(pi_number)
+            with _stage("proof_approved", "monday_query"):
+                asset_id, invoice_name, pricing_customer = _find_invoice_asset(pi_number, deadline)
+            cached = _load_spec_cache(pi_number, asset_id)
+            if not cached:
+                with _stage("proof_approved", "monday_query"):
+                    invoice_url, invoice_name = _invoice_asset_url(asset_id, invoice_name, pi_number, deadline)
+            # JTs a failed run for this invoice already put on the item
+            already_uploaded = _load_uploaded_jts(pi_number, asset_id)
         except Exception as e:
             raise RuntimeError(f"[step 2 find-invoice PI#{pi_number}] {e}") from e
 
@@ -1762,26 +5134,30 @@ def _process_proof_approved(item_id: int) -> None:
             item_data["customer"] = pricing_customer
             log.info(f"[proof-approved] customer from Pricing board: '{pricing_customer}'")
 
-        try:
-            log.info(f"[proof-approved] step 3/6 — downloading invoice from {invoice_url[:80]}…")
-            invoice_path = tmp / "invoice.pdf"
-            download_file(invoice_url, invoice_path)
-            log.info(f"[proof-approved] invoice downloaded ({invoice_path.stat().st_size} bytes)")
-        except Exception as e:
-            raise RuntimeError(f"[step 3 download-invoice] {e}") from e
-
-        try:
-            log.info("[proof-approved] step 4/6 — extracting invoice text")
-            invoice_text = _extract_invoice_text(invoice_path)
-            log.info(f"[proof-approved] extracted {len(invoice_text)} chars of invoice text")
-        except Exception as e:
-            raise RuntimeError(f"[step 4 extract-text] {e}") from e
+        if cached:
+            # Prefetched (or left by an earlier run) for this exact invoice file
+            log.info(
+                f"[proof-approved] steps 3–5a skipped — specs for '{invoice_name}' cached "
+                f"{time.time() - cached['created']:.0f}s ago"
+            )
+            invoice_text = None
+        else:
+            try:
+                log.info(f"[proof-approved] step 3/6 — downloading invoice from {invoice_url[:80]}…")
+                invoice_path = tmp / "invoice.pdf"
+                with _stage("proof_approved", "download"):
+                    download_file(invoice_url, invoice_path, deadline=deadline)
+                log.info(f"[proof-approved] invoice downloaded ({invoice_path.stat().st_size} bytes)")
+            except Exception as e:
+                raise RuntimeError(f"[step 3 download-invoice] {e}") from e
 
-        try:
-            log.info("[proof-approved] step 5a/6 — calling Claude for pouch specs")
-            specs_list = _extract_pouch_specs(invoice_text)
-        except Exception as e:
-            raise RuntimeError(f"[step 5a claude-pouch] {e}") from e
+            try:
+                log.info("[proof-approved] step 4/6 — extracting invoice text")
+                with _stage("proof_approved", "parse"):
+                    invoice_text = _extract_invoice_text(invoice_path)
+                log.info(f"[proof-approved] extracted {len(invoice_text)} chars of invoice text")
+            except Exception as e:
+                raise RuntimeError(f"[step 4 extract-text] {e}") from e
 
         # Build a filesystem-safe base name: "Client Name_PI#_JT"
         _safe = re.sub(r'[\\/:*?"<>|]', "", item_data.get("customer", "Unknown"))
@@ -1790,13 +5166,33 @@ def _process_proof_approved(item_id: int) -> None:
 
         uploaded_jt_paths = []
 
-        if specs_list:
-            # --- Pouch job: one JT per distinct sizing line item ---
-            for i, pouch_specs in enumerate(specs_list, 1):
-                suffix = f"_{i}" if len(specs_list) > 1 else ""
-                jt_out = tmp / f"{_base}{suffix}.pdf"
-                try:
-                    log.info(f"[proof-approved] step 5b/6 — filling pouch JT {i}/{len(specs_list)}: {pouch_specs.get('sku', '')}")
+        # --- Pouch job: one JT per distinct sizing line item ---
+        # Specs stream in from Claude and each JT is filled and uploaded on the
+        # pool as soon as its object closes. The _1…_N suffix is only used when
+        # there is more than one size, so JT 1 is held (already filled) until a
+        # second spec arrives or the stream ends, then named and uploaded.
+        # With POUCH_JT_COMBINED the pool only fills; the lots are merged into
+        # one multi-lot JT and uploaded once when the stream ends.
+        # If the stream fails after uploads began, the JTs not yet uploaded are
+        # dropped and the ones that were are recorded, so a retry for the same
+        # invoice file skips them instead of uploading _1, _2 … a second time.
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        naming = {"single": None}    # stays None if the spec stream fails
+        named = threading.Event()
+        stream_failed = threading.Event()
+        uploaded_names = []
+
+        def fill_and_upload(i, pouch_specs):
+            jt_out = tmp / f"{_base}_{i}.pdf"
+            try:
+                log.info(f"[proof-approved] step 5b/6 — filling pouch JT {i}: {pouch_specs.get('sku', '')}")
+                with _stage("proof_approved", "fill"):
+                    if POUCH_JT_COMBINED:
+                        return (
+                            (pouch_specs.get("sku") or "").strip(),
+                            _build_pouch_jt(POUCH_JT_TEMPLATE_PATH, item_data, pouch_specs, item_data["subitems"]),
+                        )
                     _fill_pouch_jt(
                         POUCH_JT_TEMPLATE_PATH,
                         item_data,
@@ -1804,25 +5200,106 @@ def _process_proof_approved(item_id: int) -> None:
                         item_data["subitems"],
                         jt_out,
                     )
-                except Exception as e:
-                    raise RuntimeError(f"[step 5b fill-pouch-jt {i}] {e}") from e
+            except Exception as e:
+                raise RuntimeError(f"[step 5b fill-pouch-jt {i}] {e}") from e
+            named.wait()
+            if naming["single"] is None or stream_failed.is_set():
+                return None
+            if naming["single"]:
+                # Single size — no suffix
+                jt_out = jt_out.rename(tmp / f"{_base}.pdf")
+            if jt_out.name in already_uploaded:
+                log.info(f"[proof-approved] pouch JT {i} ({jt_out.name}) was uploaded by a failed run — skipping")
+                return jt_out
+            try:
+                log.info(f"[proof-approved] step 6/6 — uploading pouch JT {i}")
+                with _stage("proof_approved", "upload"):
+                    _upload_file_to_monday_column(item_id, jt_out, JOB_TICKET_COLUMN_ID, upload_deadline)
+            except Exception as e:
+                raise RuntimeError(f"[step 6 upload-pouch-jt {i}] {e}") from e
+            uploaded_names.append(jt_out.name)
+            return jt_out
+
+        jt_jobs = []
+        streamed_specs = []
+        pool = ThreadPoolExecutor(max_workers=max(1, JT_WORKERS), thread_name_prefix="pouch-jt")
+        if cached:
+            specs_iter = (dict(spec) for spec in cached["pouch_specs"])
+        else:
+            log.info("[proof-approved] step 5a/6 — streaming pouch specs from Claude")
+            specs_iter = _timed_iter(_iter_pouch_specs(invoice_text, item_id, deadline), "proof_approved", "claude")
+        try:
+            while True:
                 try:
-                    log.info(f"[proof-approved] step 6/6 — uploading pouch JT {i}/{len(specs_list)}")
-                    _upload_file_to_monday_column(item_id, jt_out, JOB_TICKET_COLUMN_ID)
-                    uploaded_jt_paths.append(jt_out)
+                    pouch_specs = next(specs_iter, None)
                 except Exception as e:
-                    raise RuntimeError(f"[step 6 upload-pouch-jt {i}] {e}") from e
-            log.info(f"[proof-approved] done — {len(specs_list)} pouch JT(s) uploaded for item {item_id}")
-        else:
-            # --- Not a pouch job — try non-pouch label template ---
+                    stream_failed.set()
+                    named.set()
+                    for job in jt_jobs:
+                        job.cancel()
+                    wait(jt_jobs)    # uploads already under way finish
+                    on_item = already_uploaded.union(uploaded_names)
+                    _store_uploaded_jts(pi_number, asset_id, on_item)
+                    note = f" — already uploaded: {', '.join(sorted(on_item))}" if on_item else ""
+                    raise RuntimeError(f"[step 5a claude-pouch] {e}{note}") from e
+                if pouch_specs is None:
+                    break
+                streamed_specs.append(pouch_specs)
+                jt_jobs.append(pool.submit(_in_current_context(fill_and_upload), len(jt_jobs) + 1, pouch_specs))
+                if len(jt_jobs) == 2:
+                    naming["single"] = False
+                    named.set()
+            naming["single"] = len(jt_jobs) == 1
+            named.set()
+            if jt_jobs and not cached:
+                # Before the uploads: a retried approval after a failed one skips Claude
+                _store_spec_cache(pi_number, asset_id, streamed_specs, invoice_name=invoice_name)
+            # In _1…_N order, so a failure is reported for the lowest-numbered JT
+            results = [job.result() for job in jt_jobs]
+        finally:
+            named.set()
+            specs_iter.close()
+            pool.shutdown(wait=True)
+        pouch_count = len(jt_jobs)
+        if already_uploaded:
+            _store_uploaded_jts(pi_number, asset_id, ())    # this run got them all through
+
+        if POUCH_JT_COMBINED and pouch_count:
+            jt_out = tmp / f"{_base}.pdf"
+            try:
+                log.info(f"[proof-approved] step 5c/6 — combining {pouch_count} pouch JT(s)")
+                with _stage("proof_approved", "combine"):
+                    _combine_pouch_jts(results, jt_out)
+            except Exception as e:
+                raise RuntimeError(f"[step 5c combine-pouch-jt] {e}") from e
             try:
-                log.info("[proof-approved] step 5b/6 — calling Claude for non-pouch specs")
-                nonpouch_specs = _extract_nonpouch_specs(invoice_text)
+                log.info("[proof-approved] step 6/6 — uploading combined pouch JT")
+                with _stage("proof_approved", "upload"):
+                    _upload_file_to_monday_column(item_id, jt_out, JOB_TICKET_COLUMN_ID, upload_deadline)
+                uploaded_jt_paths.append(jt_out)
             except Exception as e:
-                raise RuntimeError(f"[step 5b claude-nonpouch] {e}") from e
+                raise RuntimeError(f"[step 6 upload-pouch-jt] {e}") from e
+        else:
+            uploaded_jt_paths.extend(results)
+
+        if pouch_count:
+            log.info(f"[proof-approved] done — {pouch_count} pouch JT(s) uploaded for item {item_id}")
+        else:
+            # --- Not a pouch job — try non-pouch label template ---
+            if cached:
+                nonpouch_specs = cached["nonpouch_specs"]
+            else:
+                try:
+                    log.info("[proof-approved] step 5b/6 — calling Claude for non-pouch specs")
+                    with _stage("proof_approved", "claude"):
+                        nonpouch_specs = _extract_nonpouch_specs(invoice_text, item_id, deadline)
+                except Exception as e:
+                    raise RuntimeError(f"[step 5b claude-nonpouch] {e}") from e
+                _store_spec_cache(pi_number, asset_id, [], nonpouch_specs, invoice_name)
 
             if nonpouch_specs is None:
                 log.info(f"[proof-approved] item {item_id} is not a pouch or label job — skipping")
+                _log_claude_item_usage(item_id)
                 return
 
             has_app = nonpouch_specs.get("has_application", False)
@@ -1834,30 +5311,38 @@ def _process_proof_approved(item_id: int) -> None:
 
             jt_out = tmp / f"{_base}.pdf"
             try:
-                _fill_nonpouch_jt(
-                    template,
-                    item_data,
-                    nonpouch_specs,
-                    item_data["subitems"],
-                    jt_out,
-                )
+                with _stage("proof_approved", "fill"):
+                    _fill_nonpouch_jt(
+                        template,
+                        item_data,
+                        nonpouch_specs,
+                        item_data["subitems"],
+                        jt_out,
+                    )
             except Exception as e:
                 raise RuntimeError(f"[step 5b fill-nonpouch-jt] {e}") from e
             try:
                 log.info("[proof-approved] step 6/6 — uploading non-pouch JT")
-                _upload_file_to_monday_column(item_id, jt_out, JOB_TICKET_COLUMN_ID)
+                with _stage("proof_approved", "upload"):
+                    _upload_file_to_monday_column(item_id, jt_out, JOB_TICKET_COLUMN_ID, upload_deadline)
                 uploaded_jt_paths.append(jt_out)
             except Exception as e:
                 raise RuntimeError(f"[step 6 upload-nonpouch-jt] {e}") from e
             log.info(f"[proof-approved] done — non-pouch JT uploaded for item {item_id}")
 
+        _log_claude_item_usage(item_id)
+
         # Monday.com does not reliably fire column-change webhooks for programmatic
         # file uploads, so we generate prelim labels directly here rather than
         # relying on the JT webhook to pick them up.
         if uploaded_jt_paths:
+            remaining = deadline - time.monotonic()
+            if remaining < PRELIM_LABELS_MIN_S and _defer_followup("prelim-labels", item_id):
+                log.info(f"[proof-approved] {remaining:.0f}s of budget left — prelim labels deferred")
+                return
             log.info(f"[proof-approved] generating prelim labels directly for item {item_id}")
             try:
-                _process_job_ticket(item_id)
+                _process_job_ticket(item_id, deadline)
                 log.info(f"[proof-approved] prelim labels generated for item {item_id}")
             except Exception as e:
                 # Non-fatal: JT was already uploaded; log but don't fail the whole request
@@ -1873,6 +5358,8 @@ def proof_approved_webhook_verify():
 
 
 @app.route("/webhook/proof-approved", methods=["POST"])
+@_profiled_route("proof_approved")
+@_traced_webhook("proof_approved")
 def proof_approved_webhook_handler():
     try:
         body = request.get_json(force=True, silent=True) or {}
@@ -1880,6 +5367,12 @@ def proof_approved_webhook_handler():
         if "challenge" in body:
             return jsonify({"challenge": body["challenge"]})
 
+        if request.args.get("followup") == "error-update":
+            if not _followup_authorized(request.headers.get("X-Followup-Secret")):
+                return jsonify({"status": "forbidden"}), 403
+            _post_monday_error_update(int(body["item_id"]), body.get("message", ""))
+            return jsonify({"status": "ok"}), 200
+
         event = body.get("event", body)
         item_id = event.get("pulseId") or event.get("itemId") or event.get("item_id")
         column_id = event.get("columnId") or event.get("column_id")
@@ -1889,6 +5382,18 @@ def proof_approved_webhook_handler():
         if not item_id:
             return jsonify({"status": "ignored", "reason": "no item_id"}), 200
 
+        if request.args.get("prefetch"):
+            # Earlier proof status / PI# changes: extract the invoice specs ahead of approval
+            if column_id and column_id not in (PROOF_STATUS_COLUMN_ID, ITEM_PI_COLUMN_ID):
+                return jsonify({"status": "ignored", "reason": "wrong column"}), 200
+            if _is_proof_approved_event(event):
+                return jsonify({"status": "ignored", "reason": "approved"}), 200
+            try:
+                return jsonify({"status": "ok", "prefetch": _prefetch_invoice_specs(int(item_id))}), 200
+            except Exception as exc:
+                log.warning(f"[prefetch] item {item_id} failed: {exc}")
+                return jsonify({"status": "error", "message": str(exc)}), 200
+
         if column_id and column_id != PROOF_STATUS_COLUMN_ID:
             return jsonify({"status": "ignored", "reason": "wrong column"}), 200
 
@@ -1903,3 +5408,10 @@ def proof_approved_webhook_handler():
     except Exception as exc:
         log.exception(f"[proof-approved] unexpected error: {exc}")
         return jsonify({"status": "error", "message": str(exc)}), 200
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5001))
+    warm_jt_templates()
+    log.info(f"Starting server on port {port}")
+    app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,98 @@
+"""
+Benchmark label rendering on a synthetic order (no Monday.com, no webhook).
+Prints time and size per label for each barcode mode, so the overhead of
+GS1-128 / QR carton barcodes is visible next to plain labels, plus a plain run
+with the output size optimisations off (LABEL_PDF_OPTIMIZE=0) for reference.
+The size target is 3x smaller than drawing every label in full, which took
+~71 bytes/label on OL5350 sheets: 500 labels over 10 descriptions should stay
+under ~23.7 bytes/label for plain labels ("vs unopt." compares against the
+current drawing code, which already shares forms).
+
+Usage:
+  python bench_labels.py
+  python bench_labels.py --labels 5000 --descriptions 20 --sheet OL875
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import app
+from app import build_labels_pdf
+
+# (label, barcode, optimise)
+BENCH_MODES = (
+    ("unoptimised", "", False),
+    ("none", "", True),
+    ("gs1-128", "gs1-128", True),
+    ("qr", "qr", True),
+)
+
+
+def synthetic_order(labels, descriptions):
+    """Grouped items like group_line_items returns, `labels` cartons in total."""
+    per_desc, extra = divmod(labels, descriptions)
+    grouped = []
+    for i in range(descriptions):
+        cartons = per_desc + (1 if i < extra else 0)
+        if not cartons:
+            continue
+        groups = [{"qty": 400, "count": cartons - 1}] if cartons > 1 else []
+        groups.append({"qty": 260, "count": 1})
+        grouped.append({
+            "description": f"Assorted Candy SKU {i:03d} 12ct display box, mixed flavors",
+            "total_cartons": cartons,
+            "carton_groups": groups,
+        })
+    return grouped
+
+
+def bench(grouped, sheet, barcode, optimize, repeat):
+    """Best-of-`repeat` serial render time (s) and output size (bytes)."""
+    best = None
+    app.LABEL_PDF_OPTIMIZE = optimize
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "labels.pdf"
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            build_labels_pdf("Bench Customer", "PO-12345", grouped, out,
+                             parallel=False, sheet_format=sheet, barcode=barcode)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        return best, os.path.getsize(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shipping label rendering")
+    parser.add_argument("--labels", type=int, default=1000, help="Cartons (labels) in the order")
+    parser.add_argument("--descriptions", type=int, default=10, help="Distinct descriptions")
+    parser.add_argument("--sheet", default=None, help="Label sheet format (default LABEL_SHEET_FORMAT)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode; the best is reported")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    grouped = synthetic_order(args.labels, args.descriptions)
+
+    print(f"{args.labels} labels, {args.descriptions} descriptions, best of {args.repeat}")
+    print(f"{'barcode':<13}{'total s':>10}{'ms/label':>10}{'overhead':>10}"
+          f"{'bytes/label':>13}{'vs unopt.':>11}")
+    base_ms = base_size = None
+    for label, barcode, optimize in BENCH_MODES:
+        seconds, size = bench(grouped, args.sheet, barcode, optimize, args.repeat)
+        per_label = seconds / args.labels * 1000
+        if base_size is None:
+            base_size = size
+        elif base_ms is None:
+            base_ms = per_label     # barcode overhead is relative to plain optimised labels
+        print(
+            f"{label:<13}{seconds:>10.3f}{per_label:>10.3f}"
+            f"{per_label - (base_ms or per_label):>+10.3f}{size / args.labels:>13.1f}"
+            f"{base_size / size:>10.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Rebuild the Job Ticket template manifests ("<template>.manifest.json" next to
+each PDF in "Job Ticket Templates/"). Run after replacing a template and commit
+the JSON with it: the app rebuilds a stale manifest on load as well, but can't
+write it back on a read-only deploy, so it would redo the work on every cold start.
+
+Usage:
+  python build_jt_manifests.py
+"""
+
+import logging
+
+import app
+
+
+def main():
+    logging.disable(logging.INFO)
+    for path in app.JT_TEMPLATE_PATHS:
+        manifest = app.write_jt_manifest(path)
+        overflow = app._jt_overflow_rows(manifest)
+        print(
+            f"{path.name}: {manifest['pages']} pages, {len(manifest['fields'])} fields, "
+            f"{len(manifest['rows']) - len(overflow)} + {len(overflow)} overflow rows"
+        )
+
+
+if __name__ == "__main__":
+    main()
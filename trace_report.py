@@ -0,0 +1,132 @@
+"""
+Summarise the trace spans written with TRACE_FILE (JSON lines, one span per
+line; "[trace] {…}" log lines from TRACE_FILE=- are read too, so a downloaded
+Vercel log works as input). Prints each trace as an indented span tree, or with
+--folded as collapsed stacks ("root;child;leaf self_ms") for flame-graph tools
+such as flamegraph.pl or speedscope.
+
+Usage:
+  python trace_report.py traces.jsonl
+  python trace_report.py traces.jsonl --trace 3f2a… --min-ms 5
+  python trace_report.py traces.jsonl --folded > stacks.txt
+"""
+
+import argparse
+import collections
+import json
+import sys
+
+# Attributes shown next to a span in the tree, when present
+TREE_ATTRS = ("item_id", "operation", "file", "bytes", "model", "input_tokens",
+              "output_tokens", "queued_ms", "status")
+
+
+def read_spans(lines):
+    """Span dicts from JSON lines, skipping anything before the first "{" on a line."""
+    spans = []
+    for line in lines:
+        start = line.find("{")
+        if start < 0:
+            continue
+        try:
+            span = json.loads(line[start:])
+        except ValueError:
+            continue
+        if "span_id" in span and "trace_id" in span:
+            spans.append(span)
+    return spans
+
+
+def build_traces(spans):
+    """{trace_id: (roots, children)} where children maps span_id → child spans by start."""
+    traces = {}
+    for trace_id, group in _group(spans, "trace_id").items():
+        ids = {s["span_id"] for s in group}
+        children = collections.defaultdict(list)
+        roots = []
+        for span in sorted(group, key=lambda s: s["start"]):
+            if span.get("parent_id") in ids:
+                children[span["parent_id"]].append(span)
+            else:
+                roots.append(span)
+        traces[trace_id] = (roots, children)
+    return traces
+
+
+def _group(spans, key):
+    groups = collections.defaultdict(list)
+    for span in spans:
+        groups[span[key]].append(span)
+    return groups
+
+
+def print_tree(trace_id, roots, children, min_ms, out):
+    total = sum(r["duration_ms"] for r in roots)
+    print(f"trace {trace_id}  {total:.0f} ms", file=out)
+
+    def walk(span, depth, t0):
+        if span["duration_ms"] < min_ms:
+            return
+        attrs = " ".join(
+            f"{k}={span['attrs'][k]}" for k in TREE_ATTRS if k in span.get("attrs", {})
+        )
+        flag = " ERROR " + span.get("error", "") if span.get("status") == "error" else ""
+        print(
+            f"  {(span['start'] - t0) * 1000:>8.0f} {span['duration_ms']:>9.1f} ms  "
+            f"{'  ' * depth}{span['name']}  [{span.get('thread', '')}] {attrs}{flag}",
+            file=out,
+        )
+        for child in children.get(span["span_id"], ()):
+            walk(child, depth + 1, t0)
+
+    for root in roots:
+        walk(root, 0, root["start"])
+    print(file=out)
+
+
+def folded_stacks(roots, children):
+    """(stack, self_ms) pairs; self time is a span's duration minus its children's."""
+    def walk(span, prefix):
+        stack = f"{prefix};{span['name']}" if prefix else span["name"]
+        kids = children.get(span["span_id"], ())
+        yield stack, max(span["duration_ms"] - sum(k["duration_ms"] for k in kids), 0.0)
+        for kid in kids:
+            yield from walk(kid, stack)
+
+    for root in roots:
+        yield from walk(root, "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise TRACE_FILE spans")
+    parser.add_argument("path", nargs="?", default="-", help="Span file (default: stdin)")
+    parser.add_argument("--trace", help="Only traces whose id starts with this")
+    parser.add_argument("--min-ms", type=float, default=0.0, help="Hide spans shorter than this")
+    parser.add_argument("--folded", action="store_true", help="Collapsed stacks for flame graphs")
+    args = parser.parse_args()
+
+    if args.path == "-":
+        spans = read_spans(sys.stdin)
+    else:
+        with open(args.path, encoding="utf-8") as f:
+            spans = read_spans(f)
+
+    traces = build_traces(spans)
+    if args.trace:
+        traces = {t: v for t, v in traces.items() if t.startswith(args.trace)}
+
+    if args.folded:
+        totals = collections.Counter()
+        for roots, children in traces.values():
+            for stack, self_ms in folded_stacks(roots, children):
+                totals[stack] += self_ms
+        for stack, self_ms in sorted(totals.items()):
+            print(f"{stack} {round(self_ms)}")
+        return
+
+    for trace_id, (roots, children) in sorted(traces.items(), key=lambda t: t[1][0][0]["start"]):
+        print_tree(trace_id, roots, children, args.min_ms, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()